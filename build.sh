@@ -9,4 +9,12 @@ pip install -r requirements.txt
 # Download spaCy English language model
 python -m spacy download en_core_web_sm
 
+# Sentiment dimension embeddings (data/sentiment/sentiment_intents.npy). A no-op when the committed
+# artifact is current (.github/workflows/sentiment_artifacts.yml keeps it so); otherwise it needs
+# GEMINI_API_KEY, and a failure fails the build rather than deploying without the artifact.
+python scripts/build_sentiment_embeddings.py --if-stale
+
+# Sentiment lexicon (data/sentiment/sentiment_lexicon.json), committed and checked the same way.
+python scripts/build_sentiment_lexicon.py --if-stale
+
 echo "Build completed successfully"
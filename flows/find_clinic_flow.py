@@ -2,7 +2,6 @@ import json
 import string
 import re
 import numpy as np
-import spacy
 import google.generativeai as genai
 from difflib import SequenceMatcher
 from urllib.parse import urlencode
@@ -10,42 +9,28 @@ from pydantic import BaseModel, Field
 from enum import Enum
 from typing import Optional, List, Tuple, Dict
 from .utils import derive_clinic_tags
+from . import message_features, response_renderer
+from .sentiment_lexicon import SENTIMENT_INTENTS, SentimentScorer, load_dimension_embeddings
+from services.deadline import EXTRACTION_SLICE, record_degradation, request_options
+from services.embedding_cache import embed
 
 # --- Sentiment-Based Ranking Configuration ---
 EMBEDDING_MODEL_NAME = "models/text-embedding-004"
 
-# Pre-defined sentiment intent descriptions (loaded once at module import)
-SENTIMENT_INTENTS = {
-    'sentiment_dentist_skill': "skilled expert experienced competent professional qualified knowledgeable skilful skillful proficient adept accomplished talented masterful capable",
-    'sentiment_pain_management': "gentle painless comfortable soft tender loving light touch no pain minimal discomfort",
-    'sentiment_cost_value': "affordable cheap budget value economical reasonable worth good deal cost-effective",
-    'sentiment_staff_service': "friendly helpful polite courteous kind welcoming attentive nice staff",
-    'sentiment_ambiance_cleanliness': "clean hygienic modern nice pleasant spotless tidy well-maintained",
-    'sentiment_convenience': "convenient quick fast easy accessible short wait time nearby close"
-}
-
-# Pre-compute embeddings for each sentiment dimension (done once at module load)
-SENTIMENT_EMBEDDINGS = {}
-try:
-    for field, text in SENTIMENT_INTENTS.items():
-        response = genai.embed_content(
-            model=EMBEDDING_MODEL_NAME,
-            content=text,
-            task_type="retrieval_query"
-        )
-        SENTIMENT_EMBEDDINGS[field] = response['embedding']
-    print(f"[SENTIMENT INIT] Loaded {len(SENTIMENT_EMBEDDINGS)} sentiment embeddings")
-except Exception as e:
-    print(f"[SENTIMENT INIT] Failed to preload embeddings: {e}")
-    SENTIMENT_EMBEDDINGS = {}
-
-# Load spaCy model for adjective extraction
-try:
-    nlp = spacy.load("en_core_web_sm")
-    print("[SENTIMENT INIT] Loaded spaCy model for adjective extraction")
-except OSError:
-    print("[SENTIMENT INIT] WARNING: spaCy model not found - run 'python -m spacy download en_core_web_sm'")
-    nlp = None
+# Sentiment dimension vectors from the offline artifact (scripts/build_sentiment_embeddings.py); any
+# stale or missing dimension is embedded in the background by main.py (run_sentiment_refresh_loop)
+SENTIMENT_EMBEDDINGS = load_dimension_embeddings(SENTIMENT_INTENTS)
+
+# Offline adjective lexicon + vectorized scoring for out-of-vocabulary words (flows/sentiment_lexicon.py)
+SENTIMENT_SCORER = SentimentScorer.load(list(SENTIMENT_INTENTS), SENTIMENT_EMBEDDINGS)
+
+
+def embed_sentiment_text(text: str):
+    # Same model and task type as the artifact; vectors land in the embedding cache
+    return embed(text, EMBEDDING_MODEL_NAME, task_type="retrieval_query")
+
+# Brand special-case: "Q & M", "Q&M", "Q and M"
+QM_BRAND_RE = re.compile(r"\bq\s*(?:&|and|\&)\s*m\b")
 
 # --- Pydantic Models required for this flow ---
 class ServiceEnum(str, Enum):
@@ -60,57 +45,9 @@ def extract_quality_adjectives(user_message: str) -> List[str]:
     """
     Extract quality adjectives/adverbs from user query using NLP.
     Filters out filler words, locations, treatments (handled elsewhere).
+    Computed once per message by flows/message_features.py (spaCy is loaded lazily there).
     """
-    if not nlp:
-        print("[SENTIMENT] spaCy not loaded - cannot extract adjectives")
-        return []
-    
-    try:
-        message_lower = user_message.lower()
-        
-        # STEP 1: Extract compound adjectives BEFORE spaCy tokenization
-        # These get split by spaCy's tokenizer (cost-effective → cost + effective)
-        compound_adjectives = [
-            'cost-effective', 'high-quality', 'well-trained', 'well-equipped',
-            'state-of-the-art', 'top-rated', 'highly-skilled', 'family-friendly',
-            'budget-friendly', 'time-saving', 'pain-free', 'long-lasting'
-        ]
-        quality_words = []
-        for compound in compound_adjectives:
-            if compound in message_lower:
-                # Map compound to its core meaning for embedding
-                # "cost-effective" → "affordable" for better matching
-                if compound == 'cost-effective':
-                    quality_words.append('affordable')
-                elif compound in ['high-quality', 'top-rated']:
-                    quality_words.append('skilled')
-                elif compound in ['budget-friendly']:
-                    quality_words.append('affordable')
-                elif compound in ['family-friendly']:
-                    quality_words.append('friendly')
-                elif compound in ['pain-free']:
-                    quality_words.append('painless')
-                else:
-                    # For others, use the compound as-is
-                    quality_words.append(compound)
-        
-        # STEP 2: Extract single-word adjectives using spaCy POS tagging
-        doc = nlp(message_lower)
-        for token in doc:
-            # Include adjectives (gentle, skilled, affordable)
-            if token.pos_ == 'ADJ':
-                # Exclude generic superlatives that don't carry sentiment
-                if token.text not in ['best', 'good', 'better', 'top', 'great', 'effective', 'most', 'more']:
-                    # Avoid duplicates from compound processing
-                    if token.text not in quality_words:
-                        quality_words.append(token.text)
-        
-        print(f"[SENTIMENT] Extracted quality adjectives: {quality_words}")
-        return quality_words
-        
-    except Exception as e:
-        print(f"[SENTIMENT] Error extracting adjectives: {e}")
-        return []
+    return list(message_features.analyze(user_message).quality_adjectives)
 
 # --- Sentiment Detection Function ---
 def detect_sentiment_intent(user_message: str, threshold=0.60) -> List[str]:
@@ -120,16 +57,17 @@ def detect_sentiment_intent(user_message: str, threshold=0.60) -> List[str]:
     Returns empty list if no strong matches found.
     Threshold lowered to 0.60 to catch borderline matches (friendly: 0.641, skilful: 0.678).
     """
-    if not SENTIMENT_EMBEDDINGS:
-        print("[SENTIMENT] Embeddings not loaded - skipping sentiment detection")
-        return []
-    
     # Extract quality adjectives from query
     quality_words = extract_quality_adjectives(user_message)
     
     if not quality_words:
         print("[SENTIMENT] No quality adjectives found in query")
         return []
+
+    # Until every dimension vector is loaded (artifact or background refresh), only lexicon words score.
+    if not SENTIMENT_SCORER.available:
+        print("[SENTIMENT] Neither lexicon nor embeddings loaded - skipping sentiment detection")
+        return []
     
     detected_fields = []
     
@@ -138,21 +76,11 @@ def detect_sentiment_intent(user_message: str, threshold=0.60) -> List[str]:
         for quality_word in quality_words:
             print(f"[SENTIMENT] Analyzing quality word: '{quality_word}'")
             
-            # Get embedding for this quality word only
-            query_response = genai.embed_content(
-                model=EMBEDDING_MODEL_NAME,
-                content=quality_word,
-                task_type="retrieval_query"
-            )
-            query_embedding = query_response['embedding']
-            
-            # Calculate cosine similarity with each sentiment intent
-            similarities = {}
-            for field, intent_embedding in SENTIMENT_EMBEDDINGS.items():
-                similarity = np.dot(query_embedding, intent_embedding) / (
-                    np.linalg.norm(query_embedding) * np.linalg.norm(intent_embedding)
-                )
-                similarities[field] = similarity
+            # Lexicon lookup, or one embedding scored against every dimension at once
+            similarities = SENTIMENT_SCORER.scores(quality_word, embed_sentiment_text)
+            if not similarities:
+                print(f"[SENTIMENT] ✗ '{quality_word}' not in lexicon and embeddings unavailable")
+                continue
             
             # Find best match for this quality word
             best_field = max(similarities.items(), key=lambda x: x[1])
@@ -178,14 +106,21 @@ def detect_sentiment_intent(user_message: str, threshold=0.60) -> List[str]:
         return []
 
 # --- The main handler function for this flow ---
-def handle_find_clinic(latest_user_message, conversation_history, previous_filters, candidate_clinics, factual_brain_model, ranking_brain_model, embedding_model, generation_model, supabase, RESET_KEYWORDS, session_state: dict = None):
+def handle_find_clinic(latest_user_message, conversation_history, previous_filters, candidate_clinics, factual_brain_model, ranking_brain_model, embedding_model, generation_model, supabase, RESET_KEYWORDS, session_state: dict = None, features: message_features.MessageFeatures = None, extracted_entities: dict = None, token_sink=None, deadline=None):
     """
     Enhanced find clinic flow with early location preference gate.
     - session_state may contain:
         - location_preference: 'jb' | 'sg' | 'all'
         - awaiting_location: bool
+    - extracted_entities: UserIntent fields ({service, township}) already extracted by the fused
+      gatekeeper call (flows/gatekeeper.py); when given, the Factual Brain call is skipped.
+    - token_sink: services.streaming.TokenSink; with the LLM renderer the summary is streamed into it (/chat/stream).
+    - deadline: services.deadline.Deadline for this request. Without enough budget the Factual Brain
+      falls back to the text heuristics and the LLM renderer to the template.
     Returns a dict that may include 'state_update' to be merged into session state by the caller.
     """
+    # One analysis of the message shared with the router (main.py passes its own; analyze() is memoized otherwise)
+    features = features or message_features.analyze(latest_user_message)
     session_state = session_state or {}
     state_update = {}
     location_preference = session_state.get('location_preference')
@@ -202,57 +137,37 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
         """Guard function to prevent DirectLookup from overfiring on non-clinic-name queries."""
         if not message:
             return False
-        lower = message.lower().strip()
-        
+        # Same memoized analysis main.py already ran for this message (flows/message_features.py)
+        rules = message_features.analyze(message).rules
+
         # Block 1: Remember/recall queries
-        remember_indicators = ["remind", "recall", "remember", "what did", "what clinics", "which clinics", 
-                               "you showed", "you recommended", "you suggested", "from before", "from earlier"]
-        if any(k in lower for k in remember_indicators):
+        if "lookup_remember" in rules:
             print(f"[DirectLookup] Skipping - detected remember session intent.")
             return False
         
         # Block 2: Booking queries
-        booking_indicators = ["help me book", "start booking", "make appointment", "schedule", "book an appointment"]
-        if any(k in lower for k in booking_indicators):
+        if "lookup_booking" in rules:
             print(f"[DirectLookup] Skipping - detected booking intent.")
             return False
         
         # Block 3: Location change queries
-        location_change_indicators = ["switch to", "change to", "rather than", "instead of", "prefer", "instead"]
-        if any(k in lower for k in location_change_indicators):
+        if "lookup_location_change" in rules:
             print(f"[DirectLookup] Skipping - detected location change intent.")
             return False
         
         # Block 3B: Quality adjective queries (for sentiment-based ranking)
         # These should pass through to sentiment detection, not DirectLookup
-        quality_adjectives = [
-            "gentle", "painless", "comfortable", "soft", "tender",  # pain_management
-            "skilled", "expert", "experienced", "competent", "professional", "qualified",  # dentist_skill
-            "affordable", "cheap", "budget", "value", "economical", "reasonable", "worth",  # cost_value
-            "friendly", "helpful", "polite", "courteous", "kind", "welcoming", "attentive", "nice",  # staff_service
-            "clean", "hygienic", "modern", "pleasant", "spotless", "tidy",  # ambiance_cleanliness
-            "convenient", "quick", "fast", "easy", "accessible", "nearby", "close"  # convenience
-        ]
-        if any(adj in lower for adj in quality_adjectives):
+        if "quality_adjective" in rules:
             print(f"[DirectLookup] Skipping - detected quality adjective (sentiment query).")
             return False
         
         # Block 4: Service-only queries without clinic name hints (NEW)
         # Prevents 'dental scaling' or 'scaling in JB' from being treated as clinic names
-        service_keywords = ["scaling", "cleaning", "scale", "polish", "root canal", "implant", 
-                   "whitening", "crown", "filling", "braces", "wisdom tooth", "wisdom teeth",
-                   "gum treatment", "veneers", "bonding", "inlay", "onlay", "extraction"]
-        
-        # Clinic name hints that suggest a proper noun
-        clinic_name_hints = [" dental clinic", " clinic", " dental hub", " hub", " dental centre", 
-                            " dental center", " dental surgery", "dr. ", "doctor ", "klinik "]
-        
-        has_service = any(k in lower for k in service_keywords)
-        has_clinic_hint = any(hint in lower for hint in clinic_name_hints)
+        has_service = "lookup_service" in rules
+        has_clinic_hint = "clinic_name_hint" in rules
 
         # Explicitly guard patterns like "find scaling clinics" which previously slipped past
-        find_service_pattern = r"\bfind\b[^.,;!?]*\b(scaling|cleaning|root canal|implant|whitening|crown|filling|braces|wisdom tooth|gum treatment|veneers|bonding|inlay|onlay|extraction)\b[^.,;!?]*\bclinics?"
-        if re.search(find_service_pattern, lower):
+        if "find_service_clinics" in rules:
             print("[DirectLookup] Skipping - detected 'find [service] clinics' pattern.")
             return False
         
@@ -269,16 +184,13 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
                 return False
 
         # Block 5: Explicit "find <service> clinics" phrasing even when clinic hints exist
-        if has_service and "find" in lower and "clinic" in lower:
-            service_pattern = r"find[^\n]{0,80}?(" + "|".join([re.escape(k) for k in service_keywords]) + r")([^\n]{0,80}?clinics?)"
-            if re.search(service_pattern, lower):
-                print(f"[DirectLookup] Skipping - detected 'find [service] clinics' pattern.")
-                return False
+        if "find_service_clinics_near" in rules:
+            print(f"[DirectLookup] Skipping - detected 'find [service] clinics' pattern.")
+            return False
         
         # Block 6: "service + in + location" pattern (NEW FIX)
         # Prevents "root canal in JB", "scaling in Singapore" from being treated as clinic names
-        service_in_location_pattern = r'\b(root canal|scaling|cleaning|braces|implant|dental implant|whitening|crown|filling|veneer|wisdom tooth|extraction|gum treatment)\s+(?:clinic[s]?\s+)?in\s+(jb|johor|singapore|sg|malaysia|my|johor bahru)\b'
-        if re.search(service_in_location_pattern, lower, re.IGNORECASE):
+        if "service_in_location" in rules:
             print(f"[DirectLookup] Guard blocked 'service + in + location' pattern: '{message}'")
             return False
         
@@ -334,7 +246,7 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
                     lower = lower.replace(pat, canon)
 
         # Brand special-case: Q & M brand may lack distinct tokens beyond generic words
-        qm_brand = bool(re.search(r"\bq\s*(?:&|and|\&)\s*m\b", lower))
+        qm_brand = bool(QM_BRAND_RE.search(lower))
 
         # Heuristics: short-ish message or contains explicit name markers
         trigger_keywords = ["clinic", "dental", "centre", "center"]
@@ -613,7 +525,12 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
                 return country
         return None
     try:
-        prompt_text = f"""
+        args = None
+        if extracted_entities is not None:
+            args = extracted_entities
+            print("[Factual Brain] Using entities from the fused gatekeeper call - skipping extraction")
+        else:
+            prompt_text = f"""
         You are an expert entity extractor. Your only job is to analyze the user's most recent query and call the `UserIntent` tool.
         If the user uses a pronoun like "them" or "that", look at the previous assistant message to understand what it refers to.
         If you find a specific dental service and/or a location, extract them.
@@ -625,23 +542,25 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
 
         Extract entities from the LATEST user query: "{latest_user_message}"
         """
-        factual_response = factual_brain_model.generate_content(prompt_text, tools=[UserIntent])
-        if factual_response.candidates and factual_response.candidates[0].content.parts:
-            function_call = factual_response.candidates[0].content.parts[0].function_call
-            if function_call and function_call.args:
-                args = function_call.args
-                if args.get('service'):
-                    # Multi-service stacking: merge with previous filters if present
-                    extracted = args.get('service')
-                    prior_services = []
-                    if isinstance(previous_filters, dict) and 'services' in previous_filters and isinstance(previous_filters['services'], list):
-                        prior_services = previous_filters['services']
-                    merged = list(dict.fromkeys([*(prior_services or []), extracted]))  # de-duplicate preserving order
-                    current_filters['services'] = merged
-                if args.get('township'): current_filters['township'] = args.get('township')
+            factual_response = factual_brain_model.generate_content(prompt_text, tools=[UserIntent], **request_options(deadline, EXTRACTION_SLICE))
+            if factual_response.candidates and factual_response.candidates[0].content.parts:
+                function_call = factual_response.candidates[0].content.parts[0].function_call
+                if function_call and function_call.args:
+                    args = function_call.args
+        if args:
+            if args.get('service'):
+                # Multi-service stacking: merge with previous filters if present
+                extracted = args.get('service')
+                prior_services = []
+                if isinstance(previous_filters, dict) and 'services' in previous_filters and isinstance(previous_filters['services'], list):
+                    prior_services = previous_filters['services']
+                merged = list(dict.fromkeys([*(prior_services or []), extracted]))  # de-duplicate preserving order
+                current_filters['services'] = merged
+            if args.get('township'): current_filters['township'] = args.get('township')
         print(f"Factual Brain extracted: {current_filters}")
     except Exception as e:
         print(f"Factual Brain Error: {e}")
+        record_degradation("factual_brain")
 
     # NEW: Preserve location from previous filters if not explicitly changed
     # Prevents location reset when user only changes treatment (e.g., "Actually I need braces")
@@ -658,39 +577,13 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
 
     # Deterministic fallback for service extraction when LLM misses or is inconsistent
     def heuristic_service_from_text(text: str) -> Optional[str]:
-        t = (text or '').lower()
-        # Prefer specific procedures before general cleaning/scaling
-        patterns = [
-            (['root canal', 'endodontic'], 'root_canal'),
-            (['implant', 'dental implant'], 'dental_implant'),
-            (['crown', 'cap'], 'dental_crown'),
-            (['filling', 'tooth filling'], 'tooth_filling'),
-            (['whitening', 'bleaching'], 'teeth_whitening'),
-            (['braces', 'orthodontic'], 'braces'),
-            (['wisdom tooth', 'wisdom extraction'], 'wisdom_tooth'),
-            (['gum', 'periodontal'], 'gum_treatment'),
-            (['veneers'], 'veneers'),
-            (['cleaning', 'polish', 'scale', 'scaling'], 'scaling'),
-        ]
-        for keys, svc in patterns:
-            if any(k in t for k in keys):
-                return svc
-        return None
+        # Prefers specific procedures before general cleaning/scaling (see message_features.SERVICE_HEURISTICS)
+        return message_features.analyze(text or '').service
 
     # Minimal township heuristics (helps when LLM misses simple "in/near X" phrases)
     def heuristic_township_from_text(text: str) -> Optional[str]:
-        t = (text or '').lower()
         # very simple patterns; we only use as a fallback when LLM returns nothing
-        for kw in [' near ', ' in ']:
-            if kw in t:
-                # take up to 3 tokens after the keyword as a loose area name guess
-                tail = t.split(kw, 1)[1].strip()
-                tokens = [tok.strip(string.punctuation) for tok in tail.split()]
-                guess = " ".join(tokens[:3]).strip()
-                # avoid capturing country words or empty
-                if guess and guess not in { 'singapore', 'sg', 'johor', 'jb', 'johor bahru' }:
-                    return guess
-        return None
+        return message_features.analyze(text or '').township_hint
 
     # If no service extracted, or extracted one conflicts with an obvious heuristic match, prefer heuristic
     heuristic_svc = heuristic_service_from_text(latest_user_message)
@@ -745,15 +638,15 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
     # --- LOCATION PREFERENCE GATE ---
     # 1) Try to infer from current message if awaiting or missing
     def infer_location_from_text(text: str) -> Optional[str]:
-        t = (text or '').lower()
-        if any(k in t for k in ['both', 'all']):
+        rules = message_features.analyze(text or '').rules
+        if "flow_location_all" in rules:
             return 'all'
-        if any(k in t for k in ['singapore', 'sg']):
+        if "flow_location_sg" in rules:
             return 'sg'
-        if any(k in t for k in ['johor bahru', 'johor', 'jb']):
+        if "flow_location_jb" in rules:
             return 'jb'
         # Infer from township keywords present in free text
-        mapped = detect_country_from_township(t)
+        mapped = detect_country_from_township(text)
         if mapped:
             return mapped
         return None
@@ -761,11 +654,7 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
     inferred = infer_location_from_text(latest_user_message)
     
     # Detect explicit location change requests
-    message_lower = latest_user_message.lower()
-    location_change_triggers = [
-        "switch to", "change to", "show me", "see", "instead", "rather", "prefer"
-    ]
-    wants_location_change = any(trigger in message_lower for trigger in location_change_triggers) and inferred and inferred != location_preference
+    wants_location_change = features.has("flow_location_change") and inferred and inferred != location_preference
     
     if inferred and (awaiting_location or not location_preference or wants_location_change):
         location_preference = inferred
@@ -777,8 +666,7 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
             print(f"[LOCATION] Inferred and set location_preference to: {inferred}")
 
     # --- SEARCH INTENT & LOCATION PROMPT TIMING ---
-    search_trigger_keywords = ["clinic", "dentist", "recommend", "find", "looking", "search"]
-    search_intent_detected = any(k in message_lower for k in search_trigger_keywords) or ('services' in current_filters)
+    search_intent_detected = features.has("flow_search") or ('services' in current_filters)
 
     # 2) Only prompt for location once search intent is present
     if not location_preference and search_intent_detected:
@@ -872,16 +760,8 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
     # Use word-boundary patterns to distinguish price queries from quality adjectives
     # "how much cost" → PRICE QUERY ✓
     # "cost-effective" → QUALITY QUERY (sentiment) ✗
-    cost_price_patterns = [
-        r"\bhow much\b",
-        r"\bprice\b",
-        r"\bcost\s+(of|for|is|are)\b",  # "cost of", "cost for scaling"
-        r"\bexpensive\b",
-        r"\bcheaper\b"
-    ]
-    comparison_keywords = ["compare", "vs", "versus", "difference", "jb or sg", "sg or jb"]
-    wants_cost = any(re.search(pattern, message_lower) for pattern in cost_price_patterns)
-    wants_comparison = any(k in message_lower for k in comparison_keywords)
+    wants_cost = features.has("cost_price")
+    wants_comparison = features.has("comparison")
 
     procedures_reference: Dict[str, Dict[str, str]] = {
         'dental cleaning': {'sg': '80 - 120', 'jb': '25 - 40'},
@@ -1096,41 +976,27 @@ def handle_find_clinic(latest_user_message, conversation_history, previous_filte
         print("DEBUG: No top clinics found, returning early.")
         return {"response": "I'm sorry, I couldn't find any clinics that match your specific criteria. Would you like to try a different search?", "applied_filters": final_filters, "candidate_pool": [], "booking_context": {}}
 
-    context = json.dumps([{"position": i + 1, **{k: clinic.get(k) for k in ['name', 'address', 'rating', 'reviews', 'website_url', 'operating_hours']}} for i, clinic in enumerate(top_clinics)], indent=2)
- 
-    augmented_prompt = (
-        'You are a Data Formatter. Your only job is to take the following JSON data and format it into a friendly, conversational, and easy-to-read summary for a user. '
-        f'Present the top 3 clinics clearly. Start with this explanation: "{ranking_note}" '
-        'CRITICAL: Never mention or display sentiment scores, aspect scores, or any numeric ratings other than the overall Google rating and review count. '
-        'Do not output raw JSON. **Data:**\n```json\n' + context + '\n```'
+    # Reply text: deterministic template by default, the LLM Data Formatter when CLINIC_RESPONSE_RENDERER=llm
+    render_ctx = response_renderer.RenderContext(
+        top_clinics=top_clinics,
+        ranking_note=ranking_note,
+        location_preference=location_preference,
+        services=final_filters.get('services') or [],
+        generation_model=generation_model,
+        token_sink=token_sink,
+        deadline=deadline,
     )
-
-    
-    response_text = ""
     try:
-        ai_response = generation_model.generate_content(augmented_prompt)
-        response_text = ai_response.text
-        
-        if not response_text or not response_text.strip():
-             raise ValueError("AI returned an empty response.")
-
+        response_text = response_renderer.get_renderer()(render_ctx)
     except Exception as e:
-        print(f"CRITICAL FALLBACK: Data Formatter AI failed. Reason: {e}. Providing a manual fallback response.")
-        
-        fallback_list = []
-        for clinic in top_clinics:
-            fallback_list.append(f"- **{clinic.get('name')}** (Rating: {clinic.get('rating')}, Reviews: {clinic.get('reviews')})")
-        
-        response_text = (
-            f"{ranking_note}\n\n"
-            + "I found a few highly-rated clinics for you:\n" + "\n".join(fallback_list)
-            + "\n\nWould you like to book an appointment at one of these locations?"
-        )
+        print(f"CRITICAL FALLBACK: Data Formatter AI failed. Reason: {e}. Providing a template response.")
+        record_degradation("data_formatter")
+        response_text = response_renderer.render_template(render_ctx)
 
     # --- PERFORMANCE OPTIMIZATION: Remove large embedding vectors and unused fields ---
     # Define minimal fields needed by frontend (reduces payload from 50-200KB to 5-15KB)
     MINIMAL_CLINIC_FIELDS = [
-        'name', 'address', 'rating', 'reviews', 
+        'id', 'name', 'address', 'rating', 'reviews', 
         'operating_hours', 'website_url', 'country', 
         'township', 'phone', 'distance'
     ]
@@ -0,0 +1,375 @@
+# flows/gatekeeper.py
+#
+# Intent gatekeeper for turns the keyword heuristics in main.handle_chat leave undecided.
+#
+# A local TF-IDF + multinomial logistic regression classifier (numpy only, ~1 ms on CPU) runs
+# first. Its weights, temperature and acceptance threshold come from an offline-trained artifact
+# (scripts/train_intent_classifier.py -> data/intent/intent_classifier.json). The threshold is
+# calibrated on held-out data for a target precision, so a prediction at or above it is trusted.
+# Below it, the Gemini gatekeeper_model is consulted as before.
+#
+# INTENT_CLASSIFIER_MODE:
+#   off    - LLM gatekeeper only (previous behaviour)
+#   shadow - LLM decides; the local prediction is logged and agreement is counted (default)
+#   on     - confident local predictions skip the LLM entirely
+#
+# Shadow decisions can be appended to INTENT_SHADOW_LOG (JSONL) and fed back into training.
+#
+# With GATEKEEPER_FUSED_EXTRACTION, the LLM gatekeeper also fills the find_clinic_flow `UserIntent`
+# entities (service, township) in the same structured call; handle_find_clinic then skips its own
+# Factual Brain extraction, saving one Pro round trip on the common search path.
+#
+# Confident LLM decisions are cached (GatekeeperDecisionCache) by normalized message plus a coarse
+# session signature, so repeated ambiguous openers ("hi", "can you help me?") skip the call.
+
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from enum import Enum
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from pydantic import Field
+
+from services.executor import run_blocking
+from services.lru_cache import TTLCache
+
+INTENT_CLASSIFIER_MODE = os.getenv("INTENT_CLASSIFIER_MODE", "shadow").lower()
+INTENT_CLASSIFIER_PATH = os.getenv(
+    "INTENT_CLASSIFIER_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "intent", "intent_classifier.json"),
+)
+INTENT_SHADOW_LOG = os.getenv("INTENT_SHADOW_LOG")  # optional JSONL path
+GATEKEEPER_FUSED_EXTRACTION = os.getenv("GATEKEEPER_FUSED_EXTRACTION", "false").lower() in ("1", "true", "yes", "on")
+GATEKEEPER_CACHE_ENABLED = os.getenv("GATEKEEPER_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+GATEKEEPER_CACHE_MAX_ENTRIES = int(os.getenv("GATEKEEPER_CACHE_MAX_ENTRIES", "2048"))
+GATEKEEPER_CACHE_TTL_SECONDS = float(os.getenv("GATEKEEPER_CACHE_TTL_SECONDS", "3600"))
+# Same bar main.handle_chat uses to accept a gatekeeper decision; anything below is never cached.
+GATEKEEPER_CACHE_MIN_CONFIDENCE = float(os.getenv("GATEKEEPER_CACHE_MIN_CONFIDENCE", "0.7"))
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def featurize(text: str) -> Dict[str, int]:
+    """Term counts: word unigrams, word bigrams and character 3-grams within words (typo tolerance)."""
+    words = _WORD_RE.findall((text or "").lower())
+    counts: Dict[str, int] = {}
+
+    def add(term):
+        counts[term] = counts.get(term, 0) + 1
+
+    for i, word in enumerate(words):
+        add("w:" + word)
+        if i:
+            add("b:" + words[i - 1] + " " + word)
+        padded = f"<{word}>"
+        for j in range(len(padded) - 2):
+            add("c:" + padded[j:j + 3])
+    if not words:
+        add("w:<empty>")
+    return counts
+
+
+@dataclass
+class IntentPrediction:
+    intent: str
+    confidence: float
+    accepted: bool  # confidence >= calibrated threshold
+
+
+class IntentClassifier:
+    def __init__(self, labels: List[str], vocab: Dict[str, int], idf: np.ndarray, weights: np.ndarray,
+                 bias: np.ndarray, temperature: float = 1.0, threshold: float = 1.0, version: str = ""):
+        self.labels = labels
+        self.vocab = vocab
+        self.idf = idf
+        self.weights = weights  # (n_features, n_labels)
+        self.bias = bias
+        self.temperature = temperature
+        self.threshold = threshold
+        self.version = version
+
+    def vectorize(self, text: str):
+        """Sparse L2-normalised sublinear TF-IDF as (indices, values)."""
+        idx, vals = [], []
+        for term, count in featurize(text).items():
+            col = self.vocab.get(term)
+            if col is not None:
+                idx.append(col)
+                vals.append((1.0 + math.log(count)) * self.idf[col])
+        vals = np.asarray(vals, dtype=np.float64)
+        norm = np.linalg.norm(vals)
+        return np.asarray(idx, dtype=np.int64), (vals / norm if norm else vals)
+
+    def probabilities(self, text: str) -> np.ndarray:
+        idx, vals = self.vectorize(text)
+        logits = (vals @ self.weights[idx] if len(idx) else np.zeros(len(self.labels))) + self.bias
+        logits = logits / self.temperature
+        logits -= logits.max()
+        exp = np.exp(logits)
+        return exp / exp.sum()
+
+    def predict(self, text: str) -> IntentPrediction:
+        probs = self.probabilities(text)
+        best = int(probs.argmax())
+        confidence = float(probs[best])
+        return IntentPrediction(self.labels[best], confidence, confidence >= self.threshold)
+
+    def to_dict(self) -> dict:
+        terms = sorted(self.vocab, key=self.vocab.get)
+        return {
+            "version": self.version,
+            "labels": self.labels,
+            "terms": terms,
+            "idf": [round(float(v), 5) for v in self.idf],
+            "weights": [[round(float(w), 5) for w in row] for row in self.weights],
+            "bias": [round(float(b), 5) for b in self.bias],
+            "temperature": self.temperature,
+            "threshold": self.threshold,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IntentClassifier":
+        return cls(
+            labels=data["labels"],
+            vocab={term: i for i, term in enumerate(data["terms"])},
+            idf=np.asarray(data["idf"], dtype=np.float64),
+            weights=np.asarray(data["weights"], dtype=np.float64),
+            bias=np.asarray(data["bias"], dtype=np.float64),
+            temperature=float(data.get("temperature", 1.0)),
+            threshold=float(data.get("threshold", 1.0)),
+            version=data.get("version", ""),
+        )
+
+    @classmethod
+    def load(cls, path: str = INTENT_CLASSIFIER_PATH) -> Optional["IntentClassifier"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                classifier = cls.from_dict(json.load(f))
+            print(f"[INTENT] Loaded local classifier {classifier.version} "
+                  f"({len(classifier.vocab)} features, threshold={classifier.threshold:.2f})", flush=True)
+            return classifier
+        except FileNotFoundError:
+            logging.warning(f"[INTENT] No classifier artifact at {path}; LLM gatekeeper only")
+        except Exception as e:
+            logging.error(f"[INTENT] Failed to load classifier artifact {path}: {e}")
+        return None
+
+
+class GatekeeperStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"local_predictions": 0, "local_accepted": 0, "llm_calls": 0, "llm_errors": 0,
+                         "shadow_compared": 0, "shadow_agree": 0}
+        self.disagreements: Dict[str, int] = {}  # "local->llm" -> count
+
+    def count(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def record_shadow(self, local: IntentPrediction, llm_intent: str):
+        with self._lock:
+            self.counters["shadow_compared"] += 1
+            if local.intent == llm_intent:
+                self.counters["shadow_agree"] += 1
+            else:
+                key = f"{local.intent}->{llm_intent}"
+                self.disagreements[key] = self.disagreements.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            compared = self.counters["shadow_compared"]
+            return {
+                **self.counters,
+                "shadow_agreement": round(self.counters["shadow_agree"] / compared, 4) if compared else None,
+                "shadow_disagreements": dict(self.disagreements),
+            }
+
+
+def state_signature(state: Optional[dict]) -> Tuple:
+    """Coarse session shape the gatekeeper decision depends on: booking status, candidate pool, location."""
+    state = state or {}
+    return (
+        (state.get("booking_context") or {}).get("status"),
+        bool(state.get("candidate_pool")),
+        state.get("location_preference"),
+    )
+
+
+class GatekeeperDecisionCache:
+    """LRU+TTL cache of confident LLM gatekeeper decisions ({"intent", "confidence"}).
+
+    Keyed by the normalized latest message and state_signature(). Saved latency is estimated from
+    a running average of real gatekeeper call durations reported via record_call().
+    """
+
+    def __init__(self, max_entries: int = GATEKEEPER_CACHE_MAX_ENTRIES, ttl_seconds: float = GATEKEEPER_CACHE_TTL_SECONDS,
+                 min_confidence: float = GATEKEEPER_CACHE_MIN_CONFIDENCE, enabled: bool = GATEKEEPER_CACHE_ENABLED,
+                 clock=None):
+        self.enabled = enabled
+        self.min_confidence = min_confidence
+        kwargs = {"clock": clock} if clock else {}
+        self._cache = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds, **kwargs)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.call_seconds = 0.0
+        self.saved_seconds = 0.0
+        self.low_confidence_skipped = 0
+
+    @staticmethod
+    def key(message: str, state: Optional[dict]) -> Tuple:
+        normalized = _SPACE_RE.sub(" ", (message or "").lower()).strip().rstrip("?!. ")
+        return (normalized,) + state_signature(state)
+
+    def contains(self, message: str, state: Optional[dict]) -> bool:
+        """True if get() would hit; does not count as a lookup."""
+        return self.enabled and self._cache.peek(self.key(message, state)) is not None
+
+    def get(self, message: str, state: Optional[dict]) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        decision = self._cache.get(self.key(message, state))
+        if decision is not None:
+            with self._lock:
+                if self.calls:
+                    self.saved_seconds += self.call_seconds / self.calls
+            return dict(decision)
+        return None
+
+    def put(self, message: str, state: Optional[dict], decision: dict) -> bool:
+        if not self.enabled:
+            return False
+        if not decision.get("intent") or (decision.get("confidence") or 0) < self.min_confidence:
+            with self._lock:
+                self.low_confidence_skipped += 1
+            return False
+        return self._cache.set(self.key(message, state),
+                               {"intent": decision["intent"], "confidence": decision["confidence"]})
+
+    def record_call(self, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.call_seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            extra = {
+                "llm_calls_timed": self.calls,
+                "avg_llm_seconds": round(self.call_seconds / self.calls, 3) if self.calls else None,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "low_confidence_skipped": self.low_confidence_skipped,
+            }
+        return {"enabled": self.enabled, **self._cache.stats(), **extra}
+
+
+_shadow_log_lock = threading.Lock()
+
+
+def append_shadow_log(text: str, local: IntentPrediction, llm_intent: Optional[str], llm_confidence: float,
+                      path: Optional[str] = INTENT_SHADOW_LOG):
+    """One JSONL record per gatekeeper decision; training input for the next classifier version."""
+    if not path:
+        return
+    record = {"text": text, "local_intent": local.intent, "local_confidence": round(local.confidence, 4),
+              "llm_intent": llm_intent, "llm_confidence": llm_confidence}
+    try:
+        with _shadow_log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+    except OSError as e:
+        logging.error(f"[INTENT] Could not append to shadow log {path}: {e}")
+
+
+async def ask_llm_gatekeeper(gatekeeper_model, history, latest_user_message: str) -> dict:
+    """The Gemini gatekeeper call. Returns {"intent", "confidence"}; raises on API or parse errors."""
+    gate_prompt = f"""
+                You are an intent gatekeeper. Classify the user's latest message into one of:
+                FIND_CLINIC, BOOK_APPOINTMENT, CANCEL_BOOKING, GENERAL_DENTAL_QUESTION, REMEMBER_SESSION, TRAVEL_FAQ, OUT_OF_SCOPE.
+                Return JSON: {{"intent": "...", "confidence": 0.0}}
+                History:
+                {history}
+                Latest: "{latest_user_message}"
+                """
+    resp = await run_blocking(gatekeeper_model.generate_content, gate_prompt)
+    text = (resp.text or "").strip()
+    parsed = json.loads(text) if text.startswith("{") else {}
+    return {"intent": parsed.get("intent"), "confidence": float(parsed.get("confidence", 0))}
+
+
+class GatekeeperIntent(str, Enum):
+    find_clinic = "find_clinic"; book_appointment = "book_appointment"; cancel_booking = "cancel_booking"
+    general_dental_question = "general_dental_question"; remember_session = "remember_session"
+    travel_faq = "travel_faq"; out_of_scope = "out_of_scope"
+
+
+@lru_cache(maxsize=1)
+def fused_decision_tool():
+    """Tool schema for the fused call: intent + confidence on top of find_clinic_flow's UserIntent entities.
+
+    Built lazily so importing this module does not pull in find_clinic_flow (main.py imports both anyway).
+    """
+    from flows.find_clinic_flow import UserIntent
+
+    class GatekeeperDecision(UserIntent):
+        intent: GatekeeperIntent = Field(..., description="The intent of the user's latest message.")
+        confidence: float = Field(..., description="Confidence in the intent, 0.0 to 1.0.")
+
+    return GatekeeperDecision
+
+
+async def ask_llm_gatekeeper_fused(gatekeeper_model, history, latest_user_message: str) -> dict:
+    """Gatekeeper + entity extraction in one tool call.
+
+    Returns {"intent", "confidence", "entities": {"service", "township"}}; raises on API errors or
+    when the model does not call the tool.
+    """
+    gate_prompt = f"""
+                You are an intent gatekeeper and entity extractor. Analyze the user's latest message and call the
+                `GatekeeperDecision` tool exactly once with:
+                - intent: one of find_clinic, book_appointment, cancel_booking, general_dental_question,
+                  remember_session, travel_faq, out_of_scope
+                - confidence: 0.0 to 1.0
+                - service / township: any specific dental service and location mentioned (null if none). If the user
+                  uses a pronoun like "them" or "that", look at the previous assistant message to resolve it.
+                History:
+                {history}
+                Latest: "{latest_user_message}"
+                """
+    resp = await run_blocking(gatekeeper_model.generate_content, gate_prompt, tools=[fused_decision_tool()])
+    parts = resp.candidates[0].content.parts if resp.candidates else []
+    function_call = parts[0].function_call if parts else None
+    if not function_call or not function_call.args:
+        raise ValueError("gatekeeper did not call the GatekeeperDecision tool")
+    args = function_call.args
+    return {
+        "intent": args.get("intent"),
+        "confidence": float(args.get("confidence") or 0),
+        "entities": {"service": args.get("service"), "township": args.get("township")},
+    }
+
+
+async def decide_with_llm(gatekeeper_model, history, latest_user_message: str, state: Optional[dict] = None,
+                          cache: Optional[GatekeeperDecisionCache] = None,
+                          fused: bool = GATEKEEPER_FUSED_EXTRACTION) -> Tuple[dict, bool]:
+    """The LLM gatekeeper behind the decision cache. Returns (decision, served_from_cache).
+
+    Cached decisions carry no entities (those may depend on history), so handle_find_clinic falls
+    back to its own extraction on a cache hit.
+    """
+    if cache is not None:
+        cached = cache.get(latest_user_message, state)
+        if cached is not None:
+            return cached, True
+    started = time.perf_counter()
+    ask = ask_llm_gatekeeper_fused if fused else ask_llm_gatekeeper
+    decision = await ask(gatekeeper_model, history, latest_user_message)
+    if cache is not None:
+        cache.record_call(time.perf_counter() - started)
+        cache.put(latest_user_message, state, decision)
+    return decision, False
@@ -0,0 +1,198 @@
+# flows/message_features.py
+#
+# Everything the router and the flows want to know about the latest user message, computed once.
+# analyze() is memoized per message text, so main.handle_chat and the flows (find_clinic_flow,
+# travel_flow) share one MessageFeatures object per turn instead of each lowercasing, splitting
+# and regex-scanning the message again. All regexes and keyword tables are compiled at import;
+# the spaCy model used for quality adjectives is loaded on first use.
+
+import re
+import string
+import threading
+from functools import cached_property, lru_cache
+from typing import FrozenSet, List, Optional, Tuple
+
+from flows import routing_rules
+from flows.routing_rules import Rule, RuleMatcher
+
+# --- Location tables (normalize_location_terms) ---
+SG_SYNONYMS = {"singapore","sg","s'g","sin","sing","lion city","little red dot","singapura","local","home","here","this island"}
+JB_SYNONYMS = {"johor bahru","johor","jb","j.b.","bahru","malaysia side","across the border","causeway","second link"}
+TOWNSHIP_COUNTRY_MAP = {
+    "jurong": "sg", "jurong east": "sg", "jurong west": "sg", "bedok": "sg", "chinatown": "sg",
+    "toa payoh": "sg", "ang mo kio": "sg", "yishun": "sg", "tampines": "sg", "pasir ris": "sg",
+    "taman molek": "jb", "molek": "jb", "mount austin": "jb", "austin heights": "jb", "taman mount austin": "jb",
+    "tebrau": "jb", "adda heights": "jb", "bukit indah": "jb", "permas jaya": "jb", "skudai": "jb",
+    "taman sutera": "jb", "taman pelangi": "jb", "taman johor jaya": "jb", "taman damansara aliff": "jb",
+}
+_TOWNSHIP_ORDER = {key: i for i, key in enumerate(TOWNSHIP_COUNTRY_MAP)}
+_LOCATION_MATCHER = RuleMatcher((
+    Rule("both", ("both", "all", "compare singapore and jb", "sg and jb", "jb and sg")),
+    Rule("sg", tuple(SG_SYNONYMS)),
+    Rule("jb", tuple(JB_SYNONYMS)),
+    *(Rule(f"township:{key}", (key,)) for key in TOWNSHIP_COUNTRY_MAP),
+))
+
+# --- Ordinals (resolve_ordinal_reference) ---
+# Compound forms ("second one") take priority over bare ordinals so "second one" never resolves via "one".
+_ORDINAL_WORDS = {"first": 0, "second": 1, "third": 2, "fourth": 3, "fifth": 4,
+                  "1st": 0, "2nd": 1, "3rd": 2, "4th": 3, "5th": 4}
+_COMPOUND_ORDINAL_RE = re.compile(r"\b(first|second|third|fourth|fifth)\s+(?:clinic|one|option)\b")
+# Hash forms use lookarounds instead of \b because '#' is not a word character.
+_SIMPLE_ORDINAL_RE = re.compile(r"\b(first|1st|second|2nd|third|3rd|fourth|4th|fifth|5th)\b|(?<!\w)#([1-5])(?!\w)")
+
+# --- Booking (detect_booking_intent) ---
+_BOOKING_SIGNALS = RuleMatcher((
+    Rule("verb", ("book", "schedule", "appointment", "reserve", "arrange", "set up")),
+    Rule("service", ("scaling", "cleaning", "root canal", "implant", "whitening", "crown", "filling", "braces", "wisdom")),
+))
+
+# --- Service heuristic (find_clinic_flow); earlier entries win: specific procedures before cleaning ---
+SERVICE_HEURISTICS = (
+    ("root_canal", ("root canal", "endodontic")),
+    ("dental_implant", ("implant", "dental implant")),
+    ("dental_crown", ("crown", "cap")),
+    ("tooth_filling", ("filling", "tooth filling")),
+    ("teeth_whitening", ("whitening", "bleaching")),
+    ("braces", ("braces", "orthodontic")),
+    ("wisdom_tooth", ("wisdom tooth", "wisdom extraction")),
+    ("gum_treatment", ("gum", "periodontal")),
+    ("veneers", ("veneers",)),
+    ("scaling", ("cleaning", "polish", "scale", "scaling")),
+)
+_SERVICE_MATCHER = RuleMatcher(Rule(svc, keys) for svc, keys in SERVICE_HEURISTICS)
+_COUNTRY_WORDS = {"singapore", "sg", "johor", "jb", "johor bahru"}
+
+# --- Quality adjectives (find_clinic_flow sentiment ranking) ---
+# spaCy splits these, so they are matched on the raw text first and mapped to their core meaning.
+COMPOUND_ADJECTIVES = {
+    "cost-effective": "affordable", "high-quality": "skilled", "well-trained": "well-trained",
+    "well-equipped": "well-equipped", "state-of-the-art": "state-of-the-art", "top-rated": "skilled",
+    "highly-skilled": "highly-skilled", "family-friendly": "friendly", "budget-friendly": "affordable",
+    "time-saving": "time-saving", "pain-free": "painless", "long-lasting": "long-lasting",
+}
+# Generic superlatives that carry no sentiment dimension.
+_NON_QUALITY_ADJECTIVES = {"best", "good", "better", "top", "great", "effective", "most", "more"}
+
+_nlp = None
+_nlp_loaded = False
+_nlp_lock = threading.Lock()
+
+
+def get_nlp():
+    """The spaCy pipeline, loaded on first use (None if the model is not installed)."""
+    global _nlp, _nlp_loaded
+    if not _nlp_loaded:
+        with _nlp_lock:
+            if not _nlp_loaded:
+                try:
+                    import spacy
+                    _nlp = spacy.load("en_core_web_sm")
+                    print("[SENTIMENT INIT] Loaded spaCy model for adjective extraction")
+                except (ImportError, OSError):
+                    print("[SENTIMENT INIT] WARNING: spaCy model not found - run 'python -m spacy download en_core_web_sm'")
+                    _nlp = None
+                _nlp_loaded = True
+    return _nlp
+
+
+class MessageFeatures:
+    """Signals derived from one user message. Cheap fields are computed eagerly, the rest on first access."""
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        self.lower = self.text.lower()
+        self.normalized = self.lower.strip()
+        self.tokens: Tuple[str, ...] = tuple(t for t in (tok.strip(string.punctuation) for tok in self.normalized.split()) if t)
+        # Every shared keyword rule (flows/routing_rules.py) that matched.
+        self.rules: FrozenSet[str] = routing_rules.match(self.normalized)
+
+    def has(self, rule: str) -> bool:
+        return rule in self.rules
+
+    @cached_property
+    def location(self) -> Optional[str]:
+        """'sg', 'jb', 'both' or None, from explicit country words or a known township."""
+        if not self.lower:
+            return None
+        hits = _LOCATION_MATCHER.match(self.lower)
+        for country in ("both", "sg", "jb"):
+            if country in hits:
+                return country
+        townships = [name.split(":", 1)[1] for name in hits if name.startswith("township:")]
+        if townships:
+            return TOWNSHIP_COUNTRY_MAP[min(townships, key=_TOWNSHIP_ORDER.__getitem__)]
+        return None
+
+    @cached_property
+    def ordinals(self) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """(compound, simple) 0-based positions mentioned, each sorted ascending."""
+        compound = sorted({_ORDINAL_WORDS[m.group(1)] for m in _COMPOUND_ORDINAL_RE.finditer(self.normalized)})
+        simple = set()
+        for m in _SIMPLE_ORDINAL_RE.finditer(self.normalized):
+            simple.add(_ORDINAL_WORDS[m.group(1)] if m.group(1) else int(m.group(2)) - 1)
+        return tuple(compound), tuple(sorted(simple))
+
+    def ordinal_index(self, pool_size: int) -> Optional[int]:
+        """Position referenced ("the second one", "#3") within a list of `pool_size` items, or None."""
+        for group in self.ordinals:
+            for index in group:
+                if index < pool_size:
+                    return index
+        return None
+
+    @cached_property
+    def booking_signals(self) -> FrozenSet[str]:
+        """{'verb', 'service'} subset for detect_booking_intent."""
+        return _BOOKING_SIGNALS.match(self.lower)
+
+    @cached_property
+    def service(self) -> Optional[str]:
+        """Most specific dental service named in the text (deterministic fallback for the LLM extractor)."""
+        hits = _SERVICE_MATCHER.match(self.lower)
+        for svc, _ in SERVICE_HEURISTICS:
+            if svc in hits:
+                return svc
+        return None
+
+    @cached_property
+    def township_hint(self) -> Optional[str]:
+        """Loose area guess from "... near X" / "... in X" (up to 3 tokens), excluding country words."""
+        for kw in (" near ", " in "):
+            if kw in self.lower:
+                tail = self.lower.split(kw, 1)[1].strip()
+                tokens = [tok.strip(string.punctuation) for tok in tail.split()]
+                guess = " ".join(tokens[:3]).strip()
+                if guess and guess not in _COUNTRY_WORDS:
+                    return guess
+        return None
+
+    @cached_property
+    def quality_adjectives(self) -> List[str]:
+        """Quality adjectives (gentle, affordable, ...) for sentiment ranking; [] without spaCy."""
+        nlp = get_nlp()
+        if not nlp:
+            print("[SENTIMENT] spaCy not loaded - cannot extract adjectives")
+            return []
+        try:
+            quality_words = [core for compound, core in COMPOUND_ADJECTIVES.items() if compound in self.lower]
+            for token in nlp(self.lower):
+                if token.pos_ == "ADJ" and token.text not in _NON_QUALITY_ADJECTIVES and token.text not in quality_words:
+                    quality_words.append(token.text)
+            print(f"[SENTIMENT] Extracted quality adjectives: {quality_words}")
+            return quality_words
+        except Exception as e:
+            print(f"[SENTIMENT] Error extracting adjectives: {e}")
+            return []
+
+
+@lru_cache(maxsize=256)
+def analyze(text: str) -> MessageFeatures:
+    """Shared, memoized MessageFeatures for `text`."""
+    return MessageFeatures(text)
+
+
+def normalize_location_terms(text: str) -> Optional[str]:
+    if not text:
+        return None
+    return analyze(text).location
@@ -1,10 +1,14 @@
 
 from .utils import get_disclaimer
+from services.deadline import GENERATION_SLICE, record_degradation, request_options
+from services.streaming import generate_text
 
-def handle_qna(latest_user_message: str, generation_model):
+def handle_qna(latest_user_message: str, generation_model, token_sink=None, deadline=None):
     # generation_model should be an instance of genai.GenerativeModel, e.g. genai.GenerativeModel("gemini-pro")
     """
     Handles general dental health questions.
+    With a token_sink (/chat/stream) the answer is streamed as it is generated; the call is bounded
+    by the request deadline (services/deadline.py) and falls back to the apology below.
     """
     print("Executing Q&A flow...")
     qna_prompt = f"""
@@ -18,19 +22,22 @@ def handle_qna(latest_user_message: str, generation_model):
     **User's Question:** "{latest_user_message}"
     """
     try:
-        ai_response = generation_model.generate_content(qna_prompt)
+        streamed_text = generate_text(generation_model, qna_prompt, token_sink, **request_options(deadline, GENERATION_SLICE))
         follow_up_question = "\n\nWould you like me to help you find a clinic that can assist with this?"
         disclaimer = get_disclaimer()
-        raw_text = ai_response.text or "I'm sorry, I wasn't able to generate an answer this time."
+        raw_text = streamed_text or "I'm sorry, I wasn't able to generate an answer this time."
         # Ensure disclaimer appended exactly once
         if "Disclaimer:" in raw_text:
             full_response = raw_text + follow_up_question
         else:
             full_response = raw_text + disclaimer + follow_up_question
+        if token_sink is not None:
+            token_sink.emit(full_response[len(streamed_text or ""):] if streamed_text else full_response)
         print(f"Q&A AI Response: {full_response}")
         return {"response": full_response}
     except Exception as e:
         print(f"Q&A Flow Error: {e}")
+        record_degradation("qna")
         fallback = ("I'm sorry, I encountered an error while trying to answer your question. Please try again." + get_disclaimer())
         return {"response": fallback}
 
@@ -0,0 +1,129 @@
+# flows/response_renderer.py
+#
+# Turns the ranked top clinics of handle_find_clinic into the chat reply.
+#
+# CLINIC_RESPONSE_RENDERER selects the renderer:
+#   template - deterministic markdown built from the clinic rows, the ranking note, derive_clinic_tags
+#              and the location context; zero LLM calls (default)
+#   llm      - the previous "Data Formatter" prompt on generation_model; falls back to the template
+#              on failure or when the request deadline is spent
+#
+# Renderers are plain callables taking a RenderContext; register_renderer() adds new ones.
+# The template picks one of several phrasing variants from a hash of the clinic ids, so the same
+# results always read the same while different searches do not all sound alike.
+
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+from services.deadline import GENERATION_SLICE, request_options
+from services.streaming import generate_text
+from .utils import derive_clinic_tags
+
+CLINIC_RESPONSE_RENDERER = os.getenv("CLINIC_RESPONSE_RENDERER", "template").lower()
+
+
+@dataclass
+class RenderContext:
+    top_clinics: List[dict]
+    ranking_note: str
+    location_preference: Optional[str] = None  # 'sg' | 'jb' | 'all' | None
+    services: List[str] = field(default_factory=list)
+    generation_model: object = None
+    token_sink: object = None
+    deadline: object = None
+
+
+_LOCATION_PHRASES = {"sg": "in Singapore", "jb": "in Johor Bahru"}
+
+_INTROS = (
+    "Here are {count} clinics{service}{location} that stand out:",
+    "I found {count} great options{service}{location}:",
+    "These {count} clinics{service}{location} come highly recommended:",
+    "Based on your search, here are {count} clinics{service}{location} worth considering:",
+)
+
+_OUTROS = (
+    "Would you like to book an appointment at one of these clinics?",
+    "Let me know if you'd like to book with any of them, or refine the search.",
+    "Shall I help you book at one of these, or would you like more options?",
+)
+
+
+def _variant(options, seed: str) -> str:
+    return options[int(hashlib.sha1(seed.encode("utf-8")).hexdigest(), 16) % len(options)]
+
+
+def _service_phrase(services: List[str]) -> str:
+    if not services:
+        return ""
+    return " for " + " and ".join(s.replace("_", " ") for s in services)
+
+
+def _format_count(value) -> Optional[str]:
+    try:
+        return f"{int(value):,}"
+    except (TypeError, ValueError):
+        return None
+
+
+def _clinic_block(position: int, clinic: dict) -> str:
+    lines = [f"**{position}. {clinic.get('name') or 'Unnamed clinic'}**"]
+    rating, reviews = clinic.get("rating"), _format_count(clinic.get("reviews"))
+    if rating is not None:
+        lines.append(f"   - Google rating: {rating}" + (f" ({reviews} reviews)" if reviews else ""))
+    if clinic.get("address"):
+        lines.append(f"   - Address: {clinic['address']}")
+    tags = derive_clinic_tags({**clinic, 'rating': clinic.get('rating') or 0, 'reviews': clinic.get('reviews') or 0})
+    if tags:
+        lines.append(f"   - Highlights: {', '.join(tags)}")
+    if isinstance(clinic.get("operating_hours"), str) and clinic["operating_hours"].strip():
+        lines.append(f"   - Hours: {clinic['operating_hours'].strip()}")
+    if clinic.get("website_url"):
+        lines.append(f"   - Website: {clinic['website_url']}")
+    return "\n".join(lines)
+
+
+def render_template(ctx: RenderContext) -> str:
+    seed = "|".join(str(c.get("id") or c.get("name")) for c in ctx.top_clinics)
+    intro = _variant(_INTROS, seed).format(
+        count=len(ctx.top_clinics),
+        service=_service_phrase(ctx.services),
+        location=" " + _LOCATION_PHRASES[ctx.location_preference] if ctx.location_preference in _LOCATION_PHRASES else "",
+    )
+    blocks = "\n\n".join(_clinic_block(i + 1, c) for i, c in enumerate(ctx.top_clinics))
+    return f"{ctx.ranking_note}\n\n{intro}\n\n{blocks}\n\n{_variant(_OUTROS, seed[::-1])}"
+
+
+def render_llm(ctx: RenderContext) -> str:
+    """The original Data Formatter call; raises on failure so the caller can fall back."""
+    context = json.dumps([{"position": i + 1, **{k: clinic.get(k) for k in ['name', 'address', 'rating', 'reviews', 'website_url', 'operating_hours']}} for i, clinic in enumerate(ctx.top_clinics)], indent=2)
+    augmented_prompt = (
+        'You are a Data Formatter. Your only job is to take the following JSON data and format it into a friendly, conversational, and easy-to-read summary for a user. '
+        f'Present the top 3 clinics clearly. Start with this explanation: "{ctx.ranking_note}" '
+        'CRITICAL: Never mention or display sentiment scores, aspect scores, or any numeric ratings other than the overall Google rating and review count. '
+        'Do not output raw JSON. **Data:**\n```json\n' + context + '\n```'
+    )
+    response_text = generate_text(ctx.generation_model, augmented_prompt, ctx.token_sink,
+                                  **request_options(ctx.deadline, GENERATION_SLICE))
+    if not response_text or not response_text.strip():
+        raise ValueError("AI returned an empty response.")
+    return response_text
+
+
+RENDERERS: Dict[str, Callable[[RenderContext], str]] = {"template": render_template, "llm": render_llm}
+
+
+def register_renderer(name: str, renderer: Callable[[RenderContext], str]):
+    RENDERERS[name] = renderer
+
+
+def get_renderer(name: Optional[str] = None) -> Callable[[RenderContext], str]:
+    name = (name or CLINIC_RESPONSE_RENDERER).lower()
+    if name not in RENDERERS:
+        logging.warning(f"[RENDERER] Unknown renderer '{name}', using template")
+        return render_template
+    return RENDERERS[name]
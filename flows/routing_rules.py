@@ -0,0 +1,220 @@
+# flows/routing_rules.py
+#
+# Shared keyword rule table for /chat routing (main.py) and the flows' own guards
+# (find_clinic_flow.should_attempt_direct_lookup, travel_flow.handle_travel_query).
+#
+# All literal keywords are compiled at import into ONE regex (a trie of the alternatives inside a
+# zero-width lookahead), so a single pass over the message reports every rule that matched:
+# at each position the longest keyword is captured, and every rule owning a keyword that is a
+# prefix of it is credited too (e.g. "booking" also satisfies a rule that lists "book").
+# Regex rules (educational phrasing, "find <service> clinics", ...) are one search each.
+#
+# The scan itself is a pure function memoized per (rule table, message), so main.py and the flows
+# share one scan per turn. Per-rule hit counters are incremented on every match() call, cached or
+# not, so /metrics reflects routed traffic.
+
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+CONTAINS = "contains"        # keyword anywhere in the message
+PREFIX = "prefix"            # message starts with the keyword
+WORD_PREFIX = "word_prefix"  # message starts with the keyword or it follows a space
+REGEX = "regex"              # patterns are regular expressions
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    patterns: Tuple[str, ...]
+    kind: str = CONTAINS
+
+
+SERVICE_TERMS_FIND = ("scaling", "cleaning", "root canal", "implant", "whitening", "crown", "filling", "braces",
+                      "wisdom tooth", "gum treatment", "veneers", "bonding", "inlay", "onlay", "extraction")
+
+ROUTING_RULES = (
+    # --- main.handle_chat ---
+    Rule("reset", ("reset", "reset:", "reset -", "reset please", "start over", "restart", "new search"), PREFIX),
+    Rule("travel", (
+        "how to get", "get to", "directions", "route", "from singapore", "from sg",
+        "to johor", "to jb", "causeway", "second link", "bus", "train", "ktm",
+        "checkpoint", "immigration", "customs", "woodlands", "tuas", "shuttle", "cw",
+        "transport", "travel", "commute", "prepare", "preparation", "mistakes", "common mistakes",
+    )),
+    Rule("educational", (
+        r"what is", r"what are", r"what's", r"whats", r"define",
+        r"tell me about", r"explain", r"can you explain", r"meaning of",
+        r"what does .+ mean",
+    ), REGEX),
+    Rule("dental_term", (
+        "root canal", "scaling", "braces", "whitening", "implant", "filling",
+        "extraction", "crown", "veneer", "cleaning", "checkup", "bonding",
+        "wisdom tooth", "orthodontic", "endodontic", "treatment",
+    )),
+    Rule("clinic_or_location", ("clinic", "dentist", "singapore", "jb", "johor", "first", "second", "third")),
+    Rule("location_change", ("show me", "switch to", "change to", "rather", "instead", "prefer")),
+    Rule("ordinal_booking", ("book", "appointment", "schedule", "reserve", "make an appointment", "i want to book")),
+    Rule("booking", ("book", "appointment", "schedule", "reserve", "confirm", "booking")),
+    Rule("booking_cancel", (
+        "cancel", "stop", "quit", "exit", "no", "nope", "don't want", "do not want",
+        "abort", "changed my mind", "change my mind", "i'll call", "go back", "start over", "never mind", "nevermind",
+    )),
+    Rule("booking_travel", ("direction", "travel", "get there", "how to go", "how do i get")),
+    Rule("remember", (
+        "remind", "recall", "remember",
+        "what did", "what clinics", "which clinics",
+        "previous", "earlier", "before", "last time",
+        "you showed", "you recommended", "you suggested",
+        "from before", "from earlier",
+    )),
+    Rule("qna_question", (
+        "what is", "what are", "tell me about", "tell me more", "explain",
+        "how does", "why is", "is it", "does", "should i", "can i",
+        "how often", "how long", "when should", "how do you", "how do i",
+    ), WORD_PREFIX),
+    Rule("search", ("find", "recommend", "suggest", "clinic", "dentist", "appointment", "nearby", "best")),
+    Rule("service", ("scaling", "cleaning", "scale", "polish", "root canal", "implant", "whitening", "crown",
+                     "filling", "braces", "wisdom", "gum", "veneers")),
+
+    # --- find_clinic_flow.should_attempt_direct_lookup ---
+    Rule("lookup_remember", ("remind", "recall", "remember", "what did", "what clinics", "which clinics",
+                             "you showed", "you recommended", "you suggested", "from before", "from earlier")),
+    Rule("lookup_booking", ("help me book", "start booking", "make appointment", "schedule", "book an appointment")),
+    Rule("lookup_location_change", ("switch to", "change to", "rather than", "instead of", "prefer", "instead")),
+    Rule("quality_adjective", (
+        "gentle", "painless", "comfortable", "soft", "tender",  # pain_management
+        "skilled", "expert", "experienced", "competent", "professional", "qualified",  # dentist_skill
+        "affordable", "cheap", "budget", "value", "economical", "reasonable", "worth",  # cost_value
+        "friendly", "helpful", "polite", "courteous", "kind", "welcoming", "attentive", "nice",  # staff_service
+        "clean", "hygienic", "modern", "pleasant", "spotless", "tidy",  # ambiance_cleanliness
+        "convenient", "quick", "fast", "easy", "accessible", "nearby", "close",  # convenience
+    )),
+    Rule("lookup_service", ("scaling", "cleaning", "scale", "polish", "root canal", "implant",
+                            "whitening", "crown", "filling", "braces", "wisdom tooth", "wisdom teeth",
+                            "gum treatment", "veneers", "bonding", "inlay", "onlay", "extraction")),
+    Rule("clinic_name_hint", (" dental clinic", " clinic", " dental hub", " hub", " dental centre",
+                              " dental center", " dental surgery", "dr. ", "doctor ", "klinik ")),
+    Rule("find_service_clinics", (
+        r"\bfind\b[^.,;!?]*\b(?:" + "|".join(SERVICE_TERMS_FIND) + r")\b[^.,;!?]*\bclinics?",
+    ), REGEX),
+    Rule("find_service_clinics_near", (
+        r"find[^\n]{0,80}?(?:scaling|cleaning|scale|polish|root canal|implant|whitening|crown|filling|braces|wisdom tooth"
+        r"|wisdom teeth|gum treatment|veneers|bonding|inlay|onlay|extraction)(?:[^\n]{0,80}?clinics?)",
+    ), REGEX),
+    Rule("service_in_location", (
+        r"\b(?:root canal|scaling|cleaning|braces|implant|dental implant|whitening|crown|filling|veneer|wisdom tooth|extraction|gum treatment)\s+(?:clinic[s]?\s+)?in\s+(?:jb|johor|singapore|sg|malaysia|my|johor bahru)\b",
+    ), REGEX),
+
+    # --- find_clinic_flow.handle_find_clinic ---
+    Rule("flow_location_all", ("both", "all")),
+    Rule("flow_location_sg", ("singapore", "sg")),
+    Rule("flow_location_jb", ("johor bahru", "johor", "jb")),
+    Rule("flow_location_change", ("switch to", "change to", "show me", "see", "instead", "rather", "prefer")),
+    Rule("flow_search", ("clinic", "dentist", "recommend", "find", "looking", "search")),
+    # Word boundaries separate price questions ("how much", "cost of") from quality words ("cost-effective").
+    Rule("cost_price", (r"\bhow much\b", r"\bprice\b", r"\bcost\s+(?:of|for|is|are)\b", r"\bexpensive\b", r"\bcheaper\b"), REGEX),
+    Rule("comparison", ("compare", "vs", "versus", "difference", "jb or sg", "sg or jb")),
+
+    # --- travel_flow.handle_travel_query ---
+    Rule("travel_faq", (
+        "how to get", "get to", "directions", "route", "from singapore", "from sg",
+        "to johor", "to jb", "causeway", "second link", "bus", "train", "ktm",
+        "checkpoint", "immigration", "customs", "woodlands", "tuas", "cw", "shuttle",
+        "grab", "taxi", "drive",
+    )),
+)
+
+
+def _trie_regex(words: Iterable[str]) -> str:
+    """Alternation of `words` factored into a trie; greedy, so it captures the longest match."""
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node) -> str:
+        terminal = "" in node
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch != ""]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if terminal:
+            return "(?:" + body + ")?"
+        return body
+
+    return build(trie)
+
+
+class CompiledRules:
+    """Immutable compiled form of a rule table; hashed by identity so it can key the scan memo."""
+
+    def __init__(self, rules: Tuple[Rule, ...]):
+        owners: Dict[str, List[Tuple[str, str]]] = {}
+        self.regex_rules = []
+        for rule in rules:
+            if rule.kind == REGEX:
+                self.regex_rules.append((rule.name, re.compile("|".join(f"(?:{p})" for p in rule.patterns))))
+                continue
+            for kw in rule.patterns:
+                owners.setdefault(kw, []).append((rule.name, rule.kind))
+        # Prefix closure: the keyword captured at a position also stands for every keyword that is its prefix.
+        self.closure = {
+            kw: tuple(owner for other, entries in owners.items() if kw.startswith(other) for owner in entries)
+            for kw in owners
+        }
+        self.literal = re.compile("(?=(" + _trie_regex(owners) + "))") if owners else None
+
+
+@lru_cache(maxsize=256)
+def _scan(compiled: CompiledRules, text: str) -> FrozenSet[str]:
+    matched = set()
+    if compiled.literal is not None:
+        for m in compiled.literal.finditer(text):
+            pos = m.start()
+            for name, kind in compiled.closure[m.group(1)]:
+                if kind == CONTAINS or (kind == PREFIX and pos == 0) or \
+                        (kind == WORD_PREFIX and (pos == 0 or text[pos - 1] == " ")):
+                    matched.add(name)
+    for name, rx in compiled.regex_rules:
+        if rx.search(text):
+            matched.add(name)
+    return frozenset(matched)
+
+
+class RuleMatcher:
+    def __init__(self, rules: Iterable[Rule] = ROUTING_RULES):
+        self.rules = tuple(rules)
+        names = [r.name for r in self.rules]
+        if len(names) != len(set(names)):
+            raise ValueError("duplicate routing rule names")
+        self._compiled = CompiledRules(self.rules)
+        self._lock = threading.Lock()
+        self.hits = Counter()
+        self.calls = 0
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """Names of every rule matching `text` (case-insensitive, surrounding whitespace ignored)."""
+        matched = _scan(self._compiled, (text or "").lower().strip())
+        with self._lock:
+            self.calls += 1
+            self.hits.update(matched)
+        return matched
+
+    def stats(self) -> dict:
+        cache = _scan.cache_info()
+        with self._lock:
+            return {"calls": self.calls, "scan_cache": {"hits": cache.hits, "misses": cache.misses},
+                    "hits": {r.name: self.hits.get(r.name, 0) for r in self.rules}}
+
+
+ROUTER = RuleMatcher()
+
+
+def match(text: str) -> FrozenSet[str]:
+    return ROUTER.match(text)
@@ -0,0 +1,206 @@
+# flows/sentiment_lexicon.py
+#
+# Adjective -> sentiment-dimension scores for find_clinic_flow.detect_sentiment_intent.
+#
+# The lexicon is built offline (scripts/build_sentiment_lexicon.py -> data/sentiment/sentiment_lexicon.json):
+# for every word in the vocabulary it stores its cosine similarity to each SENTIMENT_INTENTS
+# description, so a known adjective costs one dict lookup instead of an embed call.
+# Words outside the vocabulary are embedded (through services/embedding_cache) and scored against
+# all dimensions at once with a (n_dimensions x dim) matrix product.
+#
+# The dimension vectors themselves come from another offline artifact
+# (scripts/build_sentiment_embeddings.py -> data/sentiment/sentiment_intents.npy + .json) that
+# records a hash of each SENTIMENT_INTENTS description. Rows whose description changed, or a missing
+# artifact, leave those dimensions stale: run_sentiment_refresh_loop embeds them in the background
+# (retrying until it succeeds) instead of blocking the import on the embedding API.
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from services.executor import run_blocking
+
+SENTIMENT_LEXICON_PATH = os.getenv(
+    "SENTIMENT_LEXICON_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "sentiment", "sentiment_lexicon.json"),
+)
+# `--lexical` builds (one-hot scores, no embeddings) are not calibrated against the 0.60 cosine
+# threshold of detect_sentiment_intent; they are only loaded when explicitly allowed (tests, local dev).
+SENTIMENT_LEXICON_ALLOW_LEXICAL = os.getenv("SENTIMENT_LEXICON_ALLOW_LEXICAL", "false").lower() in ("1", "true", "yes", "on")
+SENTIMENT_EMBEDDINGS_PATH = os.getenv(
+    "SENTIMENT_EMBEDDINGS_PATH",
+    os.path.join(os.path.dirname(__file__), "..", "data", "sentiment", "sentiment_intents.npy"),
+)
+SENTIMENT_REFRESH_SECONDS = float(os.getenv("SENTIMENT_REFRESH_SECONDS", "60"))
+
+# Description of each sentiment dimension (a field of the clinic rows). Its embedding is the
+# dimension's vector, and its words seed the lexicon.
+SENTIMENT_INTENTS = {
+    'sentiment_dentist_skill': "skilled expert experienced competent professional qualified knowledgeable skilful skillful proficient adept accomplished talented masterful capable",
+    'sentiment_pain_management': "gentle painless comfortable soft tender loving light touch no pain minimal discomfort",
+    'sentiment_cost_value': "affordable cheap budget value economical reasonable worth good deal cost-effective",
+    'sentiment_staff_service': "friendly helpful polite courteous kind welcoming attentive nice staff",
+    'sentiment_ambiance_cleanliness': "clean hygienic modern nice pleasant spotless tidy well-maintained",
+    'sentiment_convenience': "convenient quick fast easy accessible short wait time nearby close"
+}
+
+
+def description_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def metadata_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".json"
+
+
+def save_dimension_embeddings(intents: Dict[str, str], embeddings: Dict[str, List[float]], model: str,
+                              task_type: str, version: str, path: str = SENTIMENT_EMBEDDINGS_PATH):
+    """Write the (n_fields, dim) float32 matrix as .npy and its row metadata as .json next to it."""
+    fields = list(intents)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    np.save(path, np.asarray([embeddings[f] for f in fields], dtype=np.float32), allow_pickle=False)
+    meta = {"version": version, "model": model, "task_type": task_type, "fields": fields,
+            "descriptions": {f: description_hash(intents[f]) for f in fields}}
+    with open(metadata_path(path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+        f.write("\n")
+
+
+def load_dimension_embeddings(intents: Dict[str, str], path: str = SENTIMENT_EMBEDDINGS_PATH) -> Dict[str, List[float]]:
+    """Stored vectors of the dimensions whose description is unchanged since the artifact was built."""
+    try:
+        with open(metadata_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        matrix = np.load(path, allow_pickle=False)
+    except FileNotFoundError:
+        logging.warning(f"[SENTIMENT INIT] No sentiment embeddings artifact at {path}; embedding in the background")
+        return {}
+    except Exception as e:
+        logging.error(f"[SENTIMENT INIT] Failed to load sentiment embeddings {path}: {e}")
+        return {}
+    embeddings = {}
+    for row, field in enumerate(meta.get("fields", [])):
+        if field in intents and meta["descriptions"].get(field) == description_hash(intents[field]):
+            embeddings[field] = matrix[row].tolist()
+    stale = [f for f in intents if f not in embeddings]
+    print(f"[SENTIMENT INIT] Loaded {len(embeddings)} sentiment embeddings (version {meta.get('version')})"
+          + (f"; stale: {', '.join(stale)}" if stale else ""))
+    return embeddings
+
+
+class SentimentScorer:
+    def __init__(self, fields: List[str], words: Optional[Dict[str, List[float]]] = None,
+                 dimension_embeddings: Optional[Dict[str, List[float]]] = None, version: str = ""):
+        self.fields = list(fields)
+        self.words = {w: np.asarray(s, dtype=np.float32) for w, s in (words or {}).items()}
+        self.version = version
+        self.dimension_embeddings: Dict[str, List[float]] = {}
+        self.matrix = None  # (n_fields, dim), rows L2-normalised; None until every dimension has a vector
+        self.set_dimension_embeddings(dimension_embeddings or {})
+        self.lookups = {"lexicon": 0, "embedded": 0, "unscored": 0}
+        self.refreshes = {"runs": 0, "errors": 0}
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def stale_fields(self) -> List[str]:
+        return [f for f in self.fields if f not in self.dimension_embeddings]
+
+    def set_dimension_embeddings(self, embeddings: Dict[str, List[float]]):
+        """Merge dimension vectors in; the matrix is (re)built once all dimensions are present."""
+        merged = {**self.dimension_embeddings, **{f: v for f, v in embeddings.items() if f in self.fields}}
+        if all(f in merged for f in self.fields):
+            matrix = np.asarray([merged[f] for f in self.fields], dtype=np.float32)
+            self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.dimension_embeddings = merged
+
+    def refresh(self, intents: Dict[str, str], embed_fn: Callable[[str], List[float]]) -> List[str]:
+        """Embed the descriptions of the stale dimensions. Blocking; returns the fields still stale.
+
+        Only one refresh runs at a time (a concurrent call returns immediately), and it stops at the
+        first failure since the API is then likely down; run_sentiment_refresh_loop retries later.
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return self.stale_fields
+        try:
+            self.refreshes["runs"] += 1
+            for field in self.stale_fields:
+                try:
+                    self.set_dimension_embeddings({field: embed_fn(intents[field])})
+                except Exception as e:
+                    self.refreshes["errors"] += 1
+                    logging.error(f"[SENTIMENT] Embedding '{field}' failed: {e}")
+                    break
+        finally:
+            self._refresh_lock.release()
+        return self.stale_fields
+        self._last_refresh = now
+        self.refreshes["runs"] += 1
+        for field in self.stale_fields:
+            try:
+                self.set_dimension_embeddings({field: embed_fn(intents[field])})
+            except Exception as e:
+                self.refreshes["errors"] += 1
+                logging.error(f"[SENTIMENT] Embedding '{field}' failed: {e}")
+                break
+        return self.stale_fields
+
+    @property
+    def available(self) -> bool:
+        return bool(self.words) or self.matrix is not None
+
+    def scores(self, word: str, embed_fn: Optional[Callable[[str], List[float]]] = None) -> Optional[Dict[str, float]]:
+        """Similarity of `word` to every dimension: lexicon first, then embed_fn + the matrix."""
+        key = (word or "").strip().lower()
+        vector = self.words.get(key)
+        if vector is not None:
+            self.lookups["lexicon"] += 1
+        elif self.matrix is not None and embed_fn is not None:
+            query = np.asarray(embed_fn(key), dtype=np.float32)
+            vector = self.matrix @ (query / (np.linalg.norm(query) or 1.0))
+            self.lookups["embedded"] += 1
+        else:
+            self.lookups["unscored"] += 1
+            return None
+        return {field: float(score) for field, score in zip(self.fields, vector)}
+
+    def stats(self) -> dict:
+        return {"version": self.version, "words": len(self.words), "matrix": self.matrix is not None,
+                "stale_fields": self.stale_fields, **self.lookups, "refreshes": dict(self.refreshes)}
+
+    @classmethod
+    def load(cls, fields: List[str], dimension_embeddings: Optional[Dict[str, List[float]]] = None,
+             path: str = SENTIMENT_LEXICON_PATH, allow_lexical: bool = SENTIMENT_LEXICON_ALLOW_LEXICAL) -> "SentimentScorer":
+        words, version = {}, ""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                artifact = json.load(f)
+            if artifact.get("source") == "lexical" and not allow_lexical:
+                logging.warning(f"[SENTIMENT INIT] Ignoring lexical (uncalibrated) sentiment lexicon {path}; every adjective will be embedded")
+                return cls(fields, {}, dimension_embeddings)
+            # Re-order the stored columns to the caller's field order; unknown fields score 0.
+            index = [artifact["fields"].index(f) if f in artifact["fields"] else None for f in fields]
+            words = {w: [s[i] if i is not None else 0.0 for i in index] for w, s in artifact["words"].items()}
+            version = f"{artifact.get('version', '')} ({artifact.get('source', 'unknown')})"
+            print(f"[SENTIMENT INIT] Loaded sentiment lexicon {version}: {len(words)} words")
+        except FileNotFoundError:
+            logging.warning(f"[SENTIMENT INIT] No sentiment lexicon at {path}; every adjective will be embedded")
+        except Exception as e:
+            logging.error(f"[SENTIMENT INIT] Failed to load sentiment lexicon {path}: {e}")
+        return cls(fields, words, dimension_embeddings, version)
+
+
+async def run_sentiment_refresh_loop(scorer: SentimentScorer, intents: Dict[str, str],
+                                     embed_fn: Callable[[str], List[float]], interval: float = SENTIMENT_REFRESH_SECONDS):
+    """Embed stale dimensions (artifact missing or SENTIMENT_INTENTS edited), retrying until none are left."""
+    while scorer.stale_fields:
+        stale = await run_blocking(scorer.refresh, intents, embed_fn)
+        if not stale:
+            print(f"[SENTIMENT] Sentiment embeddings refreshed for {len(scorer.fields)} dimensions", flush=True)
+            return
+        await asyncio.sleep(interval)
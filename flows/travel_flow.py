@@ -4,6 +4,13 @@ import os
 import google.generativeai as genai
 from supabase import Client
 import logging
+import threading
+import time
+
+from flows import message_features
+from services.deadline import GENERATION_SLICE, RETRIEVAL_SLICE, record_degradation, request_options
+from services.embedding_cache import embed
+from services.streaming import generate_text
 
 # It's good practice to get the model name from a central service if possible,
 # but defining it here is also fine for this specific flow.
@@ -20,57 +27,113 @@ if not os.getenv("GEMINI_API_KEY"):
 # We can use Gemini 2.5 Pro for consistent behavior across the app.
 generation_model = genai.GenerativeModel('models/gemini-2.5-pro')
 
-def handle_travel_query(user_query: str, supabase_client: Client) -> dict | None:
-    """
-    Handles a user's travel-related query using a Semantic RAG approach.
+# Cheaper model for the middle similarity band (see answer_tier).
+fast_generation_model = genai.GenerativeModel('models/gemini-2.5-flash')
 
-    Args:
-        user_query: The user's question.
-        supabase_client: The initialized Supabase client instance.
+# Answer tiers by the top FAQ match's cosine similarity:
+#   >= TRAVEL_DIRECT_ANSWER_THRESHOLD  -> the curated FAQ answer as-is (no model call)
+#   >= TRAVEL_FAST_MODEL_THRESHOLD     -> fast_generation_model
+#   below                              -> generation_model (full synthesis across the matches)
+TRAVEL_DIRECT_ANSWER_THRESHOLD = float(os.getenv("TRAVEL_DIRECT_ANSWER_THRESHOLD", "0.88"))
+TRAVEL_FAST_MODEL_THRESHOLD = float(os.getenv("TRAVEL_FAST_MODEL_THRESHOLD", "0.72"))
+_tier_lock = threading.Lock()
+_tier_counters = {tier: {"hits": 0, "seconds": 0.0} for tier in ("direct", "flash", "pro", "degraded")}
 
-    Returns:
-        A dictionary with the response if a relevant FAQ is found, otherwise None.
-    """
-    print(f"[TRAVEL_FLOW] Received query: '{user_query}'")
 
-    # Quick guard: avoid triggering travel flow on trivial/non-travel inputs
+def answer_tier(similarity) -> str:
+    if similarity is None:
+        return "pro"
+    if similarity >= TRAVEL_DIRECT_ANSWER_THRESHOLD:
+        return "direct"
+    if similarity >= TRAVEL_FAST_MODEL_THRESHOLD:
+        return "flash"
+    return "pro"
+
+
+def record_answer_tier(tier: str, seconds: float):
+    with _tier_lock:
+        _tier_counters[tier]["hits"] += 1
+        _tier_counters[tier]["seconds"] += seconds
+
+
+def answer_tier_stats() -> dict:
+    with _tier_lock:
+        return {
+            tier: {"hits": c["hits"], "avg_seconds": round(c["seconds"] / c["hits"], 4) if c["hits"] else None}
+            for tier, c in _tier_counters.items()
+        }
+
+
+# Speculative retrieval: for ambiguous messages main.handle_chat starts retrieve_travel_faqs() in
+# parallel with the LLM gatekeeper and hands the result to handle_travel_query() only if the turn
+# ends up as TRAVEL_FAQ; otherwise it is discarded.
+SPECULATIVE_TRAVEL_RETRIEVAL = os.getenv("SPECULATIVE_TRAVEL_RETRIEVAL", "false").lower() in ("1", "true", "yes", "on")
+_speculation_lock = threading.Lock()
+_speculation_counters = {"launched": 0, "used": 0, "discarded": 0}
+
+
+def record_speculation(outcome: str):
+    with _speculation_lock:
+        _speculation_counters[outcome] += 1
+
+
+def speculation_stats() -> dict:
+    with _speculation_lock:
+        launched = _speculation_counters["launched"]
+        return {"enabled": SPECULATIVE_TRAVEL_RETRIEVAL, **_speculation_counters,
+                "use_rate": round(_speculation_counters["used"] / launched, 4) if launched else None}
+
+def is_travel_candidate(user_query: str) -> bool:
+    """Cheap guard: False for empty/trivial inputs that should never engage the travel FAQ."""
     q = (user_query or "").strip().lower()
     if not q:
-        return None
+        return False
     # Single-word country or very short inputs should not engage travel FAQ
     trivial_locations = {"sg", "singapore", "jb", "johor", "johor bahru"}
-    travel_keywords = [
-        "how to get", "get to", "directions", "route", "from singapore", "from sg",
-        "to johor", "to jb", "causeway", "second link", "bus", "train", "ktm",
-        "checkpoint", "immigration", "customs", "woodlands", "tuas", "cw", "shuttle",
-        "grab", "taxi", "drive"
-    ]
     if q in trivial_locations:
         print("[TRAVEL_FLOW] Skipping: trivial location token; not a travel query.")
-        return None
+        return False
     # Require either at least 3 tokens or a clear travel keyword/phrase
-    if len(q.split()) < 3 and not any(kw in q for kw in travel_keywords):
+    if len(q.split()) < 3 and not message_features.analyze(user_query).has("travel_faq"):
         print("[TRAVEL_FLOW] Skipping: input too short and no travel keywords.")
-        return None
+        return False
+    return True
+
 
+def retrieve_travel_faqs(user_query: str, supabase_client: Client, deadline=None, faq_index=None) -> list | None:
+    """
+    Retrieval half of the travel flow (embedding + FAQ search, no generation).
+    The search runs on the in-process `faq_index` (services/faq_index.py) when it is loaded,
+    otherwise on the 'match_faqs' RPC.
+
+    Returns the matching FAQ rows ([] if none pass the threshold) or None on error. Safe to run
+    speculatively: it never raises, so an abandoned result can simply be dropped.
+    """
     # --- Step 1: Generate an embedding for the user's query ---
     try:
         print("[TRAVEL_FLOW] Generating embedding for user query...")
-        query_embedding = genai.embed_content(
-            model=EMBEDDING_MODEL_NAME,
-            content=user_query,
-            task_type="RETRIEVAL_QUERY"  # Use 'RETRIEVAL_QUERY' for searching
-        )['embedding']
+        query_embedding = embed(
+            user_query,
+            EMBEDDING_MODEL_NAME,
+            task_type="RETRIEVAL_QUERY",  # Use 'RETRIEVAL_QUERY' for searching
+            **request_options(deadline, RETRIEVAL_SLICE)
+        )
         print("[TRAVEL_FLOW] Embedding generated successfully.")
     except Exception as e:
         logging.error(f"[TRAVEL_FLOW] Error generating embedding: {e}")
         return None  # Cannot proceed without an embedding
 
-    # --- Step 2: Call the Supabase function to find matching FAQs ---
+    # --- Step 2: Find matching FAQs (local index first, Supabase function as fallback) ---
     # These parameters can be tuned.
     match_threshold = 0.50  # The minimum similarity score to consider a match.
     match_count = 3         # The maximum number of relevant documents to retrieve.
 
+    if faq_index is not None:
+        matching_faqs = faq_index.search(query_embedding, match_threshold, match_count)
+        if matching_faqs is not None:
+            print(f"[TRAVEL_FLOW] Local FAQ index found {len(matching_faqs)} potential matches.")
+            return matching_faqs
+
     try:
         print(f"[TRAVEL_FLOW] Calling Supabase 'match_faqs' function with threshold {match_threshold}...")
         # 'rpc' calls the database function we created
@@ -80,18 +143,86 @@ def handle_travel_query(user_query: str, supabase_client: Client) -> dict | None
             'match_count': match_count
         }).execute()
         
-        matching_faqs = response.data
+        matching_faqs = response.data or []
         print(f"[TRAVEL_FLOW] Found {len(matching_faqs)} potential matches.")
+        return matching_faqs
 
     except Exception as e:
         logging.error(f"[TRAVEL_FLOW] Error calling Supabase RPC: {e}")
         return None
 
+
+def handle_travel_query(user_query: str, supabase_client: Client, matching_faqs: list | None = None,
+                        token_sink=None, deadline=None, faq_index=None) -> dict | None:
+    """
+    Handles a user's travel-related query using a Semantic RAG approach.
+
+    Args:
+        user_query: The user's question.
+        supabase_client: The initialized Supabase client instance.
+        matching_faqs: Result of a retrieve_travel_faqs() call already made for this query
+            (speculatively, alongside the gatekeeper); retrieval is done here when None.
+        token_sink: services.streaming.TokenSink; the final answer is streamed into it (/chat/stream).
+        deadline: services.deadline.Deadline for this request; if generation fails or runs out of
+            time, the top FAQ answer is returned verbatim.
+        faq_index: services.faq_index.FaqIndex searched instead of the 'match_faqs' RPC when loaded.
+
+    Returns:
+        A dictionary with the response if a relevant FAQ is found, otherwise None.
+    """
+    print(f"[TRAVEL_FLOW] Received query: '{user_query}'")
+
+    # Quick guard: avoid triggering travel flow on trivial/non-travel inputs
+    if not is_travel_candidate(user_query):
+        return None
+
+    if matching_faqs is None:
+        matching_faqs = retrieve_travel_faqs(user_query, supabase_client, deadline=deadline, faq_index=faq_index)
+        if matching_faqs is None:
+            return None
+    else:
+        print(f"[TRAVEL_FLOW] Using {len(matching_faqs)} prefetched matches.")
+
     # --- Step 3: Check if any relevant documents were found ---
     if not matching_faqs:
         print("[TRAVEL_FLOW] No matches found above the threshold. Passing to next intent.")
         return None  # No good match, so let the main router handle it.
 
+    # Build travel meta payload for tests and UI
+    def extract_urls(text: str):
+        import re
+        pattern = r"https?://[^\s)]+"
+        return re.findall(pattern, text or "")
+
+    def travel_response(answer_text: str, status: str, tier: str) -> dict:
+        top = matching_faqs[0] if matching_faqs else {}
+        links = list({url for url in (extract_urls("\n".join([faq.get('answer','') for faq in matching_faqs])) + extract_urls(answer_text))})
+        travel_meta = {
+            "status": status,
+            "flow": "travel_faq",
+            "answer_tier": tier,
+            "data": {
+                "matched_question": top.get("question"),
+                "answer": top.get("answer"),
+                "links": [{"url": u} for u in links]
+            }
+        }
+        # We return a dictionary in the format that main.py expects
+        return {"response": answer_text, "meta": {"type": "travel_faq", "travel": travel_meta}}
+
+    # --- Tiered answering: direct FAQ answer / fast model / full generation by top similarity ---
+    started = time.perf_counter()
+    tier = answer_tier(matching_faqs[0].get("similarity"))
+    if tier == "direct":
+        answer_text = (matching_faqs[0].get("answer") or "").strip()
+        if answer_text:
+            print(f"[TRAVEL_FLOW] Near-exact FAQ match (similarity={matching_faqs[0]['similarity']:.3f}); answering directly.")
+            if token_sink is not None:
+                token_sink.emit(answer_text)
+            record_answer_tier(tier, time.perf_counter() - started)
+            return travel_response(answer_text, "success", tier)
+        tier = "flash"
+
     # --- Step 4: Construct the prompt for the generation model ---
     # We combine the retrieved FAQs to form a "context" for the LLM.
     context = "\n".join([
@@ -125,32 +256,21 @@ def handle_travel_query(user_query: str, supabase_client: Client) -> dict | None
 
     # --- Step 5: Generate the final answer ---
     try:
-        print("[TRAVEL_FLOW] Generating final answer with Gemini...")
-        final_answer = generation_model.generate_content(prompt)
+        model = fast_generation_model if tier == "flash" else generation_model
+        print(f"[TRAVEL_FLOW] Generating final answer with Gemini ({tier} tier)...")
+        answer_text = generate_text(model, prompt, token_sink, **request_options(deadline, GENERATION_SLICE)) or ""
         print("[TRAVEL_FLOW] Final answer generated successfully.")
-        
-        # Build travel meta payload for tests and UI
-        def extract_urls(text: str):
-            import re
-            pattern = r"https?://[^\s)]+"
-            return re.findall(pattern, text or "")
-
-        top = matching_faqs[0] if matching_faqs else {}
-        answer_text = final_answer.text or ""
-        links = list({url for url in (extract_urls("\n".join([faq.get('answer','') for faq in matching_faqs])) + extract_urls(answer_text))})
-        travel_meta = {
-            "status": "success",
-            "flow": "travel_faq",
-            "data": {
-                "matched_question": top.get("question"),
-                "answer": top.get("answer"),
-                "links": [{"url": u} for u in links]
-            }
-        }
-
-        # We return a dictionary in the format that main.py expects
-        return {"response": answer_text, "meta": {"type": "travel_faq", "travel": travel_meta}}
+        record_answer_tier(tier, time.perf_counter() - started)
+        return travel_response(answer_text, "success", tier)
 
     except Exception as e:
         logging.error(f"[TRAVEL_FLOW] Error generating final answer: {e}")
+        # Degraded answer: the best-matching FAQ as written.
+        top_answer = (matching_faqs[0].get("answer") or "").strip()
+        if top_answer:
+            record_degradation("travel_answer")
+            record_answer_tier("degraded", time.perf_counter() - started)
+            if token_sink is not None:
+                token_sink.emit(top_answer)
+            return travel_response(top_answer, "degraded", tier)
         return {"response": "I'm sorry, I encountered a technical issue while trying to answer your question. Please try again.", "meta": {"type": "travel_faq", "travel": {"status": "error", "flow": "travel_faq", "data": {}}}}
\ No newline at end of file
@@ -1,13 +1,16 @@
-from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from supabase import create_client, Client
 import os
+import asyncio
 import logging
 import re
 from dotenv import load_dotenv
 from uuid import uuid4
 from enum import Enum
+from dataclasses import dataclass
 from typing import List, Optional
 import jwt
 from jwt import PyJWKClient
@@ -16,6 +19,9 @@ from jwt import PyJWKClient
 load_dotenv()
 COUNTRY_MEMORY_ENABLED = os.getenv("COUNTRY_MEMORY_ENABLED", "true").lower() in ("1","true","yes","on")
 DEBUG_SMOKE = os.getenv("DEBUG_SMOKE", "false").lower() in ("1", "true", "yes", "on")
+QUOTA_LEDGER_ENABLED = os.getenv("QUOTA_LEDGER_ENABLED", "false").lower() in ("1", "true", "yes", "on")
+QUOTA_LEDGER_FLUSH_SECONDS = float(os.getenv("QUOTA_LEDGER_FLUSH_SECONDS", "5"))
+QUOTA_LEDGER_MAX_DRIFT = int(os.getenv("QUOTA_LEDGER_MAX_DRIFT", "5"))
 
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
@@ -33,13 +39,34 @@ from src.services.gemini_service import (
     embedding_model_name
 )
 
-from services.session_service import add_conversation_message
-from flows.find_clinic_flow import handle_find_clinic
+from services.conversation_logger import ConversationLogger
+from services.session_cache import SessionCache
+from services.session_unit_of_work import SessionUnitOfWork
+from services.session_delta import SESSION_DELTA_MODE, append_session_delta, get_session_snapshot, run_compaction_loop
+from services.session_format import SESSION_STORAGE_FORMAT, decode_row, encode_session
+from services.clinic_catalog import ClinicCatalog
+from services.faq_index import FaqIndex, run_faq_refresh_loop
+from services.embedding_cache import embedding_cache
+from services.jwt_verifier import JwtVerifier, run_jwks_refresh_loop
+from services.executor import run_blocking, shutdown_executor
+from services.streaming import TokenSink, sse_event
+from services.deadline import GATEKEEPER_SLICE, RETRIEVAL_SLICE, Deadline, DeadlineExceeded, deadline_stats, record_degradation
+from services.quota_service import SupabaseQuotaStore, QuotaLedger, consume_api_call, run_flush_loop
+from flows.find_clinic_flow import SENTIMENT_SCORER, embed_sentiment_text, handle_find_clinic
 from flows.booking_flow import handle_booking_flow
 from flows.qna_flow import handle_qna
-from flows.travel_flow import handle_travel_query
+from flows.travel_flow import (
+    SPECULATIVE_TRAVEL_RETRIEVAL, answer_tier_stats, handle_travel_query, is_travel_candidate, record_speculation,
+    retrieve_travel_faqs, speculation_stats,
+)
 from flows.outofscope_flow import handle_out_of_scope
 from flows.remember_flow import handle_remember_session
+from flows import message_features, routing_rules
+from flows.sentiment_lexicon import SENTIMENT_INTENTS, run_sentiment_refresh_loop
+from flows.gatekeeper import (
+    INTENT_CLASSIFIER_MODE, INTENT_SHADOW_LOG, GatekeeperDecisionCache, GatekeeperStats, IntentClassifier,
+    append_shadow_log, decide_with_llm,
+)
 
 # --- 3. DATA MODELS ---
 class ChatMessage(BaseModel):
@@ -90,10 +117,22 @@ try:
 except Exception as e:
     raise RuntimeError(f"CRITICAL: Unable to initialize JWKS client: {e}")
 
+# Verified claims are cached per token until `exp`; the JWKS is prefetched on startup and refreshed in the background.
+jwt_verifier = JwtVerifier(JWT_SECRET, JWKS_CLIENT)
+
+# Local intent classifier in front of the LLM gatekeeper (flows/gatekeeper.py); INTENT_CLASSIFIER_MODE=off|shadow|on.
+intent_classifier = IntentClassifier.load() if INTENT_CLASSIFIER_MODE != "off" else None
+gatekeeper_stats = GatekeeperStats()
+gatekeeper_cache = GatekeeperDecisionCache()
+
 @app.options("/chat")
 async def chat_options():
     return Response(status_code=200)
 
+@app.options("/chat/stream")
+async def chat_stream_options():
+    return Response(status_code=200)
+
 origins = [
     "http://localhost:8080",
     "http://localhost:5173",
@@ -120,87 +159,30 @@ LOCATION_REQUIRED_INTENTS = {
     ChatIntent.BOOK_APPOINTMENT.value,
     "get_price", "opening_hours", "cost", "schedule"
 }
-SG_SYNONYMS = {"singapore","sg","s'g","sin","sing","lion city","little red dot","singapura","local","home","here","this island"}
-JB_SYNONYMS = {"johor bahru","johor","jb","j.b.","bahru","malaysia side","across the border","causeway","second link"}
-TOWNSHIP_COUNTRY_MAP = {
-    "jurong": "sg", "jurong east": "sg", "jurong west": "sg", "bedok": "sg", "chinatown": "sg",
-    "toa payoh": "sg", "ang mo kio": "sg", "yishun": "sg", "tampines": "sg", "pasir ris": "sg",
-    "taman molek": "jb", "molek": "jb", "mount austin": "jb", "austin heights": "jb", "taman mount austin": "jb",
-    "tebrau": "jb", "adda heights": "jb", "bukit indah": "jb", "permas jaya": "jb", "skudai": "jb",
-    "taman sutera": "jb", "taman pelangi": "jb", "taman johor jaya": "jb", "taman damansara aliff": "jb",
-}
-
-def normalize_location_terms(text: str) -> str | None:
-    if not text: return None
-    t = text.lower()
-    if any(x in t for x in ["both","all","compare singapore and jb","sg and jb","jb and sg"]): return "both"
-    if any(s in t for s in SG_SYNONYMS): return "sg"
-    if any(s in t for s in JB_SYNONYMS): return "jb"
-    for key, country in TOWNSHIP_COUNTRY_MAP.items():
-        if key in t: return country
-    return None
-
 def resolve_ordinal_reference(message: str, candidate_pool: list) -> dict | None:
     """Resolve ordinal references with compound pattern priority to handle 'second one' correctly."""
-    import re
     if not candidate_pool:
         return None
-    
-    msg_lower = message.lower().strip()
-    
-    # PRIORITY 1: Compound patterns (two-word ordinals checked FIRST)
-    # This prevents 'second one' from matching 'one' pattern prematurely
-    compound_patterns = [
-        (r'\bfirst\s+(clinic|one|option)\b', 0),
-        (r'\bsecond\s+(clinic|one|option)\b', 1),
-        (r'\bthird\s+(clinic|one|option)\b', 2),
-        (r'\bfourth\s+(clinic|one|option)\b', 3),
-        (r'\bfifth\s+(clinic|one|option)\b', 4),
-    ]
-    
-    for pattern, index in compound_patterns:
-        if re.search(pattern, msg_lower):
-            if index < len(candidate_pool):
-                print(f"[ORDINAL] Matched compound pattern '{pattern}' → index {index}")
-                return candidate_pool[index]
-    
-    # PRIORITY 2: Simple ordinal patterns (checked SECOND)
-    # Only reached if no compound pattern matched
-    # Hash patterns use negative lookbehind/lookahead to avoid word boundaries (# is not \w)
-    simple_patterns = [
-        (r'\b(first|1st)\b|(?<!\w)#1(?!\w)', 0),
-        (r'\b(second|2nd)\b|(?<!\w)#2(?!\w)', 1),
-        (r'\b(third|3rd)\b|(?<!\w)#3(?!\w)', 2),
-        (r'\b(fourth|4th)\b|(?<!\w)#4(?!\w)', 3),
-        (r'\b(fifth|5th)\b|(?<!\w)#5(?!\w)', 4),
-    ]
-    
-    for pattern, index in simple_patterns:
-        if re.search(pattern, msg_lower):
-            if index < len(candidate_pool):
-                print(f"[ORDINAL] Matched simple pattern '{pattern}' → index {index}")
-                return candidate_pool[index]
-    
+    index = message_features.analyze(message).ordinal_index(len(candidate_pool))
+    if index is not None:
+        print(f"[ORDINAL] Matched ordinal reference → index {index}")
+        return candidate_pool[index]
     print(f"[ORDINAL] No ordinal pattern matched in: '{message}'")
     return None
 
 def detect_booking_intent(message: str, candidate_pool: list) -> bool:
     """Detect if message contains booking signals + clinic reference."""
-    msg_lower = message.lower()
-    booking_verbs = ['book', 'schedule', 'appointment', 'reserve', 'arrange', 'set up']
-    has_booking_verb = any(verb in msg_lower for verb in booking_verbs)
-    if not has_booking_verb:
+    features = message_features.analyze(message)
+    if "verb" not in features.booking_signals:
         return False
     # Check if clinic name or ordinal reference present
-    if candidate_pool and any(c.get('name','').lower() in msg_lower for c in candidate_pool):
+    if candidate_pool and any(c.get('name','').lower() in features.lower for c in candidate_pool):
         return True
     # Check ordinal patterns
     if resolve_ordinal_reference(message, candidate_pool):
         return True
     # Check generic service + booking combo
-    service_words = ['scaling', 'cleaning', 'root canal', 'implant', 'whitening', 'crown', 'filling', 'braces', 'wisdom']
-    has_service = any(s in msg_lower for s in service_words)
-    return has_booking_verb and has_service
+    return "service" in features.booking_signals
 
 # Auth Helpers
 def get_user_id_from_jwt(request: Request):
@@ -214,27 +196,7 @@ def get_user_id_from_jwt(request: Request):
     token = auth_header.split(' ')[1]
 
     try:
-        unverified_header = jwt.get_unverified_header(token)
-        alg = unverified_header.get('alg', "HS256")
-
-        if alg == "HS256":
-            print("⚠️ Warning: Processing legacy HS256 token", flush=True)
-            payload = jwt.decode(
-                token,
-                JWT_SECRET,
-                algorithms=["HS256"],
-                audience="authenticated",
-                options={"verify_exp": True}
-            )
-        else:
-            signing_key = JWKS_CLIENT.get_signing_key_from_jwt(token)
-            payload = jwt.decode(
-                token,
-                signing_key.key,
-                algorithms=["RS256", "ES256"],
-                audience="authenticated",
-                options={"verify_exp": True}
-            )
+        payload = jwt_verifier.verify(token)
 
         user_id = payload.get('sub')
         if not user_id:
@@ -246,77 +208,129 @@ def get_user_id_from_jwt(request: Request):
         raise HTTPException(status_code=401, detail=f"Invalid token: {e}")
 
 # Session Helpers
+# Reads go through a per-worker LRU+TTL cache; writes go to Supabase and then the cache (write-through).
+# With SESSION_DELTA_MODE, turns are persisted as append-only deltas (see services/session_delta.py).
+# With SESSION_STORAGE_FORMAT=compact, rows are stored windowed with clinics by reference (services/session_format.py).
+session_cache = SessionCache()
+clinic_catalog = ClinicCatalog(supabase)
+faq_index = FaqIndex(supabase)  # travel FAQ embeddings, searched in-process (services/faq_index.py)
+COMPACT_SESSIONS = SESSION_STORAGE_FORMAT == "compact"
+
+def encode_session_columns(context: dict, conversation_history: list):
+    # Deltas patch individual state keys server-side, so they are never compressed into one blob.
+    if not COMPACT_SESSIONS:
+        return context, conversation_history
+    return encode_session(context, conversation_history, compression="none" if SESSION_DELTA_MODE else None)
+
 def create_session(user_id: str) -> Optional[str]:
     session_id = str(uuid4())
     try:
         supabase.table("sessions").insert({"session_id": session_id, "state": {}, "user_id": user_id}).execute()
+        session_cache.put(session_id, user_id, {"session_id": session_id, "user_id": user_id, "state": {}, "context": []})
         return session_id
     except Exception as e:
         logging.error(f"Error creating session: {e}")
         return None
 
 def get_session(session_id: str, user_id: str) -> Optional[dict]:
+    cached = session_cache.get(session_id, user_id)
+    if cached is not None:
+        return cached
     try:
-        response = supabase.table("sessions").select("*").eq("session_id", session_id).eq("user_id", user_id).single().execute()
-        return response.data if response.data else None
+        if SESSION_DELTA_MODE:
+            data = get_session_snapshot(supabase, session_id, user_id)
+        else:
+            data = supabase.table("sessions").select("*").eq("session_id", session_id).eq("user_id", user_id).single().execute().data
+        data = decode_row(data, clinic_catalog)
+        if data:
+            session_cache.put(session_id, user_id, data)
+        return data if data else None
     except Exception as e:
         logging.error(f"Error fetching session {session_id} for user {user_id}: {e}")
         return None
 
 def update_session(session_id: str, user_id: str, context: dict, conversation_history: list):
     try:
+        stored_state, stored_context = encode_session_columns(context, conversation_history)
         supabase.table("sessions").update({
-            "state": context,
-            "context": conversation_history
+            "state": stored_state,
+            "context": stored_context
         }).eq("session_id", session_id).eq("user_id", user_id).execute()
+        session_cache.update(session_id, user_id, state=context, context=conversation_history)
     except Exception as e:
         logging.error(f"Error updating session {session_id}: {e}")
+        session_cache.invalidate(session_id, user_id)
 
-def check_api_calls_remaining(user_id: str) -> int:
-    """Check how many API calls the user has remaining. Returns -1 if unlimited or error."""
+def update_session_delta(session_id: str, user_id: str, ops: list, context: dict, conversation_history: list):
     try:
-        response = supabase.table("user_profiles").select("api_calls_remaining").eq("id", user_id).single().execute()
-        if response.data:
-            remaining = response.data.get("api_calls_remaining")
-            if remaining is None:
-                return -1  # Unlimited
-            return int(remaining)
-        return -1  # User profile not found = unlimited
+        append_session_delta(supabase, session_id, user_id, ops)
+        session_cache.update(session_id, user_id, state=context, context=conversation_history)
     except Exception as e:
-        logging.error(f"Error checking API calls for user {user_id}: {e}")
-        return -1  # On error, allow the request (fail open)
+        logging.error(f"Error appending session delta {session_id}: {e}")
+        session_cache.invalidate(session_id, user_id)
+
+# Quota Helpers
+# Default: one atomic RPC per message (see supabase/migrations/*_consume_api_call.sql).
+# With QUOTA_LEDGER_ENABLED, decisions are made in memory and usage is flushed in batches.
+quota_store = SupabaseQuotaStore(supabase)
+quota_ledger = QuotaLedger(quota_store, max_drift=QUOTA_LEDGER_MAX_DRIFT) if QUOTA_LEDGER_ENABLED else None
+background_tasks = []
+
+# Conversation Logging (write-behind, off the request path)
+conversation_logger = ConversationLogger(supabase)
+
+# Request Prologue
+@dataclass
+class ChatPrologue:
+    user_id: str
+    session_id: str
+    session: Optional[dict]
+
+async def enforce_api_quota(user_id: str, trace_id: str):
+    """Atomically consume one API call; raise HTTP 429 when the user has none left."""
+    decision = await run_blocking(consume_api_call, quota_ledger or quota_store, user_id)
+    print(f"[trace:{trace_id}] [API LIMIT] User {user_id[:8]}... allowed={decision.allowed} remaining={decision.remaining}")
 
-def decrement_api_calls(user_id: str) -> bool:
-    """Decrement the user's API call counter. Returns True if successful, False if user has no calls left."""
+    if not decision.allowed:
+        print(f"[trace:{trace_id}] [API LIMIT] User has exhausted their API calls")
+        raise HTTPException(
+            status_code=429,
+            detail="You have reached your monthly conversation limit. Please upgrade your account or wait until next month."
+        )
+
+async def run_chat_prologue(request: Request, query: UserQuery, trace_id: str) -> ChatPrologue:
+    """
+    Authenticate, then fan out the per-request round trips that only depend on the user id:
+    quota enforcement and session loading. The user's message is queued for the write-behind logger.
+    - Auth failure raises before anything else runs.
+    - A quota failure (429) fails the request once the sibling tasks have settled.
+    - A failed session load falls back to a fresh session.
+    """
     try:
-        # First check current count
-        response = supabase.table("user_profiles").select("api_calls_remaining").eq("id", user_id).single().execute()
-        if not response.data:
-            logging.warning(f"User profile not found for {user_id}, allowing request")
-            return True
-        
-        remaining = response.data.get("api_calls_remaining")
-        if remaining is None:
-            # Null means unlimited
-            return True
-        
-        if remaining <= 0:
-            logging.warning(f"User {user_id} has no API calls remaining")
-            return False
-        
-        # Decrement the counter
-        new_count = remaining - 1
-        supabase.table("user_profiles").update({
-            "api_calls_remaining": new_count,
-            "updated_at": "now()"
-        }).eq("id", user_id).execute()
-        
-        logging.info(f"✅ Decremented API calls for user {user_id}: {remaining} -> {new_count}")
-        return True
-        
-    except Exception as e:
-        logging.error(f"Error decrementing API calls for user {user_id}: {e}")
-        return True  # On error, allow the request (fail open)
+        user_id = await run_blocking(get_user_id_from_jwt, request)
+    except HTTPException as e:
+        print(f"[trace:{trace_id}] [ERROR] Auth failed: {e.detail}")
+        raise e
+
+    session_id = query.session_id
+    tasks = [
+        enforce_api_quota(user_id, trace_id),
+        run_blocking(get_session, session_id, user_id) if session_id else asyncio.sleep(0, result=None),
+    ]
+    quota_result, session_result = await asyncio.gather(*tasks, return_exceptions=True)
+
+    if isinstance(quota_result, BaseException):
+        raise quota_result
+    if query.history:
+        conversation_logger.log(user_id, "user", query.history[-1].content)
+    session = None if isinstance(session_result, BaseException) else session_result
+    if isinstance(session_result, BaseException):
+        logging.error(f"Error loading session {session_id}: {session_result}")
+
+    if not session:
+        session_id = await run_blocking(create_session, user_id)
+        if not session_id: raise HTTPException(status_code=500, detail="Could not create a new session.")
+    return ChatPrologue(user_id=user_id, session_id=session_id, session=session)
 
 # --- 6. ENDPOINTS ---
 
@@ -328,6 +342,52 @@ def read_root():
 def health():
     return {"status": "ok", "version": os.getenv("RELEASE", "local"), "environment": os.getenv("ENVIRONMENT", "dev")}
 
+@app.get("/metrics")
+def metrics():
+    return {
+        "quota_ledger": quota_ledger.stats() if quota_ledger else None,
+        "conversation_logger": conversation_logger.stats(),
+        "session_cache": session_cache.stats(),
+        "clinic_catalog": clinic_catalog.stats(),
+        "faq_index": faq_index.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "sentiment_lexicon": SENTIMENT_SCORER.stats(),
+        "jwt": jwt_verifier.stats(),
+        "routing_rules": routing_rules.ROUTER.stats(),
+        "gatekeeper": gatekeeper_stats.stats(),
+        "gatekeeper_cache": gatekeeper_cache.stats(),
+        "travel_speculation": speculation_stats(),
+        "travel_answers": answer_tier_stats(),
+        "deadline": deadline_stats(),
+    }
+
+@app.on_event("startup")
+async def on_startup():
+    conversation_logger.start()
+    keys = await run_blocking(jwt_verifier.refresh_jwks)
+    print(f"[JWKS] Prefetched {keys} signing key(s)", flush=True)
+    background_tasks.append(asyncio.create_task(run_jwks_refresh_loop(jwt_verifier)))
+    if faq_index.enabled:
+        await run_blocking(faq_index.load)
+        background_tasks.append(asyncio.create_task(run_faq_refresh_loop(faq_index)))
+    if SENTIMENT_SCORER.stale_fields:
+        background_tasks.append(asyncio.create_task(
+            run_sentiment_refresh_loop(SENTIMENT_SCORER, SENTIMENT_INTENTS, embed_sentiment_text)))
+    if quota_ledger:
+        background_tasks.append(asyncio.create_task(run_flush_loop(quota_ledger, QUOTA_LEDGER_FLUSH_SECONDS)))
+    if SESSION_DELTA_MODE:
+        background_tasks.append(asyncio.create_task(run_compaction_loop(supabase)))
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    for task in background_tasks:
+        task.cancel()
+    await conversation_logger.close()
+    if quota_ledger:
+        flushed = await run_blocking(quota_ledger.flush)
+        print(f"[QUOTA LEDGER] Flushed {flushed} pending call(s) on shutdown", flush=True)
+    shutdown_executor(wait=True)
+
 @app.post("/restore_session")
 async def restore_session(request: Request, query: SessionRestoreQuery):
     """
@@ -335,9 +395,9 @@ async def restore_session(request: Request, query: SessionRestoreQuery):
     Requires valid JWT token in X-Authorization header.
     """
     # SECURITY: No fallback authentication - JWT required
-    user_id = get_user_id_from_jwt(request)
+    user_id = await run_blocking(get_user_id_from_jwt, request)
     
-    session = get_session(query.session_id, user_id)
+    session = await run_blocking(get_session, query.session_id, user_id)
     if session:
         state = session.get("state") or {}
         context = session.get("context") or []
@@ -357,50 +417,110 @@ async def restore_session(request: Request, query: SessionRestoreQuery):
         raise HTTPException(status_code=404, detail="Session not found.")
 
 @app.post("/chat")
-async def handle_chat(request: Request, query: UserQuery, response: Response):
-    trace_id = str(uuid4())
-    print(f"\n--- [trace:{trace_id}] NEW /CHAT REQUEST RECEIVED ---", flush=True)
-    
-    # 1. AUTHENTICATION
-    try:
-        secure_user_id = get_user_id_from_jwt(request)
-    except HTTPException as e:
-        print(f"[trace:{trace_id}] [ERROR] Auth failed: {e.detail}")
-        raise e
+async def chat(request: Request, query: UserQuery, response: Response, background_tasks: BackgroundTasks):
+    return await run_chat_with_deadline(request, query, response, background_tasks)
 
-    # 2. API CALL LIMIT CHECK
-    remaining_calls = check_api_calls_remaining(secure_user_id)
-    print(f"[trace:{trace_id}] [API LIMIT] User {secure_user_id[:8]}... has {remaining_calls} calls remaining")
-    
-    if remaining_calls == 0:
-        print(f"[trace:{trace_id}] [API LIMIT] User has exhausted their API calls")
-        raise HTTPException(
-            status_code=429, 
-            detail="You have reached your monthly conversation limit. Please upgrade your account or wait until next month."
-        )
-    
-    # Decrement the counter
-    if not decrement_api_calls(secure_user_id):
-        raise HTTPException(
-            status_code=429,
-            detail="You have reached your monthly conversation limit."
+
+async def run_chat_with_deadline(request: Request, query: UserQuery, response: Response,
+                                 background_tasks: BackgroundTasks, token_sink: Optional[TokenSink] = None):
+    """handle_chat under a per-request Deadline; the stages degrade within it, this is the hard backstop."""
+    deadline = Deadline()
+    try:
+        return await asyncio.wait_for(
+            handle_chat(request, query, response, background_tasks, token_sink=token_sink, deadline=deadline),
+            timeout=deadline.remaining(),
         )
+    except asyncio.TimeoutError:
+        record_degradation("request")
+        # The turn was cut off mid-way: keep the session as it was, but report the id it resolved to.
+        chat_session = getattr(request.state, "chat_session", None)
+        if chat_session is not None:
+            chat_session.discard()
+        response.status_code = 504
+        return {"response": "I'm sorry, that took longer than expected. Please try again in a moment.",
+                "session_id": chat_session.session_id if chat_session is not None else query.session_id,
+                "meta": {"type": "timeout"}}
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request, query: UserQuery, response: Response, background_tasks: BackgroundTasks):
+    """/chat as server-sent events.
+
+    `token` events carry text chunks as the flow's final LLM generation streams. One `done` event
+    follows with the full response body (response, candidate_pool, applied_filters, meta,
+    session_id, ...); its `response` is authoritative and may differ from the concatenated tokens
+    (disclaimers, fallbacks). Flows without a generation step send their reply as a single token.
+    The session is committed after the stream completes.
+    """
+    sink = TokenSink()
 
-    # 3. SESSION LOADING
-    session_id = query.session_id
-    session = get_session(session_id, secure_user_id) if session_id else None
-    if not session:
-        session_id = create_session(secure_user_id)
-        if not session_id: raise HTTPException(status_code=500, detail="Could not create a new session.")
-        state = {}
-    else:
-        state = session.get("state") or {}
+    async def run():
+        try:
+            return await run_chat_with_deadline(request, query, response, background_tasks, token_sink=sink)
+        finally:
+            sink.close()
+
+    task = asyncio.create_task(run())
+    # Wait for the first token or the whole turn, so auth/quota errors still surface as HTTP status codes.
+    first_token = asyncio.create_task(sink.started.wait())
+    await asyncio.wait({task, first_token}, return_when=asyncio.FIRST_COMPLETED)
+    first_token.cancel()
+    if task.done() and not task.cancelled() and task.exception() is not None:
+        raise task.exception()
+
+    async def events():
+        async for text in sink:
+            yield sse_event("token", {"text": text})
+        try:
+            response_data = await task
+        except (Exception, asyncio.CancelledError) as e:
+            logging.error(f"[STREAM] Chat turn failed mid-stream: {e!r}")
+            detail = e.detail if isinstance(e, HTTPException) else "Internal error"
+            yield sse_event("error", {"detail": detail})
+            return
+        if not sink.tokens and response_data.get("response"):
+            yield sse_event("token", {"text": response_data["response"]})
+        yield sse_event("done", response_data)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **dict(response.headers)}
+    headers.pop("content-length", None)
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers, background=background_tasks)
+
+
+async def handle_chat(request: Request, query: UserQuery, response: Response, background_tasks: BackgroundTasks,
+                      token_sink: Optional[TokenSink] = None, deadline: Optional[Deadline] = None):
+    trace_id = str(uuid4())
+    print(f"\n--- [trace:{trace_id}] NEW /CHAT REQUEST RECEIVED ---", flush=True)
+    deadline = deadline or Deadline()
+    # Set up front: /chat/stream copies the headers as soon as the first token arrives.
+    response.headers["X-Request-Id"] = trace_id
+    response.headers["X-API-Version"] = os.getenv("RELEASE", "local")
+    
+    # 1-3. AUTHENTICATION, API CALL LIMIT, SESSION LOADING (concurrent prologue)
+    prologue = await run_chat_prologue(request, query, trace_id)
+    secure_user_id = prologue.user_id
+    session_id = prologue.session_id
+    session = prologue.session
+    state = (session.get("state") or {}) if session else {}
+
+    # Every branch below only stages session changes; one write is committed after the response is sent.
+    chat_session = SessionUnitOfWork(
+        session_id, secure_user_id, update_session, cache=session_cache,
+        delta_writer=update_session_delta if SESSION_DELTA_MODE else None,
+        baseline=(state, (session.get("context") or []) if session else []),
+        encode=encode_session_columns,
+    )
+    background_tasks.add_task(chat_session.commit)
+    request.state.chat_session = chat_session  # run_chat_with_deadline discards it on timeout
 
     if not query.history: return {"response": "Error: History is empty.", "session_id": session_id}
 
     conversation_history = query.history
     latest_user_message = conversation_history[-1].content
-    lower_msg = latest_user_message.lower()
+    # Analyzed once per turn (flows/message_features.py); the flows reuse the same object.
+    features = message_features.analyze(latest_user_message)
+    lower_msg = features.lower
+    routing = features.rules
 
     # Frontend sometimes reuses an old session_id but sends a brand new history
     # (only the latest user turn). Treat that as authoritative signal to drop
@@ -420,15 +540,8 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
     candidate_clinics = state.get("candidate_pool", [])
     booking_context = state.get("booking_context", {})
 
-    # Log User Message
-    try:
-        add_conversation_message(supabase, secure_user_id, "user", latest_user_message)
-    except Exception as e:
-        logging.error(f"Failed to log user message: {e}")
-
     # 3. GLOBAL RESET CHECK
-    reset_triggers = ["reset", "reset:", "reset -", "reset please", "start over", "restart", "new search"]
-    if any(lower_msg.startswith(rt) for rt in reset_triggers):
+    if "reset" in routing:
         print(f"[trace:{trace_id}] [INFO] Global reset requested.")
         state["applied_filters"] = {}
         state["candidate_pool"] = []
@@ -441,16 +554,14 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
             "meta": {"type": "location_prompt", "options": [{"key": "jb", "label": "JB"}, {"key": "sg", "label": "SG"}, {"key": "both", "label": "Both"}]},
             "applied_filters": {}, "candidate_pool": [], "booking_context": {}
         }
-        updated_history = [msg.dict() for msg in query.history]
-        updated_history.append({"role": "assistant", "content": response_data["response"]})
-        update_session(session_id, secure_user_id, state, updated_history)
+        chat_session.stage(state, query.history, assistant_reply=response_data["response"])
         response_data["session_id"] = session_id
         return response_data
 
     # 4. GLOBAL LOCATION PREPROCESSING
     # If awaiting location and user sends a pure location term, capture it before routing
     if state.get("awaiting_location"):
-        inferred_location = normalize_location_terms(latest_user_message)
+        inferred_location = features.location
         if inferred_location:
             state["location_preference"] = inferred_location
             state.pop("awaiting_location", None)
@@ -460,50 +571,34 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
                 "response": f"Great! I'll search for clinics in {inferred_location.upper()}. What service are you looking for? (e.g., scaling, root canal, braces)",
                 "applied_filters": {}, "candidate_pool": [], "booking_context": {}
             }
-            updated_history = [msg.model_dump() for msg in query.history]
-            updated_history.append({"role": "assistant", "content": response_data["response"]})
             # Save location preference to database
-            update_session(session_id, secure_user_id, state, updated_history)
+            chat_session.stage(state, query.history, assistant_reply=response_data["response"])
             response_data["session_id"] = session_id
             return response_data
 
     # --- 5. ROUTING LOGIC (RE-ORDERED WITH ENHANCEMENTS) ---
     intent = None
     gatekeeper_decision = None
+    travel_prefetch = None  # speculative retrieve_travel_faqs() task started alongside the gatekeeper
 
     # A. Check for travel intent FIRST (Priority #1 - before ordinal)
     # If query has both ordinal reference AND travel keywords, it's a travel query
-    travel_keywords = [
-        "how to get", "get to", "directions", "route", "from singapore", "from sg",
-        "to johor", "to jb", "causeway", "second link", "bus", "train", "ktm",
-        "checkpoint", "immigration", "customs", "woodlands", "tuas", "shuttle", "cw",
-        "transport", "travel", "commute", "prepare", "preparation", "mistakes", "common mistakes"
-    ]
-    has_travel_intent = any(k in lower_msg for k in travel_keywords)
+    has_travel_intent = "travel" in routing
     
     # V9 FIX 4: Check for educational queries BEFORE routing
-    educational_patterns = [
-        r"what is", r"what are", r"what's", r"whats", r"define", 
-        r"tell me about", r"explain", r"can you explain", r"meaning of",
-        r"what does .+ mean"
-    ]
-    is_educational = any(re.search(pattern, lower_msg, re.IGNORECASE) for pattern in educational_patterns)
+    is_educational = "educational" in routing
     if is_educational:
         # Check if asking about a service/treatment (not a clinic or location)
-        dental_terms = ["root canal", "scaling", "braces", "whitening", "implant", "filling", 
-                       "extraction", "crown", "veneer", "cleaning", "checkup", "bonding",
-                       "wisdom tooth", "orthodontic", "endodontic", "treatment"]
-        is_about_treatment = any(term in lower_msg for term in dental_terms)
+        is_about_treatment = "dental_term" in routing
         # Exclude if they mention clinic names or locations
-        has_clinic_or_location = any(term in lower_msg for term in ["clinic", "dentist", "singapore", "jb", "johor", "first", "second", "third"])
+        has_clinic_or_location = "clinic_or_location" in routing
         if is_about_treatment and not has_clinic_or_location:
             print(f"[trace:{trace_id}] [V9 FIX] Educational query detected - routing to QnA: {latest_user_message}")
             intent = ChatIntent.GENERAL_DENTAL_QUESTION
 
     # Detect explicit location change requests ("show me JB instead", "switch to SG")
-    location_change_triggers = ["show me", "switch to", "change to", "rather", "instead", "prefer"]
-    location_change_target = normalize_location_terms(latest_user_message)
-    has_location_change_intent = location_change_target and any(trigger in lower_msg for trigger in location_change_triggers)
+    location_change_target = features.location
+    has_location_change_intent = location_change_target and "location_change" in routing
     has_active_search_context = bool(candidate_clinics or previous_filters or state.get("last_candidate_pool"))
 
     if has_location_change_intent and has_active_search_context:
@@ -541,15 +636,14 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
             updated_booking_context["selected_clinic_name"] = ordinal_clinic.get('name')
             
             # Check if user wants to book this clinic immediately
-            booking_keywords = ["book", "appointment", "schedule", "reserve", "make an appointment", "i want to book"]
-            has_booking_intent = any(kw in lower_msg for kw in booking_keywords)
+            has_booking_intent = "ordinal_booking" in routing
             
             if has_booking_intent:
                 # User said "book the 3rd clinic" - proceed directly to booking
                 print(f"[trace:{trace_id}] [ORDINAL+BOOKING] Combined intent: booking {ordinal_clinic.get('name')}")
                 intent = ChatIntent.BOOK_APPOINTMENT
-                # Update session with resolved clinic before entering booking flow
-                update_session(session_id, secure_user_id, state, [msg.model_dump() for msg in query.history])
+                # Stage session with resolved clinic before entering booking flow (committed once at the end)
+                chat_session.stage(state, query.history)
             else:
                 # User just said "#3" or "the third one" - show details
                 response_data = {
@@ -559,27 +653,20 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
                     "booking_context": updated_booking_context,
                     "meta": {"type": "clinic_detail", "clinic": ordinal_clinic}
                 }
-                updated_history = [msg.model_dump() for msg in query.history]
-                updated_history.append({"role": "assistant", "content": response_data["response"]})
-                update_session(session_id, secure_user_id, state, updated_history)
+                chat_session.stage(state, query.history, assistant_reply=response_data["response"])
                 response_data["session_id"] = session_id
                 return response_data
 
     # C. Check for booking intent (Priority #3)
     # Early booking detection to prevent travel FAQ hijacking
-    booking_keywords = ["book", "appointment", "schedule", "reserve", "confirm", "booking"]
-    has_booking_intent = any(kw in lower_msg for kw in booking_keywords)
+    has_booking_intent = "booking" in routing
     has_booking_context = bool(candidate_clinics or booking_context.get("status"))
     
     # If user is in active booking flow, check for exit keywords FIRST
     if booking_context.get("status") in ["confirming_details", "gathering_info"]:
         # Check if user wants to cancel/exit booking
-        cancel_keywords = ["cancel", "stop", "quit", "exit", "no", "nope", "don't want", "do not want", 
-                          "abort", "changed my mind", "change my mind", "i'll call", "go back", "start over", "never mind", "nevermind"]
-        travel_keywords = ["direction", "travel", "get there", "how to go", "how do i get"]
-        
-        has_cancel_intent = any(kw in lower_msg for kw in cancel_keywords)
-        has_travel_intent_in_booking = any(kw in lower_msg for kw in travel_keywords)
+        has_cancel_intent = "booking_cancel" in routing
+        has_travel_intent_in_booking = "booking_travel" in routing
         
         if has_cancel_intent and not has_booking_intent:
             print(f"[trace:{trace_id}] [BOOKING] User wants to cancel - clearing booking context.")
@@ -615,60 +702,73 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
         should_run_gatekeeper = not (has_travel_intent or has_booking_intent or has_location_change_intent)
         
         if should_run_gatekeeper:
-            try:
-                gate_prompt = f"""
-                You are an intent gatekeeper. Classify the user's latest message into one of:
-                FIND_CLINIC, BOOK_APPOINTMENT, CANCEL_BOOKING, GENERAL_DENTAL_QUESTION, REMEMBER_SESSION, TRAVEL_FAQ, OUT_OF_SCOPE.
-                Return JSON: {{"intent": "...", "confidence": 0.0}}
-                History:
-                {query.history}
-                Latest: "{latest_user_message}"
-                """
-                resp = gatekeeper_model.generate_content(gate_prompt)
-                text = (resp.text or "").strip()
-                import json as _json
-                parsed = _json.loads(text) if text.startswith("{") else {}
-                gate_intent = parsed.get("intent")
-                gate_conf = float(parsed.get("confidence", 0))
-                gatekeeper_decision = {"intent": gate_intent, "confidence": gate_conf}
-                print(f"[trace:{trace_id}] [Gatekeeper] intent={gate_intent} conf={gate_conf:.2f}")
-                # Accept gatekeeper decision only if high confidence
-                if gate_intent in [i.value for i in ChatIntent] and gate_conf >= 0.7:
-                    intent = ChatIntent(gate_intent)
-            except Exception as e:
-                print(f"[trace:{trace_id}] [Gatekeeper] error: {e}")
+            local_prediction = None
+            if intent_classifier is not None:
+                local_prediction = intent_classifier.predict(latest_user_message)
+                gatekeeper_stats.count("local_predictions")
+                print(f"[trace:{trace_id}] [Gatekeeper][local] intent={local_prediction.intent} "
+                      f"conf={local_prediction.confidence:.2f} accepted={local_prediction.accepted}")
+            if INTENT_CLASSIFIER_MODE == "on" and local_prediction is not None and local_prediction.accepted:
+                gatekeeper_stats.count("local_accepted")
+                gatekeeper_decision = {"intent": local_prediction.intent, "confidence": local_prediction.confidence,
+                                       "source": "local"}
+                intent = ChatIntent(local_prediction.intent)
+            else:
+                # Speculation: start the cheap travel retrieval now so a TRAVEL_FAQ verdict costs one round trip.
+                if SPECULATIVE_TRAVEL_RETRIEVAL and not gatekeeper_cache.contains(latest_user_message, state) \
+                        and is_travel_candidate(latest_user_message):
+                    travel_prefetch = asyncio.ensure_future(
+                        run_blocking(retrieve_travel_faqs, latest_user_message, supabase, deadline=deadline,
+                                     faq_index=faq_index))
+                    record_speculation("launched")
+                try:
+                    decision, from_cache = await asyncio.wait_for(
+                        decide_with_llm(gatekeeper_model, query.history, latest_user_message,
+                                        state=state, cache=gatekeeper_cache),
+                        timeout=deadline.slice(GATEKEEPER_SLICE),
+                    )
+                    if not from_cache:
+                        gatekeeper_stats.count("llm_calls")
+                    gate_intent, gate_conf = decision["intent"], decision["confidence"]
+                    gatekeeper_decision = {"intent": gate_intent, "confidence": gate_conf,
+                                           "entities": decision.get("entities")}
+                    print(f"[trace:{trace_id}] [Gatekeeper] intent={gate_intent} conf={gate_conf:.2f}"
+                          f"{' (cached)' if from_cache else ''}")
+                    if local_prediction is not None and not from_cache:
+                        gatekeeper_stats.record_shadow(local_prediction, (gate_intent or "").lower())
+                        if INTENT_SHADOW_LOG:
+                            background_tasks.add_task(append_shadow_log, latest_user_message, local_prediction,
+                                                      gate_intent, gate_conf)
+                    # Accept gatekeeper decision only if high confidence
+                    if gate_intent in [i.value for i in ChatIntent] and gate_conf >= 0.7:
+                        intent = ChatIntent(gate_intent)
+                except (asyncio.TimeoutError, DeadlineExceeded):
+                    # Degraded: no decision, the keyword heuristics below pick the intent.
+                    gatekeeper_stats.count("llm_errors")
+                    record_degradation("gatekeeper")
+                except Exception as e:
+                    gatekeeper_stats.count("llm_errors")
+                    print(f"[trace:{trace_id}] [Gatekeeper] error: {e}")
         else:
             print(f"[trace:{trace_id}] [Gatekeeper] Skipped - intent already determined by heuristics.")
 
     # F. Intent Heuristics (Safety Net - Priority #6)
     if intent is None:
-        # 1) Travel override: clear travel phrasing (before QnA) - reuse travel_keywords from above
+        # 1) Travel override: clear travel phrasing (before QnA) - reuse the travel rule from above
         if has_travel_intent:
             intent = ChatIntent.TRAVEL_FAQ
         # 2) Remember session check (NEW - BEFORE QnA and search triggers)
         # Must check BEFORE search triggers because "recommend" appears in both
-        elif any(k in lower_msg for k in [
-            "remind", "recall", "remember", 
-            "what did", "what clinics", "which clinics",
-            "previous", "earlier", "before", "last time",
-            "you showed", "you recommended", "you suggested",
-            "from before", "from earlier"
-        ]):
+        elif "remember" in routing:
             print(f"[trace:{trace_id}] [INFO] Heuristic detected Remember Session intent.")
             intent = ChatIntent.REMEMBER_SESSION
         # 3) QnA shortcut: educational questions take PRIORITY over service matching
-        elif any(lower_msg.startswith(p) or f" {p}" in lower_msg for p in [
-            "what is", "what are", "tell me about", "tell me more", "explain",
-            "how does", "why is", "is it", "does", "should i", "can i",
-            "how often", "how long", "when should", "how do you", "how do i"
-        ]):
+        elif "qna_question" in routing:
             intent = ChatIntent.GENERAL_DENTAL_QUESTION
         # 4) Dental find clinic heuristics (moved to position 4)
         else:
-            search_triggers = ["find", "recommend", "suggest", "clinic", "dentist", "appointment", "nearby", "best"]
-            service_triggers = ["scaling", "cleaning", "scale", "polish", "root canal", "implant", "whitening", "crown", "filling", "braces", "wisdom", "gum", "veneers"]
-            has_search = any(k in lower_msg for k in search_triggers)
-            has_service = any(k in lower_msg for k in service_triggers)
+            has_search = "search" in routing
+            has_service = "service" in routing
             if has_search or has_service:
                 print(f"[trace:{trace_id}] [INFO] Heuristic detected Dental Intent (search={has_search}, service={has_service})")
                 intent = ChatIntent.FIND_CLINIC
@@ -683,9 +783,23 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
             intent = ChatIntent.BOOK_APPOINTMENT
         else:
             print(f"[trace:{trace_id}] [INFO] Engaging Semantic Travel FAQ check.")
-            travel_resp = handle_travel_query(
+            prefetched_faqs = None
+            if travel_prefetch is not None:
+                try:
+                    prefetched_faqs = await asyncio.wait_for(travel_prefetch, timeout=deadline.slice(RETRIEVAL_SLICE))
+                    record_speculation("used")
+                except (asyncio.TimeoutError, DeadlineExceeded):
+                    # handle_travel_query retrieves (or degrades) on its own within what is left
+                    record_degradation("travel_prefetch")
+                travel_prefetch = None
+            travel_resp = await run_blocking(
+                handle_travel_query,
                 user_query=latest_user_message,
-                supabase_client=supabase
+                supabase_client=supabase,
+                matching_faqs=prefetched_faqs,
+                token_sink=token_sink,
+                deadline=deadline,
+                faq_index=faq_index
             )
 
             if travel_resp:
@@ -696,16 +810,15 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
                 response_data["candidate_pool"] = response_data.get("candidate_pool", candidate_clinics)
                 response_data["booking_context"] = response_data.get("booking_context", booking_context)
                 # --- Standard Response Saving ---
-                updated_history = [msg.model_dump() for msg in query.history]
-                updated_history.append({"role": "assistant", "content": response_data["response"]})
-                try:
-                    add_conversation_message(supabase, secure_user_id, "assistant", response_data["response"])
-                except Exception as e:
-                    logging.error(f"Failed to log assistant message: {e}")
-                update_session(session_id, secure_user_id, state, updated_history)
+                conversation_logger.log(secure_user_id, "assistant", response_data["response"])
+                chat_session.stage(state, query.history, assistant_reply=response_data["response"])
                 response_data["session_id"] = session_id
                 return response_data
 
+    if travel_prefetch is not None:
+        # Not a travel turn after all; the retrieval finishes on the pool and its result is dropped.
+        record_speculation("discarded")
+
     # G. Fallback Intent
     if intent is None:
         intent = ChatIntent.GENERAL_DENTAL_QUESTION
@@ -725,9 +838,7 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
                 "meta": {"type": "location_prompt", "options": [{"key": "jb", "label": "JB"}, {"key": "sg", "label": "SG"}, {"key": "both", "label": "Both"}]},
                 "applied_filters": {}, "candidate_pool": [], "booking_context": {}
             }
-            updated_history = [msg.model_dump() for msg in query.history]
-            updated_history.append({"role": "assistant", "content": response_data["response"]})
-            update_session(session_id, secure_user_id, state, updated_history)
+            chat_session.stage(state, query.history, assistant_reply=response_data["response"])
             response_data["session_id"] = session_id
             return response_data
 
@@ -757,7 +868,7 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
         elif is_awaiting_location:
             print(f"[trace:{trace_id}] Awaiting location response - preserving location preference.")
         
-        inferred = normalize_location_terms(latest_user_message)
+        inferred = features.location
         if inferred:
             state["location_preference"] = inferred
             location_pref = inferred
@@ -782,17 +893,21 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
                     "meta": {"type": "location_prompt", "options": [{"key": "jb", "label": "JB"}, {"key": "sg", "label": "SG"}, {"key": "both", "label": "Both"}]},
                     "applied_filters": {}, "candidate_pool": [], "booking_context": {}
                 }
-                updated_history = [msg.model_dump() for msg in query.history]
-                updated_history.append({"role": "assistant", "content": response_data["response"]})
-                update_session(session_id, secure_user_id, state, updated_history)
+                chat_session.stage(state, query.history, assistant_reply=response_data["response"])
                 response_data["session_id"] = session_id
                 return response_data
 
         # Execute Find Clinic
         effective_history = query.history
         if state.get("hard_reset_active"): effective_history = [query.history[-1]]
-
-        response_data = handle_find_clinic(
+        # Entities from the fused gatekeeper call (GATEKEEPER_FUSED_EXTRACTION) replace the flow's own
+        # extraction; not after a hard reset, since they were extracted against the full history.
+        fused_entities = None
+        if gatekeeper_decision and not state.get("hard_reset_active"):
+            fused_entities = gatekeeper_decision.get("entities")
+
+        response_data = await run_blocking(
+            handle_find_clinic,
             latest_user_message,
             effective_history,
             previous_filters,
@@ -803,17 +918,21 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
             generation_model,
             supabase,
             ["reset", "start over"],
-            session_state=state
+            session_state=state,
+            features=features,
+            extracted_entities=fused_entities,
+            token_sink=token_sink,
+            deadline=deadline
         )
 
     elif intent == ChatIntent.BOOK_APPOINTMENT:
-        response_data = handle_booking_flow(latest_user_message, booking_context, previous_filters, candidate_clinics, factual_brain_model, state)
+        response_data = await run_blocking(handle_booking_flow, latest_user_message, booking_context, previous_filters, candidate_clinics, factual_brain_model, state)
 
     elif intent == ChatIntent.CANCEL_BOOKING:
         response_data = {"response": "Okay, I've cancelled that booking request. How else can I help you today?", "booking_context": {}}
 
     elif intent == ChatIntent.GENERAL_DENTAL_QUESTION:
-        response_data = handle_qna(latest_user_message, generation_model)
+        response_data = await run_blocking(handle_qna, latest_user_message, generation_model, token_sink=token_sink, deadline=deadline)
         # Preserve candidate pool and filters through QnA
         response_data["applied_filters"] = response_data.get("applied_filters", previous_filters)
         response_data["candidate_pool"] = response_data.get("candidate_pool", candidate_clinics)
@@ -853,15 +972,9 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
     if state.get("hard_reset_active"):
         new_state["hard_reset_active"] = False
 
-    updated_history = [msg.model_dump() for msg in query.history]
     if response_data.get("response"):
-        updated_history.append({"role": "assistant", "content": response_data["response"]})
-        try:
-            add_conversation_message(supabase, secure_user_id, "assistant", response_data["response"])
-        except Exception as e:
-            logging.error(f"Failed to log assistant message: {e}")
-
-    update_session(session_id, secure_user_id, new_state, updated_history)
+        conversation_logger.log(secure_user_id, "assistant", response_data["response"])
+    chat_session.stage(new_state, query.history, assistant_reply=response_data.get("response"))
     response_data["session_id"] = session_id
 
     # Debug Meta
@@ -878,7 +991,4 @@ async def handle_chat(request: Request, query: UserQuery, response: Response):
         else:
             response_data["meta"] = {"debug": debug_payload}
 
-    response.headers["X-Request-Id"] = trace_id
-    response.headers["X-API-Version"] = os.getenv("RELEASE", "local")
-
     return response_data
\ No newline at end of file
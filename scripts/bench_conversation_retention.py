@@ -0,0 +1,76 @@
+"""Benchmark: per-message cost of conversation history retention as history grows.
+
+Compares the two strategies used for MESSAGE_LIMIT_PER_USER:
+
+- legacy: select every `id,created_at` row for the user (ordered), delete the overflow, insert
+  (the original services/session_service.add_conversation_message)
+- ring:   bump the per-user cursor and upsert slot `seq % limit`
+  (append_conversation_messages in supabase/migrations/*_conversation_ring_buffer.sql)
+
+Both strategies are replayed against an in-memory model of the `conversations` table that
+counts the rows each append has to move between the database and the app. Wall time per
+append is measured on the model, so absolute numbers are only indicative; the trend matters.
+
+Run with:
+    python scripts/bench_conversation_retention.py
+"""
+import itertools
+import time
+
+HISTORY_SIZES = [100, 1_000, 10_000, 50_000]
+APPENDS = 500
+
+
+class LegacyTable:
+    def __init__(self):
+        self.rows = {}
+        self.ids = itertools.count()
+        self.rows_transferred = 0
+
+    def append(self, user_id, message, limit):
+        history = sorted(self.rows.setdefault(user_id, []), key=lambda r: r["created_at"])
+        self.rows_transferred += len(history)
+        if len(history) >= limit:
+            stale = {r["id"] for r in history[:len(history) - limit + 1]}
+            self.rows[user_id] = [r for r in self.rows[user_id] if r["id"] not in stale]
+        n = next(self.ids)
+        self.rows[user_id].append({"id": n, "created_at": n, "message": message})
+        self.rows_transferred += 1
+
+
+class RingTable:
+    def __init__(self):
+        self.cursors = {}
+        self.slots = {}
+        self.rows_transferred = 0
+
+    def append(self, user_id, message, limit):
+        seq = self.cursors.get(user_id, 0)
+        self.cursors[user_id] = seq + 1
+        self.slots.setdefault(user_id, {})[seq % limit] = {"created_at": seq, "message": message}
+        self.rows_transferred += 1
+
+
+def bench(table_cls, history):
+    table = table_cls()
+    for i in range(history):
+        table.append("heavy-user", f"m{i}", history)
+    table.rows_transferred = 0
+    start = time.perf_counter()
+    for i in range(APPENDS):
+        table.append("heavy-user", f"new{i}", history)
+    elapsed = time.perf_counter() - start
+    return elapsed / APPENDS * 1e6, table.rows_transferred / APPENDS
+
+
+def main():
+    print(f"{'history':>8} | {'legacy us/msg':>13} {'rows/msg':>9} | {'ring us/msg':>11} {'rows/msg':>9}")
+    print("-" * 60)
+    for history in HISTORY_SIZES:
+        legacy_us, legacy_rows = bench(LegacyTable, history)
+        ring_us, ring_rows = bench(RingTable, history)
+        print(f"{history:>8} | {legacy_us:>13.1f} {legacy_rows:>9.0f} | {ring_us:>11.2f} {ring_rows:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
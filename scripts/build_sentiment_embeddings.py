@@ -0,0 +1,71 @@
+"""Build the sentiment dimension embeddings artifact loaded by flows/find_clinic_flow.py at import.
+
+Embeds every SENTIMENT_INTENTS description (flows/sentiment_lexicon.py) with the runtime model and
+task type and writes:
+- data/sentiment/sentiment_intents.npy    (n_dimensions, dim) float32 matrix, one row per field
+- data/sentiment/sentiment_intents.json   version, model, field order and a hash of each description
+
+At startup a row is used only if its description hash still matches; edited or new dimensions are
+embedded in the background until this script is re-run.
+
+The artifact is committed: .github/workflows/sentiment_artifacts.yml rebuilds and commits it when
+SENTIMENT_INTENTS changes (Vercel deploys the repository as-is), and build.sh runs the script with
+--if-stale on Render, failing the build if it cannot produce a current artifact. --if-stale skips
+the API calls when every row is current for the configured model.
+
+Run with:
+    python scripts/build_sentiment_embeddings.py [--if-stale] [--output data/sentiment/sentiment_intents.npy]
+"""
+import argparse
+import json
+import os
+import pathlib
+import sys
+from datetime import date
+
+from dotenv import load_dotenv
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+from flows.sentiment_lexicon import (SENTIMENT_EMBEDDINGS_PATH, SENTIMENT_INTENTS, description_hash,
+                                     load_dimension_embeddings, metadata_path, save_dimension_embeddings)
+
+load_dotenv()
+
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+TASK_TYPE = "retrieval_query"
+
+
+def is_current(path) -> bool:
+    try:
+        with open(metadata_path(path), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return meta.get("model") == EMBEDDING_MODEL_NAME and meta.get("task_type") == TASK_TYPE \
+        and len(load_dimension_embeddings(SENTIMENT_INTENTS, path)) == len(SENTIMENT_INTENTS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--if-stale", action="store_true", help="skip if every row is already current")
+    parser.add_argument("--output", default=SENTIMENT_EMBEDDINGS_PATH)
+    args = parser.parse_args()
+
+    if args.if_stale and is_current(args.output):
+        print(f"Sentiment embeddings {args.output} are current, skipping")
+        return
+
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    embeddings = {
+        field: genai.embed_content(model=EMBEDDING_MODEL_NAME, content=text, task_type=TASK_TYPE)["embedding"]
+        for field, text in SENTIMENT_INTENTS.items()
+    }
+    version = f"{date.today().isoformat()}-{description_hash(json.dumps(SENTIMENT_INTENTS, sort_keys=True))}"
+    save_dimension_embeddings(SENTIMENT_INTENTS, embeddings, EMBEDDING_MODEL_NAME, TASK_TYPE, version, args.output)
+    print(f"Wrote {len(embeddings)} sentiment embeddings (version {version}) to {args.output} and {metadata_path(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
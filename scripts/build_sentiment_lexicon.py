@@ -0,0 +1,132 @@
+"""Build the adjective -> sentiment-dimension lexicon used by detect_sentiment_intent (flows/sentiment_lexicon.py).
+
+Vocabulary: data/sentiment/adjective_vocabulary.txt plus the words of every SENTIMENT_INTENTS
+description.
+
+Scores (default): each word is embedded with the runtime model and task type, and its cosine
+similarity to each SENTIMENT_INTENTS description embedding is stored (rounded to 4 decimals).
+At runtime a known word is a dict lookup; the threshold in detect_sentiment_intent applies unchanged.
+
+--lexical needs no API access: each description word scores 1.0 on its own dimension(s) and 0
+elsewhere, and the vocabulary file is ignored. These scores are not comparable with the cosine
+threshold, so the runtime ignores a lexical artifact unless SENTIMENT_LEXICON_ALLOW_LEXICAL is set;
+use it for local development only.
+
+--if-stale skips the build when the existing artifact is an embedding build of the current
+SENTIMENT_INTENTS and vocabulary. The artifact is committed: .github/workflows/sentiment_artifacts.yml
+rebuilds and commits it when either changes (Vercel deploys the repository as-is), and build.sh runs
+the script with --if-stale on Render, failing the build if it cannot produce a current lexicon.
+
+Run with:
+    python scripts/build_sentiment_lexicon.py [--lexical] [--if-stale] [--vocabulary FILE] [--output FILE]
+"""
+import argparse
+import hashlib
+import json
+import os
+import pathlib
+import sys
+from datetime import date
+
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+from flows.sentiment_lexicon import SENTIMENT_INTENTS, SENTIMENT_LEXICON_PATH
+
+load_dotenv()
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+VOCABULARY_PATH = ROOT / "data" / "sentiment" / "adjective_vocabulary.txt"
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+TASK_TYPE = "retrieval_query"
+# Description words that are not quality adjectives on their own
+NON_ADJECTIVES = {"no", "pain", "discomfort", "minimal", "touch", "light", "loving", "staff", "wait", "time",
+                  "short", "good", "deal"}
+
+
+def description_words():
+    """word -> dimensions whose description lists it."""
+    words = {}
+    for field, text in SENTIMENT_INTENTS.items():
+        for word in text.lower().split():
+            if word not in NON_ADJECTIVES:
+                words.setdefault(word, []).append(field)
+    return words
+
+
+def read_vocabulary(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip().lower() for line in f if line.strip() and not line.startswith("#")]
+
+
+def lexical_scores(fields):
+    return {word: [1.0 if f in dims else 0.0 for f in fields] for word, dims in description_words().items()}
+
+
+def embedding_scores(fields, vocabulary):
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+    def embed(text):
+        vector = np.asarray(genai.embed_content(model=EMBEDDING_MODEL_NAME, content=text, task_type=TASK_TYPE)["embedding"], dtype=np.float32)
+        return vector / np.linalg.norm(vector)
+
+    matrix = np.stack([embed(SENTIMENT_INTENTS[f]) for f in fields])
+    words = sorted(set(vocabulary) | set(description_words()))
+    scores = {}
+    for i, word in enumerate(words, 1):
+        scores[word] = [round(float(s), 4) for s in matrix @ embed(word)]
+        if i % 25 == 0:
+            print(f"  embedded {i}/{len(words)}")
+    return scores
+
+
+def short_hash(value) -> str:
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def is_current(path, intents_hash, vocabulary_hash) -> bool:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return (artifact.get("source") == "embedding" and artifact.get("model") == EMBEDDING_MODEL_NAME
+            and artifact.get("intents_hash") == intents_hash and artifact.get("vocabulary_hash") == vocabulary_hash)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lexical", action="store_true", help="description words only, no embedding API")
+    parser.add_argument("--if-stale", action="store_true", help="skip if the artifact is already current")
+    parser.add_argument("--vocabulary", default=str(VOCABULARY_PATH))
+    parser.add_argument("--output", default=SENTIMENT_LEXICON_PATH)
+    args = parser.parse_args()
+
+    fields = list(SENTIMENT_INTENTS)
+    vocabulary = read_vocabulary(args.vocabulary)
+    intents_hash, vocabulary_hash = short_hash(SENTIMENT_INTENTS), short_hash(sorted(set(vocabulary)))
+    if args.if_stale and not args.lexical and is_current(args.output, intents_hash, vocabulary_hash):
+        print(f"Sentiment lexicon {args.output} is current, skipping")
+        return
+    words = lexical_scores(fields) if args.lexical else embedding_scores(fields, vocabulary)
+    artifact = {
+        "version": f"{date.today().isoformat()}-{intents_hash}",
+        "source": "lexical" if args.lexical else "embedding",
+        "model": None if args.lexical else EMBEDDING_MODEL_NAME,
+        "intents_hash": intents_hash,
+        "vocabulary_hash": None if args.lexical else vocabulary_hash,
+        "fields": fields,
+        "words": dict(sorted(words.items())),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, separators=(",", ":"))
+        f.write("\n")
+    print(f"Wrote {len(words)} words ({artifact['source']}) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
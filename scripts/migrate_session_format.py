@@ -0,0 +1,83 @@
+"""Rewrite existing `sessions` rows between the legacy and compact storage formats.
+
+The app reads both formats, so this can run while it is serving traffic, before or after
+SESSION_STORAGE_FORMAT=compact is switched on. Rows already in the target format are skipped.
+Legacy clinics without an `id` cannot be stored by reference and stay inline.
+
+Run with:
+    python scripts/migrate_session_format.py --dry-run
+    python scripts/migrate_session_format.py                 # legacy -> compact
+    python scripts/migrate_session_format.py --to legacy     # compact -> legacy (rollback)
+
+Environment variables needed:
+- SUPABASE_URL
+- SUPABASE_SERVICE_ROLE_KEY
+- SESSION_CONTEXT_WINDOW / SESSION_COMPRESSION (optional, same meaning as in the app)
+"""
+import argparse
+import json
+import os
+import pathlib
+import sys
+
+from dotenv import load_dotenv
+from supabase import create_client
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+from services.clinic_catalog import ClinicCatalog
+from services.session_format import decode_session, encode_session, is_compact
+
+load_dotenv()
+
+
+def row_bytes(state, context) -> int:
+    return len(json.dumps({"state": state, "context": context}, default=str).encode("utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--to", choices=["compact", "legacy"], default="compact")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    url, key = os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+    if not url or not key:
+        raise SystemExit("Missing SUPABASE_URL or SUPABASE_SERVICE_ROLE_KEY environment variables.")
+    supabase = create_client(url, key)
+    catalog = ClinicCatalog(supabase)
+
+    scanned = rewritten = bytes_before = bytes_after = 0
+    last_id = None
+    while True:
+        query = supabase.table("sessions").select("session_id,state,context").order("session_id").limit(args.batch_size)
+        if last_id is not None:
+            query = query.gt("session_id", last_id)
+        rows = query.execute().data or []
+        if not rows:
+            break
+        for row in rows:
+            scanned += 1
+            state, context = row.get("state"), row.get("context")
+            if is_compact(state) == (args.to == "compact"):
+                continue
+            if args.to == "compact":
+                new_state, new_context = encode_session(state, context)
+            else:
+                new_state, new_context = decode_session(state, context, catalog)
+            bytes_before += row_bytes(state, context)
+            bytes_after += row_bytes(new_state, new_context)
+            rewritten += 1
+            if not args.dry_run:
+                supabase.table("sessions").update({"state": new_state, "context": new_context}) \
+                    .eq("session_id", row["session_id"]).execute()
+        last_id = rows[-1]["session_id"]
+        print(f"[MIGRATE] scanned={scanned} rewritten={rewritten}", flush=True)
+
+    verb = "would rewrite" if args.dry_run else "rewrote"
+    print(f"[MIGRATE] Done: {verb} {rewritten}/{scanned} session(s) to {args.to}; "
+          f"{bytes_before} -> {bytes_after} bytes of state+context")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Train the local intent classifier used in front of the LLM gatekeeper (flows/gatekeeper.py).
+
+Training data:
+- data/intent/seed_examples.jsonl   hand-labelled messages, incl. the V10 test question corpus
+- data/travel/*.csv                 FAQ questions, labelled travel_faq
+- --shadow-log FILE (repeatable)    gatekeeper decisions logged in shadow mode (INTENT_SHADOW_LOG);
+                                    records where the LLM was confident (>= 0.7) become labels
+
+Model: sublinear TF-IDF (word uni/bigrams + in-word char 3-grams) -> multinomial logistic
+regression, fitted with numpy. 5-fold out-of-fold predictions are used to fit a softmax
+temperature and to pick the acceptance threshold that reaches --target-precision; predictions
+below that threshold fall through to the LLM at runtime.
+
+Run with:
+    python scripts/train_intent_classifier.py [--shadow-log shadow.jsonl] [--target-precision 0.95]
+"""
+import argparse
+import csv
+import glob
+import hashlib
+import json
+import math
+import os
+import pathlib
+import sys
+from datetime import date
+
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+from flows.gatekeeper import IntentClassifier, featurize
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SEED_PATH = ROOT / "data" / "intent" / "seed_examples.jsonl"
+OUTPUT_PATH = ROOT / "data" / "intent" / "intent_classifier.json"
+LABELS = ["find_clinic", "book_appointment", "cancel_booking", "general_dental_question",
+          "remember_session", "travel_faq", "out_of_scope"]
+SHADOW_MIN_LLM_CONFIDENCE = 0.7
+
+
+def load_examples(shadow_logs):
+    examples = []
+    with open(SEED_PATH, encoding="utf-8") as f:
+        examples += [json.loads(line) for line in f if line.strip()]
+    for path in sorted(glob.glob(str(ROOT / "data" / "travel" / "*.csv"))):
+        # Some exports are cp1252; question text only needs to be approximately right.
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for row in csv.DictReader(f):
+                if row.get("question"):
+                    examples.append({"text": row["question"], "intent": "travel_faq"})
+    for path in shadow_logs:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                intent = (record.get("llm_intent") or "").lower()
+                if intent in LABELS and (record.get("llm_confidence") or 0) >= SHADOW_MIN_LLM_CONFIDENCE:
+                    examples.append({"text": record["text"], "intent": intent})
+    seen, unique = set(), []
+    for ex in examples:
+        key = ex["text"].strip().lower()
+        if key and key not in seen and ex["intent"] in LABELS:
+            seen.add(key)
+            unique.append(ex)
+    return unique
+
+
+def build_vocab(texts):
+    df = {}
+    for text in texts:
+        for term in featurize(text):
+            df[term] = df.get(term, 0) + 1
+    terms = sorted(df)
+    n = len(texts)
+    idf = np.array([math.log((1 + n) / (1 + df[t])) + 1.0 for t in terms])
+    return {t: i for i, t in enumerate(terms)}, idf
+
+
+def matrix(clf, texts):
+    X = np.zeros((len(texts), len(clf.vocab)))
+    for row, text in enumerate(texts):
+        idx, vals = clf.vectorize(text)
+        X[row, idx] = vals
+    return X
+
+
+def fit(texts, y, l2=1e-3, epochs=400, lr=0.5):
+    vocab, idf = build_vocab(texts)
+    clf = IntentClassifier(LABELS, vocab, idf, np.zeros((len(vocab), len(LABELS))), np.zeros(len(LABELS)))
+    X = matrix(clf, texts)
+    Y = np.eye(len(LABELS))[y]
+    # Class-balanced sample weights: the FAQ questions would otherwise swamp the other intents.
+    counts = np.bincount(y, minlength=len(LABELS)).astype(float)
+    sample_w = (len(y) / (len(LABELS) * np.maximum(counts, 1)))[y][:, None]
+    W, b = clf.weights, clf.bias
+    # Adam on the mean cross-entropy + L2
+    mW, vW, mb, vb = np.zeros_like(W), np.zeros_like(W), np.zeros_like(b), np.zeros_like(b)
+    for t in range(1, epochs + 1):
+        logits = X @ W + b
+        logits -= logits.max(axis=1, keepdims=True)
+        P = np.exp(logits)
+        P /= P.sum(axis=1, keepdims=True)
+        G = sample_w * (P - Y) / len(texts)
+        gW, gb = X.T @ G + l2 * W, G.sum(axis=0)
+        for param, grad, m, v in ((W, gW, mW, vW), (b, gb, mb, vb)):
+            m *= 0.9
+            m += 0.1 * grad
+            v *= 0.999
+            v += 0.001 * grad * grad
+            param -= lr * (m / (1 - 0.9 ** t)) / (np.sqrt(v / (1 - 0.999 ** t)) + 1e-8)
+    return clf
+
+
+def out_of_fold(texts, y, folds=5, seed=13):
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(texts))
+    logits = np.zeros((len(texts), len(LABELS)))
+    for k in range(folds):
+        test = order[k::folds]
+        train = np.setdiff1d(order, test)
+        clf = fit([texts[i] for i in train], y[train])
+        X = matrix(clf, [texts[i] for i in test])
+        logits[test] = X @ clf.weights + clf.bias
+    return logits
+
+
+def softmax(logits, temperature):
+    z = logits / temperature
+    z = z - z.max(axis=1, keepdims=True)
+    p = np.exp(z)
+    return p / p.sum(axis=1, keepdims=True)
+
+
+def calibrate(logits, y, target_precision):
+    temps = np.exp(np.linspace(math.log(0.1), math.log(5.0), 60))
+    nll = [-np.log(softmax(logits, t)[np.arange(len(y)), y] + 1e-12).mean() for t in temps]
+    temperature = float(temps[int(np.argmin(nll))])
+    probs = softmax(logits, temperature)
+    conf, pred = probs.max(axis=1), probs.argmax(axis=1)
+    threshold = 1.0
+    for candidate in sorted(set(np.round(conf, 4))):
+        accepted = conf >= candidate
+        if accepted.sum() and (pred[accepted] == y[accepted]).mean() >= target_precision:
+            threshold = float(candidate)
+            break
+    accepted = conf >= threshold
+    report = {
+        "oof_accuracy": round(float((pred == y).mean()), 4),
+        "coverage": round(float(accepted.mean()), 4),
+        "accepted_precision": round(float((pred[accepted] == y[accepted]).mean()), 4) if accepted.any() else None,
+    }
+    return temperature, threshold, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shadow-log", action="append", default=[])
+    parser.add_argument("--target-precision", type=float, default=0.95)
+    parser.add_argument("--output", default=str(OUTPUT_PATH))
+    args = parser.parse_args()
+
+    examples = load_examples(args.shadow_log)
+    texts = [ex["text"] for ex in examples]
+    y = np.array([LABELS.index(ex["intent"]) for ex in examples])
+    print(f"[TRAIN] {len(texts)} examples: " + ", ".join(f"{l}={int((y == i).sum())}" for i, l in enumerate(LABELS)))
+
+    temperature, threshold, report = calibrate(out_of_fold(texts, y), y, args.target_precision)
+    print(f"[TRAIN] temperature={temperature:.3f} threshold={threshold:.4f} {report}")
+
+    clf = fit(texts, y)
+    clf.temperature, clf.threshold = temperature, threshold
+    digest = hashlib.sha256(json.dumps(examples, sort_keys=True).encode("utf-8")).hexdigest()[:10]
+    clf.version = f"{date.today().isoformat()}-{digest}"
+    artifact = {**clf.to_dict(), "training": {"examples": len(texts), **report, "target_precision": args.target_precision}}
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, separators=(",", ":"))
+    print(f"[TRAIN] Wrote {args.output} ({os.path.getsize(args.output) // 1024} KB, {len(clf.vocab)} features)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+# File: services/clinic_catalog.py
+#
+# Read-through cache of clinic catalog rows, keyed by "<country>:<id>".
+# The compact session format (services/session_format.py) stores clinics by reference; this
+# rehydrates them with one `in` query per table for whatever is not already cached.
+
+import logging
+import os
+from typing import Dict, Iterable
+
+from services.lru_cache import TTLCache
+
+CLINIC_CATALOG_TTL_SECONDS = float(os.getenv("CLINIC_CATALOG_TTL_SECONDS", "3600"))
+CLINIC_CATALOG_MAX_ENTRIES = int(os.getenv("CLINIC_CATALOG_MAX_ENTRIES", "5000"))
+
+# Country code -> catalog table (matches the routing in flows/find_clinic_flow.py).
+CLINIC_TABLES = {"MY": "clinics_data", "SG": "sg_clinics"}
+
+# Fields served from the catalog; everything the frontend needs for a candidate card.
+# The two country tables do not share an exact schema (and none of it is under
+# supabase/migrations), so rows are fetched with select("*") and projected here: a column missing
+# from one table is simply absent from its rows instead of failing the whole lookup.
+CATALOG_FIELDS = ("id", "name", "address", "rating", "reviews", "operating_hours", "website_url", "township", "phone")
+
+
+def clinic_ref(clinic: dict):
+    """Stable reference for a clinic dict, or None if it cannot be looked up again."""
+    country = clinic.get("country")
+    if clinic.get("id") is None or country not in CLINIC_TABLES:
+        return None
+    return f"{country}:{clinic['id']}"
+
+
+class ClinicCatalog:
+    def __init__(self, supabase, ttl_seconds: float = CLINIC_CATALOG_TTL_SECONDS,
+                 max_entries: int = CLINIC_CATALOG_MAX_ENTRIES):
+        self.supabase = supabase
+        self._cache = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def get_many(self, refs: Iterable[str]) -> Dict[str, dict]:
+        """Rows for the given refs (missing or failed lookups are simply absent). Blocking."""
+        found, missing = {}, {}
+        for ref in dict.fromkeys(refs):
+            row = self._cache.get(ref)
+            if row is not None:
+                found[ref] = row
+                continue
+            country, _, clinic_id = ref.partition(":")
+            if country in CLINIC_TABLES:
+                missing.setdefault(country, []).append(clinic_id)
+        for country, ids in missing.items():
+            try:
+                rows = self.supabase.table(CLINIC_TABLES[country]).select("*").in_("id", ids).execute().data or []
+            except Exception as e:
+                logging.error(f"[CLINIC CATALOG] Lookup of {len(ids)} clinic(s) in {CLINIC_TABLES[country]} failed: {e}")
+                continue
+            for row in rows:
+                row = {**{k: row[k] for k in CATALOG_FIELDS if k in row}, "country": country}
+                ref = f"{country}:{row['id']}"
+                self._cache.set(ref, row)
+                found[ref] = row
+        return {ref: dict(row) for ref, row in found.items()}
+
+    def stats(self) -> dict:
+        return self._cache.stats()
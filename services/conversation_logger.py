@@ -0,0 +1,101 @@
+# File: services/conversation_logger.py
+#
+# Write-behind logging of chat turns to the `conversations` table.
+# Request handlers only enqueue (never touching the database); a background task drains the
+# queue and writes whatever has accumulated as one multi-row insert. Memory is bounded by the
+# queue size: when it is full, new messages are dropped and counted rather than slowing chat.
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+
+from services.executor import run_blocking
+from services.session_service import add_conversation_messages
+
+CONVERSATION_LOG_QUEUE_SIZE = int(os.getenv("CONVERSATION_LOG_QUEUE_SIZE", "1000"))
+CONVERSATION_LOG_BATCH_SIZE = int(os.getenv("CONVERSATION_LOG_BATCH_SIZE", "50"))
+
+
+class ConversationLogger:
+    def __init__(self, supabase, max_queue: int = CONVERSATION_LOG_QUEUE_SIZE,
+                 batch_size: int = CONVERSATION_LOG_BATCH_SIZE, writer=add_conversation_messages):
+        self.supabase = supabase
+        self.batch_size = max(1, batch_size)
+        self.writer = writer
+        self._max_queue = max_queue
+        self._queue = None
+        self._worker = None
+        self._accepting = True
+        self.counters = {"enqueued": 0, "written": 0, "dropped": 0, "batches": 0, "write_errors": 0}
+
+    def _ensure_worker(self):
+        # Created lazily so the queue binds to the running loop (also covers apps started without lifespan events).
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._max_queue)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.get_running_loop().create_task(self.run())
+
+    def start(self):
+        self._ensure_worker()
+
+    def log(self, user_id, role: str, message: str) -> bool:
+        """Enqueue one message without blocking. Must be called from the event loop. Returns False if dropped."""
+        if not self._accepting:
+            self.counters["dropped"] += 1
+            return False
+        self._ensure_worker()
+        row = {
+            "user_id": user_id,
+            "role": role,
+            "message": message,
+            # Client timestamp keeps user/assistant order even when both land in one insert.
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            logging.warning(f"[CONV LOG] Queue full ({self._max_queue}); dropped {role} message for user {user_id}")
+            return False
+        self.counters["enqueued"] += 1
+        return True
+
+    async def run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                await run_blocking(self.writer, self.supabase, batch)
+                self.counters["written"] += len(batch)
+                self.counters["batches"] += 1
+            except Exception as e:
+                self.counters["write_errors"] += 1
+                self.counters["dropped"] += len(batch)
+                logging.error(f"[CONV LOG] Failed to write batch of {len(batch)} message(s): {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def close(self, timeout: float = 10.0):
+        """Stop accepting messages and flush what is queued (graceful shutdown)."""
+        self._accepting = False
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.error(f"[CONV LOG] Shutdown flush timed out with {self._queue.qsize()} message(s) queued")
+        if self._worker:
+            self._worker.cancel()
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "queue_capacity": self._max_queue,
+        }
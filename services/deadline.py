@@ -0,0 +1,85 @@
+# File: services/deadline.py
+#
+# Per-request time budget for the chat pipeline.
+# A Deadline is created when a /chat request arrives and handed to every stage. Each LLM call gets
+# a slice of whatever budget is left (request_options={"timeout": ...} for google-generativeai,
+# asyncio.wait_for around awaited calls) and every stage has a degraded fallback for when its
+# slice runs out:
+#   gatekeeper      -> skipped, keyword heuristics decide
+#   factual brain   -> service/township heuristics from the message
+#   data formatter  -> the template renderer (flows/response_renderer.py)
+#   travel prefetch -> dropped, handle_travel_query retrieves within what is left
+#   travel answer   -> the top FAQ answer verbatim
+#   qna             -> the canned apology
+# CHAT_DEADLINE_SECONDS bounds the whole turn; main.py enforces it as a hard backstop and discards
+# the staged session write of a turn it cuts off.
+
+import os
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "25"))
+# A call is not worth starting with less than this left; the stage degrades immediately instead.
+MIN_CALL_SECONDS = float(os.getenv("CHAT_MIN_CALL_SECONDS", "1.0"))
+
+# Share of the remaining budget each stage may spend, and an absolute cap per call.
+GATEKEEPER_SLICE = (0.35, 8.0)
+EXTRACTION_SLICE = (0.35, 8.0)
+GENERATION_SLICE = (0.8, 15.0)
+RETRIEVAL_SLICE = (0.25, 5.0)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    def __init__(self, budget_seconds: float = CHAT_DEADLINE_SECONDS, clock=time.monotonic):
+        self.budget_seconds = budget_seconds
+        self.clock = clock
+        self.expires_at = clock() + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() < MIN_CALL_SECONDS
+
+    def slice(self, share_and_cap=(1.0, None)) -> float:
+        """Seconds the next call may take: `share` of the remaining budget, at most `cap`.
+
+        Raises DeadlineExceeded when too little is left to start the call at all.
+        """
+        share, cap = share_and_cap
+        remaining = self.remaining()
+        if remaining < MIN_CALL_SECONDS:
+            raise DeadlineExceeded(f"{remaining:.2f}s left of {self.budget_seconds:.0f}s budget")
+        seconds = max(MIN_CALL_SECONDS, remaining * share)
+        return min(seconds, cap) if cap else seconds
+
+    def request_options(self, share_and_cap=(1.0, None)) -> dict:
+        """`request_options` for google-generativeai calls."""
+        return {"timeout": self.slice(share_and_cap)}
+
+
+def request_options(deadline: Optional[Deadline], share_and_cap) -> dict:
+    """Keyword arguments for a google-generativeai call under `deadline` ({} without one)."""
+    return {"request_options": deadline.request_options(share_and_cap)} if deadline is not None else {}
+
+
+_lock = threading.Lock()
+_degradations = Counter()
+
+
+def record_degradation(stage: str):
+    with _lock:
+        _degradations[stage] += 1
+    print(f"[DEADLINE] Degraded stage '{stage}'")
+
+
+def deadline_stats() -> dict:
+    with _lock:
+        return {"budget_seconds": CHAT_DEADLINE_SECONDS, "degradations": dict(_degradations)}
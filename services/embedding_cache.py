@@ -0,0 +1,144 @@
+# File: services/embedding_cache.py
+#
+# Shared cache for query-time `genai.embed_content` calls.
+# Short strings ("gentle", "how to get to JB") are embedded over and over; their vectors never
+# change for a given model, so they are cached under (model, task_type, normalized text):
+#   1. a per-process LRU (TTLCache bounded by bytes) of float32 vectors
+#   2. a SQLite file in WAL mode, shared by every worker on the host and kept across restarts
+# A miss in both calls the API and fills both. If the SQLite file cannot be opened the cache
+# degrades to memory-only. All flows call embed() instead of genai.embed_content directly.
+
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from services.lru_cache import TTLCache
+
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(__file__), "..", ".cache", "embeddings.sqlite3"),
+)
+EMBEDDING_CACHE_MEMORY_BYTES = int(float(os.getenv("EMBEDDING_CACHE_MEMORY_MB", "16")) * 1024 * 1024)
+
+_SPACE_RE = re.compile(r"\s+")
+
+
+def cache_key(model: str, task_type: Optional[str], text: str) -> str:
+    normalized = _SPACE_RE.sub(" ", (text or "").strip().lower())
+    return hashlib.sha1(f"{model}\x00{(task_type or '').lower()}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+def _call_api(model: str, text: str, task_type: Optional[str], **kwargs) -> List[float]:
+    import google.generativeai as genai
+
+    return genai.embed_content(model=model, content=text, task_type=task_type, **kwargs)["embedding"]
+
+
+class EmbeddingCache:
+    def __init__(self, path: Optional[str] = EMBEDDING_CACHE_PATH, memory_bytes: int = EMBEDDING_CACHE_MEMORY_BYTES,
+                 enabled: bool = EMBEDDING_CACHE_ENABLED, embed_fn=_call_api):
+        self.path = path
+        self.enabled = enabled
+        self.embed_fn = embed_fn
+        self._memory = TTLCache(max_bytes=memory_bytes, sizeof=lambda v: v.nbytes)
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_failed = False
+        self._lock = threading.Lock()
+        self.counters = {"disk_hits": 0, "disk_misses": 0, "disk_errors": 0, "api_calls": 0, "api_seconds": 0.0}
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db is not None or self._db_failed or not self.path:
+            return self._db
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            db = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+            db.execute("pragma journal_mode=wal")
+            db.execute("pragma synchronous=normal")
+            db.execute(
+                "create table if not exists embeddings ("
+                " key text primary key, model text not null, task_type text, dim integer not null,"
+                " vector blob not null, created_at real not null)"
+            )
+            self._db = db
+        except (OSError, sqlite3.Error) as e:
+            logging.error(f"[EMBED CACHE] Could not open {self.path}, using memory only: {e}")
+            self._db_failed = True
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute("select vector from embeddings where key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                self.counters["disk_errors"] += 1
+                logging.error(f"[EMBED CACHE] Read failed: {e}")
+                return None
+            self.counters["disk_hits" if row else "disk_misses"] += 1
+        return np.frombuffer(row[0], dtype=np.float32) if row else None
+
+    def _disk_put(self, key: str, model: str, task_type: Optional[str], vector: np.ndarray):
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                db.execute(
+                    "insert or replace into embeddings (key, model, task_type, dim, vector, created_at) values (?, ?, ?, ?, ?, ?)",
+                    (key, model, task_type, int(vector.shape[0]), vector.tobytes(), time.time()),
+                )
+            except sqlite3.Error as e:
+                self.counters["disk_errors"] += 1
+                logging.error(f"[EMBED CACHE] Write failed: {e}")
+
+    def embed(self, text: str, model: str, task_type: Optional[str] = None, **kwargs) -> List[float]:
+        """The embedding of `text`, from cache when possible. Extra kwargs (request_options) go to the API."""
+        if not self.enabled:
+            return self._fetch(text, model, task_type, **kwargs)
+        key = cache_key(model, task_type, text)
+        vector = self._memory.get(key)
+        if vector is None:
+            vector = self._disk_get(key)
+            if vector is None:
+                vector = np.asarray(self._fetch(text, model, task_type, **kwargs), dtype=np.float32)
+                self._disk_put(key, model, task_type, vector)
+            self._memory.set(key, vector)
+        return vector.tolist()
+
+    def _fetch(self, text: str, model: str, task_type: Optional[str], **kwargs) -> List[float]:
+        started = time.perf_counter()
+        embedding = self.embed_fn(model, text, task_type, **kwargs)
+        with self._lock:
+            self.counters["api_calls"] += 1
+            self.counters["api_seconds"] += time.perf_counter() - started
+        return embedding
+
+    def stats(self) -> dict:
+        disk_bytes = None
+        with self._lock:
+            counters = dict(self.counters)
+            if self._db is not None:
+                try:
+                    pages, page_size = (self._db.execute(f"pragma {p}").fetchone()[0] for p in ("page_count", "page_size"))
+                    disk_bytes = pages * page_size
+                except sqlite3.Error:
+                    pass
+        counters["api_seconds"] = round(counters["api_seconds"], 3)
+        return {"enabled": self.enabled, "memory": self._memory.stats(), "disk_bytes": disk_bytes, **counters}
+
+
+embedding_cache = EmbeddingCache()
+
+
+def embed(text: str, model: str, task_type: Optional[str] = None, **kwargs) -> List[float]:
+    return embedding_cache.embed(text, model, task_type, **kwargs)
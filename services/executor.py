@@ -0,0 +1,31 @@
+# File: services/executor.py
+#
+# Bounded thread-pool offload layer for the async request handlers.
+# The Supabase client and google-generativeai are synchronous; calling them directly
+# inside an `async def` endpoint freezes the event loop (and every other request on
+# the worker) for the full round trip. Every blocking call in the chat pipeline goes
+# through `run_blocking` so concurrent requests overlap their I/O instead.
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Upper bound on concurrently running blocking calls per worker process.
+CHAT_IO_WORKERS = int(os.getenv("CHAT_IO_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=CHAT_IO_WORKERS, thread_name_prefix="chat-io")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run a synchronous callable on the shared I/O pool and await its result.
+
+    Exceptions raised by `func` (including HTTPException) propagate to the awaiting caller.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def shutdown_executor(wait: bool = True):
+    """Stop accepting new work; used from the application shutdown hook."""
+    _executor.shutdown(wait=wait)
@@ -0,0 +1,130 @@
+# File: services/faq_index.py
+#
+# In-process vector index over the travel FAQ table (`faqs_semantic`, ~100 rows).
+# The embeddings are loaded once into an L2-normalised float32 matrix, so a travel query is one
+# matrix-vector product (cosine top-k in microseconds) instead of a `match_faqs` RPC round trip.
+#
+# `faq_index_version()` (supabase/migrations/20261017095000_faq_index_version.sql) hashes the
+# table contents; run_faq_refresh_loop polls it and reloads only when it changes. Until the first
+# successful load, or when disabled, search() returns None and travel_flow falls back to the RPC.
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from services.executor import run_blocking
+
+FAQ_INDEX_ENABLED = os.getenv("FAQ_INDEX_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+FAQ_INDEX_REFRESH_SECONDS = float(os.getenv("FAQ_INDEX_REFRESH_SECONDS", "300"))
+FAQ_TABLE = "faqs_semantic"
+FAQ_FIELDS = "id,question,answer,category,last_updated,embedding"
+
+
+def _parse_embedding(value) -> Optional[List[float]]:
+    # pgvector columns arrive through PostgREST as their text form: "[0.1,0.2,...]"
+    if isinstance(value, str):
+        value = json.loads(value)
+    return value if isinstance(value, list) and value else None
+
+
+class FaqIndex:
+    def __init__(self, supabase, enabled: bool = FAQ_INDEX_ENABLED, table: str = FAQ_TABLE):
+        self.supabase = supabase
+        self.enabled = enabled
+        self.table = table
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None  # (n_rows, dim), rows L2-normalised
+        self._rows: List[dict] = []
+        self.version: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self.counters = {"searches": 0, "loads": 0, "load_errors": 0, "version_checks": 0}
+
+    @property
+    def ready(self) -> bool:
+        return self.enabled and self._matrix is not None
+
+    def build(self, rows: List[dict], version: Optional[str] = None) -> int:
+        """Replace the index with `rows` (each carrying an `embedding`). Returns the number indexed."""
+        kept, vectors = [], []
+        for row in rows:
+            embedding = _parse_embedding(row.get("embedding"))
+            if embedding is None:
+                continue
+            vectors.append(embedding)
+            kept.append({k: v for k, v in row.items() if k != "embedding"})
+        matrix = np.asarray(vectors, dtype=np.float32) if vectors else None
+        if matrix is not None:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+        with self._lock:
+            self._matrix, self._rows, self.version = matrix, kept, version
+            self.loaded_at = time.time()
+            self.counters["loads"] += 1
+        return len(kept)
+
+    def fetch_version(self) -> Optional[str]:
+        self.counters["version_checks"] += 1
+        return self.supabase.rpc("faq_index_version", {}).execute().data
+
+    def load(self) -> int:
+        """Fetch every FAQ row with its embedding and rebuild the index. Blocking."""
+        if not self.enabled:
+            return 0
+        try:
+            version = self.fetch_version()
+            rows = self.supabase.table(self.table).select(FAQ_FIELDS).execute().data or []
+            count = self.build(rows, version)
+            print(f"[FAQ INDEX] Loaded {count} FAQ embeddings (version {version})", flush=True)
+            return count
+        except Exception as e:
+            self.counters["load_errors"] += 1
+            logging.error(f"[FAQ INDEX] Load failed, travel retrieval stays on match_faqs: {e}")
+            return 0
+
+    def refresh_if_changed(self) -> bool:
+        """Reload when the table's content hash moved. Blocking."""
+        if not self.enabled:
+            return False
+        try:
+            version = self.fetch_version()
+        except Exception as e:
+            logging.error(f"[FAQ INDEX] Version check failed: {e}")
+            return False
+        if version == self.version and self._matrix is not None:
+            return False
+        return self.load() > 0
+
+    def search(self, query_embedding, match_threshold: float = 0.5, match_count: int = 3) -> Optional[List[dict]]:
+        """Rows shaped like `match_faqs` output (with `similarity`), best first; None if not loaded."""
+        with self._lock:
+            matrix, rows = self._matrix, self._rows
+            self.counters["searches"] += 1
+        if not self.enabled or matrix is None:
+            return None
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm or query.shape[0] != matrix.shape[1]:
+            return None
+        scores = matrix @ (query / norm)
+        k = min(match_count, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**rows[i], "similarity": float(scores[i])} for i in top if scores[i] > match_threshold]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"enabled": self.enabled, "rows": len(self._rows), "version": self.version,
+                    "loaded_at": self.loaded_at, **self.counters}
+
+
+async def run_faq_refresh_loop(index: FaqIndex, interval: float = FAQ_INDEX_REFRESH_SECONDS):
+    """Poll the table version and rebuild the index when the FAQs change."""
+    while True:
+        await asyncio.sleep(interval)
+        await run_blocking(index.refresh_if_changed)
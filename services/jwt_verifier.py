@@ -0,0 +1,148 @@
+# File: services/jwt_verifier.py
+#
+# JWT verification with a verified-claims cache and a locally held JWKS.
+# - Claims are cached under sha256(token) until the token's own `exp`, so a user's follow-up
+#   requests skip signature verification entirely. Only successfully verified tokens are cached.
+# - RS256/ES256 keys come from an in-memory kid -> key map that is prefetched at startup and
+#   refreshed in the background (run_jwks_refresh_loop). Requests never fetch the JWKS: a token
+#   signed with an unknown kid is rejected and triggers an asynchronous refresh, so a client
+#   retrying after a key rotation succeeds once the new key has landed.
+
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import jwt
+
+from services.executor import run_blocking
+from services.lru_cache import TTLCache
+
+JWT_CLAIMS_CACHE_ENABLED = os.getenv("JWT_CLAIMS_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+JWT_CLAIMS_CACHE_MAX_ENTRIES = int(os.getenv("JWT_CLAIMS_CACHE_MAX_ENTRIES", "10000"))
+JWKS_REFRESH_SECONDS = float(os.getenv("JWKS_REFRESH_SECONDS", "600"))
+# Minimum gap between refreshes triggered by unknown kids (forged kids must not hammer the endpoint).
+JWKS_REFRESH_COOLDOWN_SECONDS = float(os.getenv("JWKS_REFRESH_COOLDOWN_SECONDS", "30"))
+
+
+class UnknownSigningKey(jwt.InvalidTokenError):
+    pass
+
+
+class JwtVerifier:
+    def __init__(self, secret: str, jwks_client=None, audience: str = "authenticated",
+                 cache_enabled: bool = JWT_CLAIMS_CACHE_ENABLED, max_entries: int = JWT_CLAIMS_CACHE_MAX_ENTRIES,
+                 refresh_cooldown: float = JWKS_REFRESH_COOLDOWN_SECONDS, clock=time.time):
+        self.secret = secret
+        self.jwks_client = jwks_client
+        self.audience = audience
+        self.cache_enabled = cache_enabled
+        self.refresh_cooldown = refresh_cooldown
+        self.clock = clock
+        # Wall-clock based: entry lifetimes are derived from the token's absolute `exp`.
+        self._claims = TTLCache(max_entries=max_entries, clock=clock)
+        self._keys: Dict[str, object] = {}
+        self._keys_loaded_at: Optional[float] = None
+        self._last_refresh_attempt = float("-inf")
+        self._refresh_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.counters = {
+            "verifications": 0, "verify_failures": 0, "verify_seconds_total": 0.0,
+            "unknown_kid": 0, "jwks_refreshes": 0, "jwks_refresh_errors": 0,
+        }
+
+    def _count(self, name: str, amount=1):
+        with self._metrics_lock:
+            self.counters[name] += amount
+
+    def verify(self, token: str) -> dict:
+        """Verified claims for `token`. Raises jwt exceptions on invalid tokens. Never fetches the JWKS."""
+        cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        if self.cache_enabled:
+            claims = self._claims.get(cache_key)
+            if claims is not None:
+                return claims
+
+        start = time.perf_counter()
+        try:
+            claims = self._decode(token)
+        except Exception:
+            self._count("verify_failures")
+            raise
+        finally:
+            self._count("verifications")
+            self._count("verify_seconds_total", time.perf_counter() - start)
+
+        exp = claims.get("exp")
+        if self.cache_enabled and exp is not None:
+            self._claims.set(cache_key, claims, ttl=float(exp) - self.clock())
+        return claims
+
+    def _decode(self, token: str) -> dict:
+        header = jwt.get_unverified_header(token)
+        alg = header.get("alg", "HS256")
+        if alg == "HS256":
+            print("⚠️ Warning: Processing legacy HS256 token", flush=True)
+            return jwt.decode(token, self.secret, algorithms=["HS256"], audience=self.audience,
+                              options={"verify_exp": True})
+        key = self._keys.get(header.get("kid"))
+        if key is None:
+            self._count("unknown_kid")
+            self.schedule_refresh()
+            raise UnknownSigningKey(f"Unknown signing key id: {header.get('kid')}")
+        return jwt.decode(token, key, algorithms=["RS256", "ES256"], audience=self.audience,
+                          options={"verify_exp": True})
+
+    def refresh_jwks(self) -> int:
+        """Fetch the JWKS and swap in the new key map. Blocking; returns the number of keys."""
+        self._last_refresh_attempt = time.monotonic()
+        try:
+            signing_keys = self.jwks_client.get_signing_keys(refresh=True)
+        except Exception as e:
+            self._count("jwks_refresh_errors")
+            logging.error(f"[JWKS] Refresh failed; keeping {len(self._keys)} cached key(s): {e}")
+            return len(self._keys)
+        self._keys = {k.key_id: k.key for k in signing_keys}
+        self._keys_loaded_at = time.monotonic()
+        self._count("jwks_refreshes")
+        return len(self._keys)
+
+    def schedule_refresh(self):
+        """Refresh the JWKS on a background thread unless one ran recently or is running."""
+        if self.jwks_client is None:
+            return
+        if time.monotonic() - self._last_refresh_attempt < self.refresh_cooldown:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+
+        def _run():
+            try:
+                self.refresh_jwks()
+            finally:
+                self._refresh_lock.release()
+
+        threading.Thread(target=_run, name="jwks-refresh", daemon=True).start()
+
+    def stats(self) -> dict:
+        with self._metrics_lock:
+            counters = dict(self.counters)
+        verifications = counters["verifications"]
+        counters["verify_seconds_total"] = round(counters["verify_seconds_total"], 6)
+        return {
+            **counters,
+            "avg_verify_ms": round(counters["verify_seconds_total"] * 1000 / verifications, 3) if verifications else None,
+            "jwks_keys": len(self._keys),
+            "jwks_age_seconds": round(time.monotonic() - self._keys_loaded_at, 1) if self._keys_loaded_at else None,
+            "claims_cache": self._claims.stats(),
+        }
+
+
+async def run_jwks_refresh_loop(verifier: JwtVerifier, interval: float = JWKS_REFRESH_SECONDS):
+    """Keep the JWKS fresh so that key rotations are picked up before tokens use them."""
+    while True:
+        await asyncio.sleep(interval)
+        await run_blocking(verifier.refresh_jwks)
@@ -0,0 +1,101 @@
+# File: services/lru_cache.py
+#
+# Small thread-safe LRU cache with per-entry TTL and optional entry/byte bounds.
+# Shared by the in-process caches (sessions, auth, ...) so they all expose the same metrics.
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 ttl_seconds: Optional[float] = None, sizeof: Optional[Callable] = None, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sizeof = sizeof or (lambda value: 0)
+        self.clock = clock
+        self._data = OrderedDict()  # key -> (expires_at | None, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+
+    def _drop(self, key):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                self.counters["misses"] += 1
+                return default
+            expires_at, _, value = item
+            if expires_at is not None and self.clock() >= expires_at:
+                self._drop(key)
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.counters["hits"] += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Like get() but without touching LRU order or hit/miss counters."""
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING or (item[0] is not None and self.clock() >= item[0]):
+                return default
+            return item[2]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        """Insert or replace `key`. `ttl` overrides the cache default for this entry."""
+        size = self.sizeof(value)
+        ttl = self.ttl_seconds if ttl is None else ttl
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if (self.max_bytes is not None and size > self.max_bytes) or (ttl is not None and ttl <= 0):
+                self.counters["rejected"] += 1
+                return False
+            expires_at = self.clock() + ttl if ttl is not None else None
+            self._data[key] = (expires_at, size, value)
+            self._bytes += size
+            self.counters["sets"] += 1
+            while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries)
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._drop(next(iter(self._data)))
+                self.counters["evictions"] += 1
+            return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][2]
+            self._drop(key)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else None,
+            }
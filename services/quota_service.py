@@ -0,0 +1,255 @@
+# File: services/quota_service.py
+#
+# Per-user API call quota for /chat.
+# Checking and consuming a call is a single atomic operation: against Supabase it is one
+# RPC to the `consume_api_call` Postgres function (supabase/migrations), so there is one
+# round trip per message and no read-modify-write race between concurrent requests.
+#
+# Semantics (unchanged from the original main.py helpers):
+# - NULL api_calls_remaining, or no profile row, means unlimited.
+# - Any error fails open: the request is allowed.
+#
+# Optionally a QuotaLedger sits in front of the store: balances are cached per user,
+# decrements are applied in memory and flushed to the database in batches (write-behind),
+# which takes the quota round trip off the request path entirely.
+
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+UNLIMITED = -1
+
+
+@dataclass
+class QuotaDecision:
+    allowed: bool
+    remaining: int  # balance after this call; UNLIMITED (-1) when the user has no cap
+
+
+def decision_from_balance(remaining: Optional[int], allowed: bool = True) -> QuotaDecision:
+    if remaining is None:
+        return QuotaDecision(allowed=True, remaining=UNLIMITED)
+    return QuotaDecision(allowed=allowed, remaining=int(remaining))
+
+
+class SupabaseQuotaStore:
+    """Consumes calls through the `consume_api_call` database function."""
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def consume(self, user_id: str) -> QuotaDecision:
+        response = self.supabase.rpc("consume_api_call", {"p_user_id": user_id}).execute()
+        data = response.data
+        if isinstance(data, list):
+            data = data[0] if data else None
+        if not data:
+            return decision_from_balance(None)
+        return decision_from_balance(data.get("remaining"), bool(data.get("allowed", True)))
+
+    def load_balance(self, user_id: str) -> Optional[int]:
+        response = self.supabase.table("user_profiles").select("api_calls_remaining").eq("id", user_id).limit(1).execute()
+        rows = response.data or []
+        return rows[0].get("api_calls_remaining") if rows else None
+
+    def apply_usage(self, usage: dict) -> dict:
+        """Subtract {user_id: calls} in one RPC; returns {user_id: new balance or None}."""
+        response = self.supabase.rpc("apply_api_call_usage", {"p_usage": usage}).execute()
+        return response.data or {}
+
+
+class InMemoryQuotaStore:
+    """
+    Process-local stand-in with the same semantics as `consume_api_call`.
+    `balances` maps user_id -> remaining calls (None = unlimited); unknown users are unlimited.
+    """
+
+    def __init__(self, balances: Optional[dict] = None):
+        self.balances = dict(balances or {})
+        self._lock = threading.Lock()
+
+    def consume(self, user_id: str) -> QuotaDecision:
+        with self._lock:
+            remaining = self.balances.get(user_id)
+            if remaining is None:
+                return decision_from_balance(None)
+            if remaining <= 0:
+                return decision_from_balance(remaining, allowed=False)
+            self.balances[user_id] = remaining - 1
+            return decision_from_balance(remaining - 1)
+
+    def load_balance(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            return self.balances.get(user_id)
+
+    def apply_usage(self, usage: dict) -> dict:
+        with self._lock:
+            result = {}
+            for user_id, count in usage.items():
+                remaining = self.balances.get(user_id)
+                if remaining is not None:
+                    remaining = max(remaining - count, 0)
+                    self.balances[user_id] = remaining
+                result[user_id] = remaining
+            return result
+
+
+@dataclass
+class _LedgerEntry:
+    balance: Optional[int]  # last balance read from the database (None = unlimited)
+    pending: int = 0        # calls consumed locally but not yet flushed
+    loaded_at: float = 0.0
+
+
+class QuotaLedger:
+    """
+    In-process, write-behind quota ledger in front of a quota store.
+
+    - First use of a user loads their balance; later calls are decided in memory.
+    - Consumed calls accumulate as `pending` and are flushed in one batched RPC by `flush()`
+      (called every few seconds by `run_flush_loop` and on shutdown).
+    - Error bound: a worker never holds more than `max_drift` unflushed calls per user; hitting
+      the bound forces a synchronous flush, which also pulls in other workers' usage. Across W
+      workers a user can overspend by at most W * max_drift calls.
+    - Balances older than `refresh_interval` are re-read so top-ups become visible.
+    """
+
+    def __init__(self, store, max_drift: int = 5, refresh_interval: float = 60.0, clock=time.monotonic):
+        self.store = store
+        self.max_drift = max(1, max_drift)
+        self.refresh_interval = refresh_interval
+        self.clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.counters = {
+            "consumed": 0, "denied": 0, "loads": 0, "load_errors": 0,
+            "flushes": 0, "flush_errors": 0, "flushed_calls": 0, "forced_flushes": 0,
+        }
+        self.last_flush_at = None
+
+    def _count(self, key: str, n: int = 1):
+        self.counters[key] += n
+
+    def _load(self, user_id: str) -> Optional[_LedgerEntry]:
+        try:
+            balance = self.store.load_balance(user_id)
+        except Exception as e:
+            logging.error(f"[QUOTA LEDGER] Error loading balance for {user_id}: {e}")
+            with self._lock:
+                self._count("load_errors")
+            return None
+        with self._lock:
+            self._count("loads")
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = _LedgerEntry(balance=balance, loaded_at=self.clock())
+                self._entries[user_id] = entry
+            elif entry.pending == 0:
+                entry.balance, entry.loaded_at = balance, self.clock()
+            return entry
+
+    def consume(self, user_id: str) -> QuotaDecision:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            stale = entry is not None and entry.pending == 0 and self.clock() - entry.loaded_at > self.refresh_interval
+        if entry is None or stale:
+            entry = self._load(user_id)
+            if entry is None:
+                return decision_from_balance(None)  # fail open
+
+        force_flush = False
+        with self._lock:
+            if entry.balance is None:
+                self._count("consumed")
+                return decision_from_balance(None)
+            available = entry.balance - entry.pending
+            if available <= 0:
+                self._count("denied")
+                return decision_from_balance(0, allowed=False)
+            entry.pending += 1
+            self._count("consumed")
+            remaining = available - 1
+            if entry.pending >= self.max_drift:
+                force_flush = True
+                self._count("forced_flushes")
+
+        if force_flush:
+            self.flush(user_ids=[user_id])
+        return decision_from_balance(remaining)
+
+    def flush(self, user_ids: Optional[list] = None) -> int:
+        """Write pending usage to the store in one batch. Returns the number of calls flushed."""
+        with self._flush_lock:
+            with self._lock:
+                targets = user_ids if user_ids is not None else list(self._entries.keys())
+                usage = {}
+                for uid in targets:
+                    entry = self._entries.get(uid)
+                    if entry and entry.pending > 0:
+                        usage[uid] = entry.pending
+            if not usage:
+                return 0
+            try:
+                balances = self.store.apply_usage(usage)
+            except Exception as e:
+                logging.error(f"[QUOTA LEDGER] Flush of {len(usage)} user(s) failed: {e}")
+                with self._lock:
+                    self._count("flush_errors")
+                return 0
+            with self._lock:
+                now = self.clock()
+                for uid, count in usage.items():
+                    entry = self._entries.get(uid)
+                    if entry is None:
+                        continue
+                    entry.pending -= count
+                    entry.balance = balances.get(uid, entry.balance)
+                    entry.loaded_at = now
+                flushed = sum(usage.values())
+                self._count("flushes")
+                self._count("flushed_calls", flushed)
+                self.last_flush_at = now
+            return flushed
+
+    def stats(self) -> dict:
+        """Counters, plus how far the ledger has drifted from the database (unflushed calls)."""
+        with self._lock:
+            pending = [e.pending for e in self._entries.values()]
+            return {
+                **self.counters,
+                "tracked_users": len(self._entries),
+                "users_with_pending": sum(1 for p in pending if p),
+                "pending_calls": sum(pending),
+                "max_user_pending": max(pending, default=0),
+                "max_drift": self.max_drift,
+                "seconds_since_flush": None if self.last_flush_at is None else round(self.clock() - self.last_flush_at, 3),
+            }
+
+
+async def run_flush_loop(ledger: QuotaLedger, interval: float):
+    """Flush the ledger every `interval` seconds until cancelled."""
+    from services.executor import run_blocking
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await run_blocking(ledger.flush)
+        except Exception as e:
+            logging.error(f"[QUOTA LEDGER] Background flush error: {e}")
+
+
+def consume_api_call(store, user_id: str) -> QuotaDecision:
+    """Atomically check and consume one API call. Fails open on any store error."""
+    try:
+        decision = store.consume(user_id)
+    except Exception as e:
+        logging.error(f"Error consuming API call for user {user_id}: {e}")
+        return decision_from_balance(None)
+    if decision.allowed:
+        logging.info(f"✅ Consumed API call for user {user_id}: remaining={decision.remaining}")
+    else:
+        logging.warning(f"User {user_id} has no API calls remaining")
+    return decision
@@ -0,0 +1,52 @@
+# File: services/session_cache.py
+#
+# Per-worker cache of `sessions` rows keyed by (session_id, user_id).
+# Rows are stored as their JSON encoding: the size limit is measured in real bytes and every
+# read returns a private copy, so handlers can mutate `state` without corrupting the cache.
+#
+# The cache is write-through: main.update_session writes the row to Supabase and then here, so
+# a multi-turn conversation served by one worker costs one DB write per turn and no reads.
+# A turn served by a different worker makes this copy stale; the TTL bounds that window.
+
+import json
+import os
+from typing import Optional
+
+from services.lru_cache import TTLCache
+
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes", "on")
+SESSION_CACHE_MAX_BYTES = int(float(os.getenv("SESSION_CACHE_MAX_MB", "64")) * 1024 * 1024)
+SESSION_CACHE_TTL_SECONDS = float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300"))
+
+
+class SessionCache:
+    def __init__(self, max_bytes: int = SESSION_CACHE_MAX_BYTES, ttl_seconds: float = SESSION_CACHE_TTL_SECONDS,
+                 enabled: bool = SESSION_CACHE_ENABLED, clock=None):
+        self.enabled = enabled
+        kwargs = {"clock": clock} if clock else {}
+        self._cache = TTLCache(max_bytes=max_bytes, ttl_seconds=ttl_seconds, sizeof=len, **kwargs)
+
+    def get(self, session_id: str, user_id: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+        encoded = self._cache.get((session_id, user_id))
+        return json.loads(encoded) if encoded is not None else None
+
+    def put(self, session_id: str, user_id: str, row: dict):
+        if self.enabled:
+            self._cache.set((session_id, user_id), json.dumps(row, default=str).encode("utf-8"))
+
+    def update(self, session_id: str, user_id: str, **fields):
+        """Write-through helper: merge `fields` into the cached row (or start a new one)."""
+        if not self.enabled:
+            return
+        encoded = self._cache.peek((session_id, user_id))
+        row = json.loads(encoded) if encoded is not None else {"session_id": session_id, "user_id": user_id}
+        row.update(fields)
+        self.put(session_id, user_id, row)
+
+    def invalidate(self, session_id: str, user_id: str):
+        self._cache.pop((session_id, user_id))
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **self._cache.stats()}
@@ -0,0 +1,115 @@
+# File: services/session_delta.py
+#
+# Delta persistence for sessions (SESSION_DELTA_MODE).
+# Rather than rewriting the whole `state` blob and `context` history every turn, a turn is sent
+# as JSON-Patch-style ops against what was loaded at the start of the request: changed top-level
+# state keys and the newly appended messages. Postgres journals the ops and folds them back into
+# the row (supabase/migrations/*_session_deltas.sql), so write volume per turn stays roughly
+# constant instead of growing with the length of the conversation.
+
+import asyncio
+import logging
+import os
+from typing import List
+
+from services.executor import run_blocking
+
+SESSION_DELTA_MODE = os.getenv("SESSION_DELTA_MODE", "false").lower() in ("1", "true", "yes", "on")
+SESSION_COMPACT_AFTER = int(os.getenv("SESSION_COMPACT_AFTER", "20"))
+SESSION_COMPACT_INTERVAL_SECONDS = float(os.getenv("SESSION_COMPACT_INTERVAL_SECONDS", "300"))
+
+
+def _pointer(key: str) -> str:
+    # RFC 6901 escaping for a top-level key.
+    return "/state/" + str(key).replace("~", "~0").replace("/", "~1")
+
+
+def diff_session(base_state: dict, base_history: list, state: dict, history: list) -> List[dict]:
+    """Ops that turn (base_state, base_history) into (state, history). Empty list = nothing changed."""
+    base_state = base_state or {}
+    base_history = base_history or []
+    state = state or {}
+    history = history or []
+    ops = []
+    for key, value in state.items():
+        if key not in base_state:
+            ops.append({"op": "add", "path": _pointer(key), "value": value})
+        elif base_state[key] != value:
+            ops.append({"op": "replace", "path": _pointer(key), "value": value})
+    for key in base_state:
+        if key not in state:
+            ops.append({"op": "remove", "path": _pointer(key)})
+
+    # A bounded context window (services/session_format.py) slides: drop `trim` messages from the
+    # front, then append. The client owns the history; if it no longer extends what is stored at
+    # any offset, replace it wholesale.
+    trim = _window_shift(base_history, history)
+    if trim is None or trim > len(history):
+        ops.append({"op": "replace", "path": "/context", "value": history})
+        return ops
+    ops.extend({"op": "remove", "path": "/context/0"} for _ in range(trim))
+    ops.extend({"op": "add", "path": "/context/-", "value": msg} for msg in history[len(base_history) - trim:])
+    return ops
+
+
+def _window_shift(base_history: list, history: list):
+    """Smallest k such that history starts with base_history[k:], or None."""
+    for k in range(len(base_history) or 1):
+        if history[:len(base_history) - k] == base_history[k:]:
+            return k
+    return None
+
+
+def apply_ops(state: dict, history: list, ops: List[dict]):
+    """Python mirror of public.session_apply_ops (used by tests and the session cache)."""
+    state = dict(state or {})
+    history = list(history or [])
+    for op in ops:
+        path = op["path"]
+        if path == "/state":
+            state = dict(op.get("value") or {})
+        elif path == "/context":
+            history = list(op.get("value") or [])
+        elif path == "/context/-":
+            history.append(op["value"])
+        elif path == "/context/0" and op["op"] == "remove":
+            history = history[1:]
+        elif path.startswith("/state/"):
+            key = path[len("/state/"):].replace("~1", "/").replace("~0", "~")
+            if op["op"] == "remove":
+                state.pop(key, None)
+            else:
+                state[key] = op["value"]
+        else:
+            raise ValueError(f"unsupported session op path: {path}")
+    return state, history
+
+
+def append_session_delta(supabase, session_id: str, user_id: str, ops: List[dict],
+                         compact_after: int = SESSION_COMPACT_AFTER) -> int:
+    """Journal one turn's ops. Returns the number of deltas pending compaction. Raises on failure."""
+    response = supabase.rpc("append_session_delta", {
+        "p_session_id": session_id,
+        "p_user_id": user_id,
+        "p_ops": ops,
+        "p_compact_after": compact_after,
+    }).execute()
+    return response.data or 0
+
+
+def get_session_snapshot(supabase, session_id: str, user_id: str):
+    """The sessions row with pending deltas applied, or None."""
+    response = supabase.rpc("get_session_snapshot", {"p_session_id": session_id, "p_user_id": user_id}).execute()
+    return response.data or None
+
+
+async def run_compaction_loop(supabase, interval: float = SESSION_COMPACT_INTERVAL_SECONDS):
+    """Periodically fold idle sessions' deltas into their snapshot."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            response = await run_blocking(lambda: supabase.rpc("compact_stale_sessions", {}).execute())
+            if response.data:
+                print(f"[SESSION DELTA] Compacted {response.data} idle session(s)", flush=True)
+        except Exception as e:
+            logging.error(f"[SESSION DELTA] Compaction failed: {e}")
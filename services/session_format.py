@@ -0,0 +1,124 @@
+# File: services/session_format.py
+#
+# Compact storage format for `sessions` rows (SESSION_STORAGE_FORMAT=compact).
+#
+# - `context` keeps only the newest SESSION_CONTEXT_WINDOW messages; older turns are dropped
+#   (the client resends the full history each turn, and /restore_session returns context[-6:]).
+# - clinics in `state.candidate_pool` are stored as {"$ref": "<country>:<id>", ...} plus the
+#   per-search fields the catalog does not have (tags, distance, ...), and are rehydrated from
+#   the clinic catalog on read.
+# - optionally (SESSION_COMPRESSION=zlib|zstd) state and context are packed into one compressed
+#   blob: state = {"_fmt": 2, "codec": ..., "data": <base64>}, context = [].
+#
+# Encoded state always carries "_fmt"; rows without it are the legacy format and decode as-is,
+# so both formats can be read while scripts/migrate_session_format.py rewrites old rows.
+
+import base64
+import json
+import logging
+import os
+import zlib
+from typing import Optional, Tuple
+
+from services.clinic_catalog import CATALOG_FIELDS, clinic_ref
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+SESSION_FORMAT_VERSION = 2
+SESSION_STORAGE_FORMAT = os.getenv("SESSION_STORAGE_FORMAT", "legacy").lower()
+SESSION_CONTEXT_WINDOW = int(os.getenv("SESSION_CONTEXT_WINDOW", "20"))
+SESSION_COMPRESSION = os.getenv("SESSION_COMPRESSION", "none").lower()
+
+if SESSION_COMPRESSION == "zstd" and zstandard is None:
+    logging.warning("[SESSION FORMAT] zstandard is not installed; falling back to zlib compression")
+    SESSION_COMPRESSION = "zlib"
+
+# Fields of a candidate clinic stored next to its $ref: the ones that come from the search itself
+# (tags, distance, ...) plus the card essentials, so a clinic whose catalog lookup fails still
+# decodes with its id (original type), name and rating instead of a bare stub.
+_LOCAL_CLINIC_FIELDS = ("id", "name", "address", "rating", "reviews", "tags", "distance", "maps_link")
+
+
+def _compress(raw: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(raw)
+    return zlib.compress(raw, 6)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("session blob is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def _pack_clinic(clinic):
+    if not isinstance(clinic, dict):
+        return clinic
+    ref = clinic_ref(clinic)
+    if ref is None:
+        return clinic
+    packed = {"$ref": ref}
+    packed.update({k: clinic[k] for k in _LOCAL_CLINIC_FIELDS if k in clinic})
+    return packed
+
+
+def encode_session(state: Optional[dict], history: Optional[list], window: int = SESSION_CONTEXT_WINDOW,
+                   compression: Optional[str] = None) -> Tuple[dict, list]:
+    """(state, history) as handlers use them -> (state, context) columns in the compact format."""
+    compression = SESSION_COMPRESSION if compression is None else compression
+    state = dict(state or {})
+    history = list(history or [])
+    if window > 0:
+        history = history[-window:]
+    if state.get("candidate_pool"):
+        state["candidate_pool"] = [_pack_clinic(c) for c in state["candidate_pool"]]
+    state["_fmt"] = SESSION_FORMAT_VERSION
+    if compression in ("zlib", "zstd"):
+        raw = json.dumps({"state": state, "context": history}, separators=(",", ":"), default=str).encode("utf-8")
+        data = base64.b64encode(_compress(raw, compression)).decode("ascii")
+        return {"_fmt": SESSION_FORMAT_VERSION, "codec": compression, "data": data}, []
+    return state, history
+
+
+def is_compact(state) -> bool:
+    return isinstance(state, dict) and "_fmt" in state
+
+
+def decode_session(state, context, catalog=None) -> Tuple[dict, list]:
+    """Stored (state, context) in either format -> (state, history) as handlers use them."""
+    if not is_compact(state):
+        return state or {}, context or []
+    if "codec" in state:
+        blob = json.loads(_decompress(base64.b64decode(state["data"]), state["codec"]))
+        state, context = blob["state"], blob["context"]
+    state = {k: v for k, v in state.items() if k != "_fmt"}
+    pool = state.get("candidate_pool") or []
+    refs = [c["$ref"] for c in pool if isinstance(c, dict) and "$ref" in c]
+    if refs:
+        rows = catalog.get_many(refs) if catalog is not None else {}
+        rehydrated = []
+        for clinic in pool:
+            if isinstance(clinic, dict) and "$ref" in clinic:
+                local = {k: v for k, v in clinic.items() if k != "$ref"}
+                country, _, clinic_id = clinic["$ref"].partition(":")
+                # Catalog values win (fresher), stored fields fill in when the lookup fails, and an
+                # unknown ref still keeps its place so positions ("the 2nd one") stay stable.
+                row = rows.get(clinic["$ref"], {})
+                clinic = {"id": clinic_id, "country": country, **local, **row,
+                          **{k: v for k, v in local.items() if k not in CATALOG_FIELDS}}
+            rehydrated.append(clinic)
+        state["candidate_pool"] = rehydrated
+    return state, context or []
+
+
+def decode_row(row: Optional[dict], catalog=None) -> Optional[dict]:
+    """A `sessions` row with state/context decoded in place of the stored columns."""
+    if not row or not is_compact(row.get("state")):
+        return row
+    state, context = decode_session(row.get("state"), row.get("context"), catalog)
+    return {**row, "state": state, "context": context}
@@ -2,6 +2,10 @@ import logging
 from typing import Optional
 from supabase import Client
 
+# Conversation rows kept per user. The ring buffer size is passed to append_conversation_messages
+# on every call; the backfill in supabase/migrations/*_conversation_ring_buffer.sql uses the same value.
+MESSAGE_LIMIT_PER_USER = 100
+
 def create_session(supabase: Client, user_id: str = None, initial_context: dict = None) -> Optional[str]:
     from uuid import uuid4
     session_id = str(uuid4())
@@ -37,22 +41,24 @@ def update_session(supabase: Client, session_id: str, context: dict, conversatio
         logging.error(f"Error updating session {session_id}: {e}")
         return False
 
-def add_conversation_message(supabase: Client, user_id, role, message, MESSAGE_LIMIT_PER_USER=100):
+def add_conversation_message(supabase: Client, user_id, role, message, MESSAGE_LIMIT_PER_USER=MESSAGE_LIMIT_PER_USER):
     try:
-        count_resp = supabase.table("conversations").select("id,created_at").eq("user_id", user_id).order("created_at").execute()
-        messages = count_resp.data or []
-        if len(messages) >= MESSAGE_LIMIT_PER_USER:
-            old_ids = [row["id"] for row in messages[:len(messages) - MESSAGE_LIMIT_PER_USER + 1]]
-            if old_ids:
-                supabase.table("conversations").delete().in_("id", old_ids).execute()
-        supabase.table("conversations").insert({
-            "user_id": user_id,
-            "role": role,
-            "message": message
-        }).execute()
+        add_conversation_messages(supabase, [{"user_id": user_id, "role": role, "message": message}], MESSAGE_LIMIT_PER_USER)
     except Exception as e:
         logging.error(f"Error inserting conversation message: {e}")
 
+def add_conversation_messages(supabase: Client, rows: list, MESSAGE_LIMIT_PER_USER=MESSAGE_LIMIT_PER_USER):
+    """
+    Append conversation rows ({user_id, role, message, created_at}) in a single RPC.
+    History is capped per user by the `append_conversation_messages` ring buffer
+    (supabase/migrations/*_conversation_ring_buffer.sql): the oldest slot is overwritten in place,
+    so the cost per message does not depend on how much history the user has.
+    Raises on failure so the caller can count it.
+    """
+    if not rows:
+        return
+    supabase.rpc("append_conversation_messages", {"p_rows": rows, "p_limit": MESSAGE_LIMIT_PER_USER}).execute()
+
 # NEW: Helper to get the most recent previous session for a user (excluding the current session)
 def get_previous_session(supabase: Client, user_id: str, exclude_session_id: str):
     try:
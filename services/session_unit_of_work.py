@@ -0,0 +1,78 @@
+# File: services/session_unit_of_work.py
+#
+# Request-scoped unit of work for session persistence.
+# A /chat turn may change the session state several times (ordinal resolution, booking, final
+# save); every branch stages its changes here and exactly one write reaches the database when
+# the request finishes. Staged data is pushed to the session cache immediately, so reads on this
+# worker see it even before the commit lands.
+#
+# With a `delta_writer` and the session as loaded (`baseline`), the commit sends only the diff
+# (services/session_delta.py) instead of the full state and history.
+
+import copy
+import logging
+from typing import Callable, List, Optional
+
+from services.executor import run_blocking
+from services.session_delta import diff_session
+
+
+class SessionUnitOfWork:
+    def __init__(self, session_id: str, user_id: str, writer: Callable, cache=None,
+                 delta_writer: Optional[Callable] = None, baseline: Optional[tuple] = None,
+                 encode: Optional[Callable] = None):
+        """`writer(session_id, user_id, state, history)` performs the actual (blocking) write.
+
+        `delta_writer(session_id, user_id, ops, state, history)` is used instead when a
+        `baseline` of (state, history) as loaded is given; it is copied here because handlers
+        mutate the loaded state in place. `encode(state, history)` maps both sides to their
+        stored form before diffing, so the ops match what is actually in the row.
+        """
+        self.session_id = session_id
+        self.user_id = user_id
+        self.writer = writer
+        self.cache = cache
+        self.delta_writer = delta_writer
+        self.baseline = copy.deepcopy(baseline) if delta_writer and baseline is not None else None
+        self.encode = encode or (lambda state, history: (state, history))
+        self.state: Optional[dict] = None
+        self.history: Optional[List[dict]] = None
+        self.stage_count = 0
+        self.committed = False
+
+    def stage(self, state: dict, history: list, assistant_reply: Optional[str] = None):
+        """Record the session state and chat history to persist (last call wins)."""
+        history = [msg.model_dump() if hasattr(msg, "model_dump") else dict(msg) for msg in history]
+        if assistant_reply:
+            history.append({"role": "assistant", "content": assistant_reply})
+        self.state = state
+        self.history = history
+        self.stage_count += 1
+        if self.cache is not None:
+            self.cache.update(self.session_id, self.user_id, state=state, context=history)
+
+    @property
+    def dirty(self) -> bool:
+        return self.stage_count > 0 and not self.committed
+
+    def discard(self):
+        """Drop the staged write (the turn was abandoned mid-way); a later commit() is a no-op."""
+        if self.stage_count and self.cache is not None:
+            self.cache.invalidate(self.session_id, self.user_id)
+        if self.dirty:
+            logging.warning(f"[SESSION UOW] Discarded {self.stage_count} staged session write(s) for {self.session_id}")
+        self.committed = True
+
+    async def commit(self):
+        """Write the staged session once. Safe to call more than once."""
+        if not self.dirty:
+            return
+        self.committed = True
+        if self.stage_count > 1:
+            logging.info(f"[SESSION UOW] Coalesced {self.stage_count} session writes into one for {self.session_id}")
+        if self.baseline is None:
+            await run_blocking(self.writer, self.session_id, self.user_id, self.state, self.history)
+            return
+        ops = diff_session(*self.encode(*self.baseline), *self.encode(self.state, self.history))
+        if ops:
+            await run_blocking(self.delta_writer, self.session_id, self.user_id, ops, self.state, self.history)
@@ -0,0 +1,60 @@
+# File: services/streaming.py
+#
+# Token streaming for /chat/stream.
+# The flows run on the I/O thread pool (services/executor.py) and call Gemini synchronously.
+# A TokenSink is handed down to them; generate_text() switches to streaming generation when one
+# is present and pushes each chunk into the sink, which hands it to the event loop thread-safely.
+# The endpoint drains the sink as server-sent events while the flow is still generating.
+
+import asyncio
+import json
+from typing import AsyncIterator, Optional
+
+_CLOSED = object()
+
+
+class TokenSink:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self._loop = loop or asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self.started = asyncio.Event()  # set on the first token
+        self.tokens = 0
+
+    def emit(self, text: str):
+        """Queue a text chunk; callable from any thread."""
+        if text:
+            self._loop.call_soon_threadsafe(self._put, text)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, _CLOSED)
+
+    def _put(self, text: str):
+        self.tokens += 1
+        self.started.set()
+        self._queue.put_nowait(text)
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        while True:
+            item = await self._queue.get()
+            if item is _CLOSED:
+                return
+            yield item
+
+
+def generate_text(model, prompt, sink: Optional[TokenSink] = None, **kwargs) -> str:
+    """`model.generate_content(prompt, **kwargs).text`, streamed chunk by chunk into `sink` when given."""
+    if sink is None:
+        return model.generate_content(prompt, **kwargs).text
+    parts = []
+    for chunk in model.generate_content(prompt, stream=True, **kwargs):
+        try:
+            text = chunk.text
+        except ValueError:  # chunk without text parts (e.g. safety metadata only)
+            continue
+        sink.emit(text)
+        parts.append(text)
+    return "".join(parts)
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,47 @@
+-- Atomic, single-round-trip API quota consumption for /chat.
+--
+-- Replaces the select -> select -> update sequence previously done from main.py.
+-- The conditional UPDATE takes the row lock, so concurrent requests from the same
+-- user can never both spend the last call.
+--
+-- Returns jsonb: {"allowed": bool, "remaining": int | null}
+--   remaining = null  -> unlimited (NULL column or no profile row), always allowed
+--   allowed   = false -> balance already at 0
+
+create or replace function public.consume_api_call(p_user_id uuid)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_remaining integer;
+    v_found boolean := false;
+begin
+    update user_profiles
+       set api_calls_remaining = api_calls_remaining - 1,
+           updated_at = now()
+     where id = p_user_id
+       and api_calls_remaining > 0
+    returning api_calls_remaining into v_remaining;
+
+    if found then
+        return jsonb_build_object('allowed', true, 'remaining', v_remaining);
+    end if;
+
+    -- Nothing was decremented: either unlimited (NULL / no profile) or exhausted.
+    select api_calls_remaining, true
+      into v_remaining, v_found
+      from user_profiles
+     where id = p_user_id;
+
+    if not coalesce(v_found, false) or v_remaining is null then
+        return jsonb_build_object('allowed', true, 'remaining', null);
+    end if;
+
+    return jsonb_build_object('allowed', false, 'remaining', v_remaining);
+end;
+$$;
+
+revoke all on function public.consume_api_call(uuid) from public, anon, authenticated;
+grant execute on function public.consume_api_call(uuid) to service_role;
@@ -0,0 +1,37 @@
+-- Batched write-behind flush for the in-process quota ledger (services/quota_service.QuotaLedger).
+--
+-- p_usage: {"<user uuid>": <calls consumed since last flush>, ...}
+-- Returns jsonb {"<user uuid>": <balance after applying> | null}; null = unlimited.
+-- Balances are clamped at 0 so a flush can never drive a user negative.
+
+create or replace function public.apply_api_call_usage(p_usage jsonb)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_user text;
+    v_count integer;
+    v_remaining integer;
+    v_result jsonb := '{}'::jsonb;
+begin
+    for v_user, v_count in
+        select key, value::integer from jsonb_each_text(p_usage)
+    loop
+        v_remaining := null;
+        update user_profiles
+           set api_calls_remaining = greatest(api_calls_remaining - v_count, 0),
+               updated_at = now()
+         where id = v_user::uuid
+           and api_calls_remaining is not null
+        returning api_calls_remaining into v_remaining;
+
+        v_result := v_result || jsonb_build_object(v_user, v_remaining);
+    end loop;
+    return v_result;
+end;
+$$;
+
+revoke all on function public.apply_api_call_usage(jsonb) from public, anon, authenticated;
+grant execute on function public.apply_api_call_usage(jsonb) to service_role;
@@ -0,0 +1,99 @@
+-- O(1) capped conversation history (MESSAGE_LIMIT_PER_USER).
+--
+-- Each user's history is a ring buffer of p_limit slots. A per-user cursor hands out
+-- sequence numbers; message N is written to slot N % p_limit, overwriting the oldest
+-- row in place. Appending never reads or counts the user's existing history, so the
+-- cost per message is constant no matter how long the history is.
+
+create table if not exists public.conversation_cursors (
+    user_id uuid primary key,
+    next_seq bigint not null default 0
+);
+
+alter table public.conversations add column if not exists slot integer;
+create unique index if not exists conversations_user_slot_key on public.conversations (user_id, slot);
+
+-- One-off backfill: keep each user's newest rows, number them oldest-first, seed cursors.
+-- c_limit must equal MESSAGE_LIMIT_PER_USER in services/session_service.py, which passes the
+-- same value as p_limit to append_conversation_messages on every call.
+do $$
+declare
+    c_limit constant integer := 100;  -- MESSAGE_LIMIT_PER_USER
+begin
+    with ranked as (
+        select id, row_number() over (partition by user_id order by created_at desc) as rn
+          from public.conversations
+         where slot is null
+    )
+    delete from public.conversations c
+     using ranked r
+     where c.id = r.id and r.rn > c_limit;
+
+    with ordered as (
+        select id, row_number() over (partition by user_id order by created_at) - 1 as seq
+          from public.conversations
+         where slot is null
+    )
+    update public.conversations c
+       set slot = o.seq
+      from ordered o
+     where c.id = o.id;
+
+    insert into public.conversation_cursors (user_id, next_seq)
+    select user_id, count(*) from public.conversations group by user_id
+    on conflict (user_id) do update set next_seq = excluded.next_seq;
+end;
+$$;
+
+-- p_rows: [{"user_id", "role", "message", "created_at"?}, ...] in chronological order.
+-- p_limit: ring buffer size, always MESSAGE_LIMIT_PER_USER from services/session_service.py (no
+-- default here, so the cap cannot silently drift from the application constant).
+-- Returns the number of rows written.
+create or replace function public.append_conversation_messages(p_rows jsonb, p_limit integer)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_user uuid;
+    v_messages jsonb;
+    v_count integer;
+    v_start bigint;
+    v_total integer := 0;
+begin
+    for v_user, v_messages in
+        select (r->>'user_id')::uuid, jsonb_agg(r order by ord)
+          from jsonb_array_elements(p_rows) with ordinality as t(r, ord)
+         group by 1
+    loop
+        v_count := jsonb_array_length(v_messages);
+
+        insert into conversation_cursors as cc (user_id, next_seq)
+        values (v_user, v_count)
+        on conflict (user_id) do update set next_seq = cc.next_seq + v_count
+        returning next_seq - v_count into v_start;
+
+        -- Only the newest p_limit messages of a batch can survive; skipping the rest also
+        -- keeps two rows of one statement from targeting the same slot.
+        insert into conversations (user_id, role, message, created_at, slot)
+        select v_user,
+               m->>'role',
+               m->>'message',
+               coalesce((m->>'created_at')::timestamptz, now()),
+               ((v_start + ord - 1) % p_limit)::integer
+          from jsonb_array_elements(v_messages) with ordinality as t(m, ord)
+         where ord > v_count - p_limit
+        on conflict (user_id, slot) do update
+           set role = excluded.role,
+               message = excluded.message,
+               created_at = excluded.created_at;
+
+        v_total := v_total + least(v_count, p_limit);
+    end loop;
+    return v_total;
+end;
+$$;
+
+revoke all on function public.append_conversation_messages(jsonb, integer) from public, anon, authenticated;
+grant execute on function public.append_conversation_messages(jsonb, integer) to service_role;
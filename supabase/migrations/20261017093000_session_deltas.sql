@@ -0,0 +1,220 @@
+-- Append-only session persistence (SESSION_DELTA_MODE).
+--
+-- Instead of rewriting sessions.state and sessions.context every turn, the app sends the
+-- JSON-Patch-style ops that turn the stored session into the new one (services/session_delta.py):
+--
+--   {"op": "add" | "replace", "path": "/state/<key>", "value": ...}   set one top-level state key
+--   {"op": "remove",          "path": "/state/<key>"}                 drop one top-level state key
+--   {"op": "add",             "path": "/context/-", "value": msg}     append one chat message
+--   {"op": "replace",         "path": "/state" | "/context", "value"} replace the whole field
+--
+-- Ops are journaled in session_deltas and folded back into the sessions row by compact_session,
+-- which append_session_delta runs automatically every p_compact_after deltas. Readers use
+-- get_session_snapshot, which applies pending deltas on the fly.
+
+create table if not exists public.session_deltas (
+    id bigserial primary key,
+    session_id uuid not null,
+    user_id uuid not null,
+    ops jsonb not null,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists session_deltas_session_id_idx on public.session_deltas (session_id, id);
+alter table public.session_deltas enable row level security;
+
+create or replace function public.session_apply_ops(
+    p_state jsonb, p_context jsonb, p_ops jsonb,
+    out state jsonb, out context jsonb
+)
+language plpgsql
+immutable
+as $$
+declare
+    v_op jsonb;
+    v_path text;
+    v_key text;
+begin
+    state := coalesce(p_state, '{}'::jsonb);
+    context := coalesce(p_context, '[]'::jsonb);
+    for v_op in select value from jsonb_array_elements(coalesce(p_ops, '[]'::jsonb))
+    loop
+        v_path := v_op->>'path';
+        if v_path = '/state' then
+            state := coalesce(v_op->'value', '{}'::jsonb);
+        elsif v_path = '/context' then
+            context := coalesce(v_op->'value', '[]'::jsonb);
+        elsif v_path = '/context/-' then
+            context := context || jsonb_build_array(v_op->'value');
+        elsif v_path like '/state/%' then
+            -- RFC 6901 pointer unescaping: ~1 -> '/', ~0 -> '~'
+            v_key := replace(replace(substr(v_path, 8), '~1', '/'), '~0', '~');
+            if v_op->>'op' = 'remove' then
+                state := state - v_key;
+            else
+                state := state || jsonb_build_object(v_key, v_op->'value');
+            end if;
+        else
+            raise exception 'unsupported session op path: %', v_path;
+        end if;
+    end loop;
+end;
+$$;
+
+create or replace function public.compact_session(p_session_id uuid)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_state jsonb;
+    v_context jsonb;
+    v_ops jsonb;
+    v_last_id bigint;
+    v_folded integer;
+begin
+    -- Row lock serializes concurrent compactions of the same session.
+    select s.state, s.context into v_state, v_context
+      from sessions s
+     where s.session_id = p_session_id
+       for update;
+    if not found then
+        return 0;
+    end if;
+
+    select max(id), count(*) into v_last_id, v_folded
+      from session_deltas
+     where session_id = p_session_id;
+    if v_last_id is null then
+        return 0;
+    end if;
+
+    select coalesce(jsonb_agg(op order by d.id, o.ord), '[]'::jsonb) into v_ops
+      from session_deltas d
+      cross join lateral jsonb_array_elements(d.ops) with ordinality as o(op, ord)
+     where d.session_id = p_session_id
+       and d.id <= v_last_id;
+
+    select a.state, a.context into v_state, v_context
+      from session_apply_ops(v_state, v_context, v_ops) a;
+
+    update sessions
+       set state = v_state,
+           context = v_context
+     where session_id = p_session_id;
+
+    delete from session_deltas
+     where session_id = p_session_id
+       and id <= v_last_id;
+    return v_folded;
+end;
+$$;
+
+-- Returns the number of deltas still pending for the session after this append.
+create or replace function public.append_session_delta(
+    p_session_id uuid,
+    p_user_id uuid,
+    p_ops jsonb,
+    p_compact_after integer default 20
+)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_pending integer;
+begin
+    insert into session_deltas (session_id, user_id, ops)
+    values (p_session_id, p_user_id, p_ops);
+
+    -- Only updated_at changes; the TOASTed state/context values are carried over untouched.
+    update sessions
+       set updated_at = now()
+     where session_id = p_session_id
+       and user_id = p_user_id;
+
+    select count(*) into v_pending
+      from session_deltas
+     where session_id = p_session_id;
+
+    if v_pending >= p_compact_after then
+        perform compact_session(p_session_id);
+        v_pending := 0;
+    end if;
+    return v_pending;
+end;
+$$;
+
+-- The sessions row with any pending deltas applied (same shape as `select *`).
+create or replace function public.get_session_snapshot(p_session_id uuid, p_user_id uuid)
+returns jsonb
+language plpgsql
+stable
+security definer
+set search_path = public
+as $$
+declare
+    v_row jsonb;
+    v_ops jsonb;
+    v_state jsonb;
+    v_context jsonb;
+begin
+    select to_jsonb(s) into v_row
+      from sessions s
+     where s.session_id = p_session_id
+       and s.user_id = p_user_id;
+    if v_row is null then
+        return null;
+    end if;
+
+    select jsonb_agg(op order by d.id, o.ord) into v_ops
+      from session_deltas d
+      cross join lateral jsonb_array_elements(d.ops) with ordinality as o(op, ord)
+     where d.session_id = p_session_id;
+    if v_ops is null then
+        return v_row;
+    end if;
+
+    select a.state, a.context into v_state, v_context
+      from session_apply_ops(v_row->'state', v_row->'context', v_ops) a;
+    return v_row || jsonb_build_object('state', v_state, 'context', v_context);
+end;
+$$;
+
+-- Sessions that still have deltas pending, oldest first (for a periodic compaction job).
+create or replace function public.compact_stale_sessions(p_older_than interval default interval '10 minutes', p_limit integer default 500)
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    v_session uuid;
+    v_compacted integer := 0;
+begin
+    for v_session in
+        select session_id from session_deltas
+         group by session_id
+        having max(created_at) < now() - p_older_than
+         order by min(id)
+         limit p_limit
+    loop
+        perform compact_session(v_session);
+        v_compacted := v_compacted + 1;
+    end loop;
+    return v_compacted;
+end;
+$$;
+
+revoke all on function public.session_apply_ops(jsonb, jsonb, jsonb) from public, anon, authenticated;
+revoke all on function public.compact_session(uuid) from public, anon, authenticated;
+revoke all on function public.append_session_delta(uuid, uuid, jsonb, integer) from public, anon, authenticated;
+revoke all on function public.get_session_snapshot(uuid, uuid) from public, anon, authenticated;
+revoke all on function public.compact_stale_sessions(interval, integer) from public, anon, authenticated;
+grant execute on function public.session_apply_ops(jsonb, jsonb, jsonb) to service_role;
+grant execute on function public.compact_session(uuid) to service_role;
+grant execute on function public.append_session_delta(uuid, uuid, jsonb, integer) to service_role;
+grant execute on function public.get_session_snapshot(uuid, uuid) to service_role;
+grant execute on function public.compact_stale_sessions(interval, integer) to service_role;
@@ -0,0 +1,46 @@
+-- Compact session format (services/session_format.py) keeps a sliding window of recent turns.
+-- Delta writes express the slide as {"op": "remove", "path": "/context/0"} before the appends,
+-- so session_apply_ops learns to drop the first context element.
+
+create or replace function public.session_apply_ops(
+    p_state jsonb, p_context jsonb, p_ops jsonb,
+    out state jsonb, out context jsonb
+)
+language plpgsql
+immutable
+as $$
+declare
+    v_op jsonb;
+    v_path text;
+    v_key text;
+begin
+    state := coalesce(p_state, '{}'::jsonb);
+    context := coalesce(p_context, '[]'::jsonb);
+    for v_op in select value from jsonb_array_elements(coalesce(p_ops, '[]'::jsonb))
+    loop
+        v_path := v_op->>'path';
+        if v_path = '/state' then
+            state := coalesce(v_op->'value', '{}'::jsonb);
+        elsif v_path = '/context' then
+            context := coalesce(v_op->'value', '[]'::jsonb);
+        elsif v_path = '/context/-' then
+            context := context || jsonb_build_array(v_op->'value');
+        elsif v_path = '/context/0' and v_op->>'op' = 'remove' then
+            context := context - 0;
+        elsif v_path like '/state/%' then
+            -- RFC 6901 pointer unescaping: ~1 -> '/', ~0 -> '~'
+            v_key := replace(replace(substr(v_path, 8), '~1', '/'), '~0', '~');
+            if v_op->>'op' = 'remove' then
+                state := state - v_key;
+            else
+                state := state || jsonb_build_object(v_key, v_op->'value');
+            end if;
+        else
+            raise exception 'unsupported session op path: %', v_path;
+        end if;
+    end loop;
+end;
+$$;
+
+revoke all on function public.session_apply_ops(jsonb, jsonb, jsonb) from public, anon, authenticated;
+grant execute on function public.session_apply_ops(jsonb, jsonb, jsonb) to service_role;
@@ -0,0 +1,18 @@
+-- Content hash of the travel FAQ table for the in-process FAQ index (services/faq_index.py).
+-- The backend polls this and only re-downloads the embeddings when it changes. Hashing ~100 rows
+-- is cheap, and it catches edits as well as inserts and deletes without relying on a trigger.
+
+create or replace function public.faq_index_version()
+returns text
+language sql
+stable
+as $$
+    select md5(coalesce(string_agg(
+        id::text || ':' || md5(coalesce(question, '') || '|' || coalesce(answer, '') || '|' || coalesce(embedding::text, '')),
+        ',' order by id
+    ), ''))
+    from public.faqs_semantic;
+$$;
+
+revoke all on function public.faq_index_version() from public, anon, authenticated;
+grant execute on function public.faq_index_version() to service_role;
@@ -0,0 +1,59 @@
+import asyncio
+
+from services.conversation_logger import ConversationLogger
+
+
+class RecordingWriter:
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, supabase, rows):
+        if self.fail:
+            raise RuntimeError("insert failed")
+        self.batches.append(list(rows))
+
+
+def test_messages_are_batched_and_flushed_on_close():
+    writer = RecordingWriter()
+
+    async def run():
+        logger = ConversationLogger(supabase=None, max_queue=100, batch_size=10, writer=writer)
+        for i in range(25):
+            assert logger.log("u1", "user" if i % 2 == 0 else "assistant", f"m{i}")
+        await logger.close()
+        return logger.stats()
+
+    stats = asyncio.run(run())
+    rows = [row for batch in writer.batches for row in batch]
+    assert [r["message"] for r in rows] == [f"m{i}" for i in range(25)]
+    assert all(len(batch) <= 10 for batch in writer.batches)
+    assert len(writer.batches) < 25
+    assert stats["written"] == 25 and stats["dropped"] == 0 and stats["queue_depth"] == 0
+
+
+def test_full_queue_drops_and_counts():
+    writer = RecordingWriter()
+
+    async def run():
+        logger = ConversationLogger(supabase=None, max_queue=3, batch_size=10, writer=writer)
+        accepted = [logger.log("u1", "user", f"m{i}") for i in range(5)]
+        await logger.close()
+        after_close = logger.log("u1", "user", "late")
+        return accepted, after_close, logger.stats()
+
+    accepted, after_close, stats = asyncio.run(run())
+    assert accepted == [True, True, True, False, False]
+    assert after_close is False
+    assert stats["dropped"] == 3 and stats["written"] == 3
+
+
+def test_write_errors_are_counted_not_raised():
+    async def run():
+        logger = ConversationLogger(supabase=None, writer=RecordingWriter(fail=True))
+        logger.log("u1", "user", "hello")
+        await logger.close()
+        return logger.stats()
+
+    stats = asyncio.run(run())
+    assert stats["write_errors"] == 1 and stats["dropped"] == 1
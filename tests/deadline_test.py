@@ -0,0 +1,43 @@
+import pytest
+
+from services.deadline import Deadline, DeadlineExceeded, deadline_stats, record_degradation, request_options
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_slice_is_a_share_of_the_remaining_budget_capped():
+    clock = FakeClock()
+    deadline = Deadline(20, clock=clock)
+    assert deadline.slice((0.5, None)) == 10
+    assert deadline.slice((0.5, 4.0)) == 4.0
+    clock.now += 16
+    assert deadline.remaining() == 4
+    assert deadline.slice((0.5, 8.0)) == 2
+
+
+def test_exhausted_budget_raises_instead_of_starting_a_call():
+    clock = FakeClock()
+    deadline = Deadline(5, clock=clock)
+    clock.now += 4.5
+    assert deadline.expired
+    with pytest.raises(DeadlineExceeded):
+        deadline.slice((1.0, None))
+    with pytest.raises(TimeoutError):
+        request_options(deadline, (1.0, None))
+
+
+def test_request_options_without_deadline_is_empty():
+    assert request_options(None, (0.5, 5.0)) == {}
+    assert request_options(Deadline(30), (0.5, 5.0)) == {"request_options": {"timeout": 5.0}}
+
+
+def test_degradations_are_counted():
+    before = deadline_stats()["degradations"].get("unit_test", 0)
+    record_degradation("unit_test")
+    assert deadline_stats()["degradations"]["unit_test"] == before + 1
@@ -0,0 +1,43 @@
+from services.embedding_cache import EmbeddingCache, cache_key
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, model, text, task_type, **kwargs):
+        self.calls.append((model, text, task_type, kwargs))
+        return [float(len(text)), 0.5, -1.0]
+
+
+def test_key_normalizes_text_and_task_type_but_not_model():
+    assert cache_key("m", "RETRIEVAL_QUERY", "  How to get   to JB ") == cache_key("m", "retrieval_query", "how to get to jb")
+    assert cache_key("m", "retrieval_query", "gentle") != cache_key("other", "retrieval_query", "gentle")
+    assert cache_key("m", "retrieval_query", "gentle") != cache_key("m", "retrieval_document", "gentle")
+
+
+def test_memory_then_disk_then_api(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    embedder = CountingEmbedder()
+    cache = EmbeddingCache(path=path, enabled=True, embed_fn=embedder)
+    assert cache.embed("Gentle", "m", "retrieval_query", request_options={"timeout": 2}) == [6.0, 0.5, -1.0]
+    assert cache.embed("gentle ", "m", "retrieval_query") == [6.0, 0.5, -1.0]
+    assert len(embedder.calls) == 1 and embedder.calls[0][3] == {"request_options": {"timeout": 2}}
+
+    # A new process (or another worker) finds it on disk.
+    restarted = EmbeddingCache(path=path, enabled=True, embed_fn=embedder)
+    assert restarted.embed("gentle", "m", "retrieval_query") == [6.0, 0.5, -1.0]
+    assert len(embedder.calls) == 1
+    stats = restarted.stats()
+    assert stats["disk_hits"] == 1 and stats["api_calls"] == 0 and stats["disk_bytes"] > 0
+    assert cache.stats()["memory"]["hits"] == 1
+
+
+def test_unwritable_path_degrades_to_memory_only(tmp_path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    embedder = CountingEmbedder()
+    cache = EmbeddingCache(path=str(blocker / "sub" / "db.sqlite3"), enabled=True, embed_fn=embedder)
+    cache.embed("quick", "m")
+    cache.embed("quick", "m")
+    assert len(embedder.calls) == 1 and cache.stats()["disk_bytes"] is None
@@ -0,0 +1,32 @@
+import asyncio
+import time
+
+from services.executor import run_blocking
+
+
+def test_blocking_calls_overlap():
+    async def run():
+        start = time.perf_counter()
+        results = await asyncio.gather(
+            run_blocking(time.sleep, 0.2),
+            run_blocking(time.sleep, 0.2),
+            run_blocking(lambda: "done"),
+        )
+        return results, time.perf_counter() - start
+
+    results, elapsed = asyncio.run(run())
+    assert results[-1] == "done"
+    assert elapsed < 0.35
+
+
+def test_exceptions_propagate():
+    def boom():
+        raise ValueError("boom")
+
+    async def run():
+        try:
+            await run_blocking(boom)
+        except ValueError as e:
+            return str(e)
+
+    assert asyncio.run(run()) == "boom"
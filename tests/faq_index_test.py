@@ -0,0 +1,57 @@
+from services.faq_index import FaqIndex
+
+ROWS = [
+    {"id": 1, "question": "Bus to JB?", "answer": "Take CW1.", "embedding": "[1, 0, 0]"},
+    {"id": 2, "question": "Passport validity?", "answer": "6 months.", "embedding": [0, 1, 0]},
+    {"id": 3, "question": "Bus or taxi?", "answer": "Bus is cheaper.", "embedding": [0.8, 0.6, 0]},
+    {"id": 4, "question": "No embedding yet", "answer": "-", "embedding": None},
+]
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+
+    def select(self, *args):
+        return self
+
+    def execute(self):
+        return self
+
+
+class FakeSupabase:
+    def __init__(self, rows, version="v1"):
+        self.rows, self.version, self.selects = rows, version, 0
+
+    def rpc(self, name, params):
+        assert name == "faq_index_version"
+        return FakeQuery(self.version)
+
+    def table(self, name):
+        self.selects += 1
+        return FakeQuery(self.rows)
+
+
+def test_search_returns_match_faqs_shaped_rows_best_first():
+    index = FaqIndex(FakeSupabase(ROWS), enabled=True)
+    assert index.search([1, 0, 0]) is None  # not loaded yet -> caller falls back to the RPC
+    assert index.load() == 3
+    results = index.search([2, 0, 0], match_threshold=0.5, match_count=3)
+    assert [r["id"] for r in results] == [1, 3]
+    assert results[0]["similarity"] == 1.0 and "embedding" not in results[0]
+    assert index.search([0, 0, 1]) == []
+
+
+def test_refresh_reloads_only_when_the_version_changes():
+    supabase = FakeSupabase(ROWS)
+    index = FaqIndex(supabase, enabled=True)
+    index.load()
+    assert not index.refresh_if_changed() and supabase.selects == 1
+    supabase.version = "v2"
+    supabase.rows = ROWS[:1]
+    assert index.refresh_if_changed() and index.stats()["rows"] == 1 and index.version == "v2"
+
+
+def test_disabled_index_never_answers():
+    index = FaqIndex(FakeSupabase(ROWS), enabled=False)
+    assert index.load() == 0 and index.search([1, 0, 0]) is None
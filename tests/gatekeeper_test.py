@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+from flows import gatekeeper
+from flows.gatekeeper import GatekeeperDecisionCache, GatekeeperStats, IntentClassifier, IntentPrediction, featurize
+
+
+def test_featurize_words_bigrams_and_char_ngrams():
+    terms = featurize("Find clinic")
+    assert terms["w:find"] == 1 and terms["b:find clinic"] == 1
+    assert "c:<fi" in terms and "c:ic>" in terms
+    assert featurize("") == {"w:<empty>": 1}
+
+
+def test_shipped_artifact_loads_and_predicts():
+    clf = IntentClassifier.load()
+    assert clf is not None and 0.0 < clf.threshold <= 1.0
+    pred = clf.predict("how do I get from Singapore to JB by bus")
+    assert pred.intent == "travel_faq"
+    assert pred.confidence == max(clf.probabilities("how do I get from Singapore to JB by bus"))
+
+
+def test_round_trip_preserves_predictions():
+    labels = ["find_clinic", "out_of_scope"]
+    clf = IntentClassifier(labels, {"w:clinic": 0, "w:weather": 1}, np.array([1.0, 1.0]),
+                           np.array([[2.0, -2.0], [-2.0, 2.0]]), np.zeros(2), temperature=1.0, threshold=0.8)
+    restored = IntentClassifier.from_dict(clf.to_dict())
+    for text in ("clinic", "weather today", "unknown words"):
+        assert restored.predict(text) == clf.predict(text)
+    assert clf.predict("clinic").accepted and not clf.predict("unknown words").accepted
+
+
+def test_shadow_stats_track_agreement():
+    stats = GatekeeperStats()
+    stats.record_shadow(IntentPrediction("find_clinic", 0.9, True), "find_clinic")
+    stats.record_shadow(IntentPrediction("find_clinic", 0.6, False), "general_dental_question")
+    out = stats.stats()
+    assert out["shadow_compared"] == 2 and out["shadow_agreement"] == 0.5
+    assert out["shadow_disagreements"] == {"find_clinic->general_dental_question": 1}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_decision_cache_keys_on_message_and_state_signature():
+    clock = FakeClock()
+    cache = GatekeeperDecisionCache(max_entries=2, ttl_seconds=60, min_confidence=0.7, enabled=True, clock=clock)
+    state = {"candidate_pool": [{"id": 1}], "location_preference": "jb"}
+    assert cache.put("Can you help me?", state, {"intent": "find_clinic", "confidence": 0.9})
+    assert cache.get("  can you   help me ", state) == {"intent": "find_clinic", "confidence": 0.9}
+    assert cache.get("can you help me", {"location_preference": "jb"}) is None
+    assert cache.get("can you help me", {**state, "booking_context": {"status": "gathering_info"}}) is None
+    clock.now = 61
+    assert cache.get("can you help me", state) is None
+
+
+def test_decision_cache_skips_low_confidence_and_tracks_savings():
+    cache = GatekeeperDecisionCache(max_entries=8, ttl_seconds=60, min_confidence=0.7, enabled=True)
+    assert not cache.put("hmm", None, {"intent": "out_of_scope", "confidence": 0.4})
+    assert cache.get("hmm", None) is None
+    cache.record_call(2.0)
+    cache.put("hello", None, {"intent": "out_of_scope", "confidence": 0.95})
+    cache.get("hello", None)
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["low_confidence_skipped"] == 1
+    assert stats["saved_seconds"] == 2.0
+
+
+class FakeFunctionCall:
+    def __init__(self, args):
+        self.args = args
+
+
+class FakeGatekeeperModel:
+    def __init__(self, args):
+        self.args = args
+        self.calls = []
+
+    def generate_content(self, prompt, tools=None):
+        self.calls.append(tools)
+        part = SimpleNamespace(function_call=FakeFunctionCall(self.args))
+        return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+def test_fused_call_returns_intent_and_entities_and_caches_only_the_intent(monkeypatch):
+    monkeypatch.setattr(gatekeeper, "fused_decision_tool", lambda: "tool")
+    model = FakeGatekeeperModel({"intent": "find_clinic", "confidence": 0.92, "service": "root_canal", "township": None})
+    cache = GatekeeperDecisionCache(max_entries=8, ttl_seconds=60, min_confidence=0.7, enabled=True)
+
+    decision, cached = asyncio.run(gatekeeper.decide_with_llm(model, [], "root canal please", cache=cache, fused=True))
+    assert not cached and model.calls == [["tool"]]
+    assert decision == {"intent": "find_clinic", "confidence": 0.92,
+                        "entities": {"service": "root_canal", "township": None}}
+
+    decision, cached = asyncio.run(gatekeeper.decide_with_llm(model, [], "root canal please", cache=cache, fused=True))
+    assert cached and len(model.calls) == 1
+    assert "entities" not in decision
@@ -0,0 +1,76 @@
+import time
+
+import jwt
+import pytest
+
+from services.jwt_verifier import JwtVerifier, UnknownSigningKey
+
+SECRET = "test-secret-with-enough-length-for-hs256"
+
+
+def make_token(exp_in=3600, **claims):
+    payload = {"sub": "user-1", "aud": "authenticated", "exp": int(time.time()) + exp_in, **claims}
+    return jwt.encode(payload, SECRET, algorithm="HS256")
+
+
+def test_claims_are_cached_until_expiry():
+    now = [time.time()]
+    verifier = JwtVerifier(SECRET, clock=lambda: now[0])
+    token = make_token(exp_in=60)
+
+    assert verifier.verify(token)["sub"] == "user-1"
+    assert verifier.verify(token)["sub"] == "user-1"
+    stats = verifier.stats()
+    assert stats["verifications"] == 1
+    assert stats["claims_cache"]["hits"] == 1
+
+    now[0] += 120  # past exp (by the cache clock): the entry is gone and the token is verified again
+    verifier.verify(token)
+    stats = verifier.stats()
+    assert stats["verifications"] == 2
+    assert stats["claims_cache"]["expirations"] == 1
+
+
+def test_invalid_tokens_are_not_cached():
+    verifier = JwtVerifier(SECRET)
+    bad = jwt.encode({"sub": "x", "aud": "authenticated", "exp": int(time.time()) + 60}, "another-secret-of-sufficient-length", algorithm="HS256")
+    for _ in range(2):
+        with pytest.raises(jwt.InvalidSignatureError):
+            verifier.verify(bad)
+    assert verifier.stats()["verify_failures"] == 2
+    assert verifier.stats()["claims_cache"]["entries"] == 0
+
+
+class FakeKey:
+    def __init__(self, key_id, key):
+        self.key_id, self.key = key_id, key
+
+
+class FakeJwksClient:
+    def __init__(self, keys):
+        self.keys = keys
+        self.fetches = 0
+
+    def get_signing_keys(self, refresh=False):
+        self.fetches += 1
+        return self.keys
+
+
+def test_unknown_kid_is_rejected_without_waiting_and_triggers_refresh():
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    token = jwt.encode({"sub": "user-2", "aud": "authenticated", "exp": int(time.time()) + 60},
+                       private_key, algorithm="ES256", headers={"kid": "k2"})
+    client = FakeJwksClient([])
+    verifier = JwtVerifier(SECRET, client, refresh_cooldown=0)
+
+    client.keys = [FakeKey("k2", private_key.public_key())]  # key rotated in after our last fetch
+    with pytest.raises(UnknownSigningKey):
+        verifier.verify(token)
+
+    deadline = time.time() + 2
+    while verifier.stats()["jwks_keys"] == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert client.fetches == 1
+    assert verifier.verify(token)["sub"] == "user-2"
@@ -0,0 +1,35 @@
+from flows.message_features import analyze, normalize_location_terms
+
+
+def test_location_priority_matches_the_original_lookup_order():
+    assert normalize_location_terms("Show me clinics in Singapore") == "sg"
+    assert normalize_location_terms("across the border please") == "jb"
+    assert normalize_location_terms("compare sg and jb") == "both"
+    assert normalize_location_terms("around Taman Molek") == "jb"
+    assert normalize_location_terms("near bedok") == "sg"
+    assert normalize_location_terms("scaling") is None
+
+
+def test_ordinals_prefer_compound_forms_and_respect_pool_size():
+    assert analyze("the second one please").ordinal_index(5) == 1
+    assert analyze("book #3").ordinal_index(5) == 2
+    assert analyze("book #3").ordinal_index(2) is None
+    assert analyze("1st or the third option?").ordinal_index(5) == 2  # compound "third option" wins
+    assert analyze("first, then 2nd").ordinal_index(1) == 0
+    assert analyze("option#2").ordinal_index(5) is None
+
+
+def test_service_and_township_heuristics():
+    features = analyze("Need a root canal and cleaning near Mount Austin, JB")
+    assert features.service == "root_canal"
+    assert features.township_hint == "mount austin jb"
+    assert analyze("teeth cleaning in singapore").township_hint is None
+    assert analyze("polish please").service == "scaling"
+
+
+def test_analysis_is_shared_per_message():
+    features = analyze("I want to book the first clinic")
+    assert analyze("I want to book the first clinic") is features
+    assert {"verb"} <= features.booking_signals
+    assert features.has("booking") and features.has("ordinal_booking")
+    assert features.tokens[-1] == "clinic"
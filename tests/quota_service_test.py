@@ -0,0 +1,160 @@
+import threading
+
+from services.quota_service import (
+    UNLIMITED,
+    InMemoryQuotaStore,
+    QuotaLedger,
+    SupabaseQuotaStore,
+    consume_api_call,
+)
+
+
+def test_consume_decrements_until_exhausted():
+    store = InMemoryQuotaStore({"u1": 2})
+    first = consume_api_call(store, "u1")
+    second = consume_api_call(store, "u1")
+    third = consume_api_call(store, "u1")
+    assert (first.allowed, first.remaining) == (True, 1)
+    assert (second.allowed, second.remaining) == (True, 0)
+    assert (third.allowed, third.remaining) == (False, 0)
+
+
+def test_null_and_missing_profiles_are_unlimited():
+    store = InMemoryQuotaStore({"u_null": None})
+    for user_id in ("u_null", "u_missing"):
+        decision = consume_api_call(store, user_id)
+        assert decision.allowed and decision.remaining == UNLIMITED
+
+
+def test_store_errors_fail_open():
+    class BrokenStore:
+        def consume(self, user_id):
+            raise RuntimeError("db down")
+
+    decision = consume_api_call(BrokenStore(), "u1")
+    assert decision.allowed and decision.remaining == UNLIMITED
+
+
+def test_concurrent_consumers_never_overspend():
+    store = InMemoryQuotaStore({"u1": 50})
+    allowed = []
+
+    def worker():
+        for _ in range(20):
+            allowed.append(consume_api_call(store, "u1").allowed)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert allowed.count(True) == 50
+    assert store.balances["u1"] == 0
+
+
+def test_supabase_store_parses_rpc_payload():
+    class FakeRpc:
+        def __init__(self, data):
+            self.data = data
+
+        def execute(self):
+            return self
+
+    class FakeSupabase:
+        def __init__(self, data):
+            self.data = data
+            self.calls = []
+
+        def rpc(self, name, params):
+            self.calls.append((name, params))
+            return FakeRpc(self.data)
+
+    client = FakeSupabase({"allowed": True, "remaining": 7})
+    decision = SupabaseQuotaStore(client).consume("u1")
+    assert client.calls == [("consume_api_call", {"p_user_id": "u1"})]
+    assert (decision.allowed, decision.remaining) == (True, 7)
+
+    exhausted = SupabaseQuotaStore(FakeSupabase([{"allowed": False, "remaining": 0}])).consume("u1")
+    assert (exhausted.allowed, exhausted.remaining) == (False, 0)
+
+    unlimited = SupabaseQuotaStore(FakeSupabase({"allowed": True, "remaining": None})).consume("u1")
+    assert unlimited.remaining == UNLIMITED
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ledger_defers_writes_until_flush():
+    store = InMemoryQuotaStore({"u1": 10})
+    ledger = QuotaLedger(store, max_drift=100)
+    decisions = [ledger.consume("u1") for _ in range(3)]
+    assert [d.remaining for d in decisions] == [9, 8, 7]
+    assert store.balances["u1"] == 10
+    assert ledger.stats()["pending_calls"] == 3
+
+    assert ledger.flush() == 3
+    assert store.balances["u1"] == 7
+    stats = ledger.stats()
+    assert stats["pending_calls"] == 0 and stats["flushed_calls"] == 3 and stats["loads"] == 1
+
+
+def test_ledger_enforces_limit_locally():
+    ledger = QuotaLedger(InMemoryQuotaStore({"u1": 2}), max_drift=100)
+    assert [ledger.consume("u1").allowed for _ in range(3)] == [True, True, False]
+    assert ledger.stats()["denied"] == 1
+
+
+def test_ledger_drift_bound_forces_flush_and_sees_other_workers():
+    store = InMemoryQuotaStore({"u1": 10})
+    worker_a = QuotaLedger(store, max_drift=2)
+    worker_b = QuotaLedger(store, max_drift=2)
+    worker_a.consume("u1")
+    worker_b.consume("u1")
+    worker_a.consume("u1")  # hits the bound -> synchronous flush of worker A's 2 calls
+    assert store.balances["u1"] == 8
+    assert worker_a.stats()["pending_calls"] == 0
+    worker_b.consume("u1")  # worker B flushes and picks up worker A's usage
+    assert store.balances["u1"] == 6
+    assert worker_b.consume("u1").remaining == 5
+
+
+def test_ledger_refreshes_stale_balances():
+    clock = FakeClock()
+    store = InMemoryQuotaStore({"u1": 0})
+    ledger = QuotaLedger(store, refresh_interval=60, clock=clock)
+    assert not ledger.consume("u1").allowed
+    store.balances["u1"] = 5  # top-up in the database
+    assert not ledger.consume("u1").allowed
+    clock.now = 61
+    assert ledger.consume("u1").allowed
+
+
+def test_ledger_keeps_pending_on_flush_failure_and_fails_open_on_load_error():
+    class FlakyStore(InMemoryQuotaStore):
+        fail = True
+
+        def apply_usage(self, usage):
+            if self.fail:
+                raise RuntimeError("db down")
+            return super().apply_usage(usage)
+
+        def load_balance(self, user_id):
+            if user_id == "broken":
+                raise RuntimeError("db down")
+            return super().load_balance(user_id)
+
+    store = FlakyStore({"u1": 5})
+    ledger = QuotaLedger(store, max_drift=100)
+    ledger.consume("u1")
+    assert ledger.flush() == 0
+    assert ledger.stats()["flush_errors"] == 1 and ledger.stats()["pending_calls"] == 1
+    store.fail = False
+    assert ledger.flush() == 1 and store.balances["u1"] == 4
+
+    decision = ledger.consume("broken")
+    assert decision.allowed and decision.remaining == UNLIMITED
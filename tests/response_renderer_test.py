@@ -0,0 +1,54 @@
+import pytest
+
+from flows import response_renderer
+from flows.response_renderer import RenderContext, get_renderer, render_template
+
+CLINICS = [
+    {"id": 1, "name": "Smile Dental", "rating": 4.9, "reviews": 1234, "address": "1 Jalan A, JB",
+     "website_url": "https://smile.example", "dental_implant": True},
+    {"id": 2, "name": "Gentle Care", "rating": 4.7, "reviews": 80, "address": "2 Jalan B, JB"},
+    {"id": 3, "name": "Bright Teeth", "rating": 4.6, "reviews": None},
+]
+
+
+def test_template_is_deterministic_and_uses_all_inputs():
+    ctx = RenderContext(CLINICS, "Top 3 clinics chosen by rating and review volume.", "jb", ["root_canal"])
+    text = render_template(ctx)
+    assert text == render_template(ctx)
+    assert text.startswith("Top 3 clinics chosen by rating and review volume.")
+    assert "root canal in Johor Bahru" in text
+    assert "**1. Smile Dental**" in text and "(1,234 reviews)" in text
+    assert "Top Rated, High Review Volume, Implant Focus" in text
+    assert "**3. Bright Teeth**" in text and "Google rating: 4.6\n" in text
+
+
+def fresh_renderer_module(name):
+    """A separate copy of flows/response_renderer.py, so CLINIC_RESPONSE_RENDERER is re-read from the env."""
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(f"flows.{name}", response_renderer.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_llm_renderer_is_opt_in_and_unknown_names_fall_back(monkeypatch):
+    monkeypatch.delenv("CLINIC_RESPONSE_RENDERER", raising=False)
+    default = fresh_renderer_module("renderer_default")
+    assert default.get_renderer() is default.render_template
+
+    monkeypatch.setenv("CLINIC_RESPONSE_RENDERER", "LLM")
+    opted_in = fresh_renderer_module("renderer_llm")
+    assert opted_in.get_renderer() is opted_in.render_llm
+
+    assert get_renderer("template") is render_template
+    assert get_renderer("nonsense") is render_template
+
+
+def test_llm_renderer_raises_on_empty_output():
+    class EmptyModel:
+        def generate_content(self, prompt, **kwargs):
+            return type("R", (), {"text": "  "})()
+
+    with pytest.raises(ValueError):
+        response_renderer.render_llm(RenderContext(CLINICS, "note", generation_model=EmptyModel()))
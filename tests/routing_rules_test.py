@@ -0,0 +1,52 @@
+import random
+import re
+
+from flows.routing_rules import CONTAINS, PREFIX, REGEX, ROUTING_RULES, WORD_PREFIX, RuleMatcher, match
+
+
+def naive_match(text):
+    """The per-list `any(...)` scans the compiled matcher replaces."""
+    t = text.lower().strip()
+    matched = set()
+    for rule in ROUTING_RULES:
+        if rule.kind == CONTAINS:
+            hit = any(p in t for p in rule.patterns)
+        elif rule.kind == PREFIX:
+            hit = any(t.startswith(p) for p in rule.patterns)
+        elif rule.kind == WORD_PREFIX:
+            hit = any(t.startswith(p) or f" {p}" in t for p in rule.patterns)
+        else:
+            hit = any(re.search(p, t) for p in rule.patterns)
+        if hit:
+            matched.add(rule.name)
+    return matched
+
+
+def test_single_pass_matches_every_rule_like_the_naive_scans():
+    vocab = [p for r in ROUTING_RULES if r.kind != REGEX for p in r.patterns] + ["the", "xyz", "in", "clinics", "mean"]
+    rng = random.Random(7)
+    matcher = RuleMatcher()
+    for _ in range(3000):
+        words = [rng.choice(vocab) for _ in range(rng.randint(1, 6))]
+        text = ("" if rng.random() < 0.3 else " ").join(words)
+        assert set(matcher.match(text)) == naive_match(text), text
+
+
+def test_prefix_closure_and_positional_kinds():
+    assert {"booking", "ordinal_booking"} <= match("Booking the 2nd one please")
+    assert "reset" in match("reset please")
+    assert "reset" not in match("please reset")
+    assert "qna_question" in match("so how long does it take")
+    assert "qna_question" not in match("that undoes nothing")
+    assert {"educational", "dental_term"} <= match("what does bonding mean")
+
+
+def test_hits_are_counted_once_per_call_even_when_memoized():
+    matcher = RuleMatcher()
+    first = matcher.match("Find scaling clinics in JB")
+    # Same normalized message: served from the scan memo, but still routed traffic
+    assert matcher.match("find scaling clinics in jb ") is first
+    stats = matcher.stats()
+    assert stats["calls"] == 2
+    assert stats["hits"]["find_service_clinics"] == 2
+    assert stats["hits"]["reset"] == 0
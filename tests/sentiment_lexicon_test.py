@@ -0,0 +1,121 @@
+import json
+import os
+
+import pytest
+
+from flows.sentiment_lexicon import (SENTIMENT_EMBEDDINGS_PATH, SENTIMENT_INTENTS, SENTIMENT_LEXICON_PATH, SentimentScorer,
+                                     load_dimension_embeddings)
+
+FIELDS = ["sentiment_dentist_skill", "sentiment_pain_management", "sentiment_cost_value"]
+DIMENSIONS = {"sentiment_dentist_skill": [1, 0, 0], "sentiment_pain_management": [0, 2, 0], "sentiment_cost_value": [0, 0, 1]}
+
+
+def test_lexicon_word_needs_no_embedding():
+    scorer = SentimentScorer(FIELDS, {"gentle": [0.1, 0.9, 0.2]}, DIMENSIONS)
+
+    def embed_fn(word):
+        raise AssertionError("lexicon words must not be embedded")
+
+    assert scorer.scores(" Gentle ", embed_fn) == pytest.approx(
+        {"sentiment_dentist_skill": 0.1, "sentiment_pain_management": 0.9, "sentiment_cost_value": 0.2})
+    assert scorer.lookups["lexicon"] == 1
+
+
+def test_unknown_word_is_scored_against_every_dimension():
+    scorer = SentimentScorer(FIELDS, {}, DIMENSIONS)
+    scores = scorer.scores("tender", lambda word: [0, 3, 4])
+
+    assert scores == pytest.approx({"sentiment_dentist_skill": 0.0, "sentiment_pain_management": 0.6, "sentiment_cost_value": 0.8})
+    assert scorer.lookups["embedded"] == 1
+    # Neither lexicon nor dimension vectors: nothing to score with
+    assert SentimentScorer(FIELDS, {}).scores("tender", lambda word: [0, 3, 4]) is None
+
+
+def test_load_reorders_columns_and_tolerates_missing_file(tmp_path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps({"version": "v1", "source": "embedding", "fields": list(reversed(FIELDS)),
+                                "words": {"cheap": [0.9, 0.2, 0.1]}}))
+
+    scorer = SentimentScorer.load(FIELDS + ["sentiment_convenience"], path=str(path))
+    assert scorer.scores("cheap") == pytest.approx({"sentiment_dentist_skill": 0.1, "sentiment_pain_management": 0.2,
+                                                    "sentiment_cost_value": 0.9, "sentiment_convenience": 0.0})
+    assert not SentimentScorer.load(FIELDS, path=str(tmp_path / "missing.json")).available
+
+
+def test_lexical_artifact_is_ignored_unless_allowed(tmp_path):
+    path = tmp_path / "lexicon.json"
+    path.write_text(json.dumps({"version": "v1", "source": "lexical", "fields": FIELDS, "words": {"cheap": [0, 0, 1.0]}}))
+
+    assert not SentimentScorer.load(FIELDS, path=str(path)).available
+    assert SentimentScorer.load(FIELDS, path=str(path), allow_lexical=True).scores("cheap")["sentiment_cost_value"] == 1.0
+
+
+def test_embeddings_artifact_keeps_rows_with_unchanged_descriptions(tmp_path):
+    from flows.sentiment_lexicon import load_dimension_embeddings, save_dimension_embeddings
+
+    path = str(tmp_path / "intents.npy")
+    intents = {field: f"{field} words" for field in FIELDS}
+    save_dimension_embeddings(intents, DIMENSIONS, "models/test", "retrieval_query", "v1", path)
+
+    assert load_dimension_embeddings(intents, path) == pytest.approx(DIMENSIONS)
+    edited = {**intents, "sentiment_cost_value": "cheap affordable", "sentiment_convenience": "quick"}
+    assert sorted(load_dimension_embeddings(edited, path)) == ["sentiment_dentist_skill", "sentiment_pain_management"]
+    assert load_dimension_embeddings(intents, str(tmp_path / "missing.npy")) == {}
+
+
+def test_refresh_embeds_only_stale_dimensions():
+    scorer = SentimentScorer(FIELDS, {}, {"sentiment_dentist_skill": [1, 0, 0]})
+    assert scorer.matrix is None and not scorer.available
+
+    embedded = []
+
+    def embed_fn(text):
+        embedded.append(text)
+        if text == "pain":
+            raise ConnectionError("network blip")
+        return [0, 0, 1]
+
+    intents = {"sentiment_dentist_skill": "skill", "sentiment_pain_management": "pain", "sentiment_cost_value": "cost"}
+    # Stops at the first failure instead of timing out once per dimension
+    assert scorer.refresh(intents, embed_fn) == ["sentiment_pain_management", "sentiment_cost_value"]
+    assert embedded == ["pain"] and scorer.matrix is None
+    # Out-of-vocabulary words stay unscored until the matrix exists
+    assert scorer.scores("tender", lambda word: [0, 1, 0]) is None
+
+    assert scorer.refresh(intents, lambda text: [0, 1, 0]) == []
+    assert scorer.matrix.shape == (3, 3)
+    assert scorer.refreshes == {"runs": 2, "errors": 1}
+
+
+def test_concurrent_refresh_is_skipped():
+    scorer = SentimentScorer(FIELDS, {})
+    intents = {field: field for field in FIELDS}
+
+    def embed_fn(text):
+        # A second refresh while this one holds the lock returns at once without embedding
+        assert scorer.refresh(intents, lambda text: pytest.fail("concurrent refresh embedded")) == scorer.stale_fields
+        return [1, 0, 0]
+
+    assert scorer.refresh(intents, embed_fn) == []
+    assert scorer.refreshes["runs"] == 1
+
+
+@pytest.mark.skipif(not os.path.exists(SENTIMENT_EMBEDDINGS_PATH),
+                    reason="artifact not built yet: scripts/build_sentiment_embeddings.py")
+def test_committed_embeddings_artifact_covers_every_dimension():
+    assert sorted(load_dimension_embeddings(SENTIMENT_INTENTS)) == sorted(SENTIMENT_INTENTS)
+
+
+@pytest.mark.skipif(not os.path.exists(SENTIMENT_LEXICON_PATH),
+                    reason="artifact not built yet: scripts/build_sentiment_lexicon.py")
+def test_committed_lexicon_is_an_embedding_build_of_the_vocabulary():
+    with open(SENTIMENT_LEXICON_PATH, "r", encoding="utf-8") as f:
+        artifact = json.load(f)
+    assert artifact["source"] == "embedding"
+    assert artifact["fields"] == list(SENTIMENT_INTENTS)
+
+    vocabulary_path = os.path.join(os.path.dirname(SENTIMENT_LEXICON_PATH), "adjective_vocabulary.txt")
+    with open(vocabulary_path, "r", encoding="utf-8") as f:
+        vocabulary = {line.strip().lower() for line in f if line.strip() and not line.startswith("#")}
+    scorer = SentimentScorer.load(list(SENTIMENT_INTENTS))
+    assert sorted(word for word in vocabulary if scorer.scores(word) is None) == []
@@ -0,0 +1,65 @@
+from services.lru_cache import TTLCache
+from services.session_cache import SessionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_lru_eviction_and_expiry():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=2, ttl_seconds=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "a" becomes most recently used
+    cache.set("c", 3)  # evicts "b"
+    assert cache.get("b") is None
+    clock.now = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["expirations"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 2
+
+
+def test_ttl_cache_byte_bound_and_per_entry_ttl():
+    cache = TTLCache(max_bytes=10, sizeof=len)
+    cache.set("a", "xxxxxx")
+    cache.set("b", "yyyyyy")  # 12 bytes > 10 -> "a" evicted
+    assert cache.get("a") is None and cache.get("b") == "yyyyyy"
+    assert cache.set("huge", "z" * 11) is False
+    assert cache.set("expired", "v", ttl=0) is False
+    assert cache.stats()["bytes"] == 6
+
+
+def test_session_cache_returns_isolated_copies():
+    cache = SessionCache(max_bytes=1024 * 1024, ttl_seconds=60, enabled=True)
+    cache.put("s1", "u1", {"session_id": "s1", "state": {"candidate_pool": []}, "context": []})
+    row = cache.get("s1", "u1")
+    row["state"]["candidate_pool"].append({"name": "mutated"})
+    assert cache.get("s1", "u1")["state"]["candidate_pool"] == []
+    assert cache.get("s1", "other-user") is None
+
+
+def test_session_cache_write_through_update_and_metrics():
+    clock = FakeClock()
+    cache = SessionCache(max_bytes=1024 * 1024, ttl_seconds=60, enabled=True, clock=clock)
+    cache.update("s1", "u1", state={"location_preference": "sg"}, context=[{"role": "user", "content": "hi"}])
+    row = cache.get("s1", "u1")
+    assert row["state"] == {"location_preference": "sg"} and row["session_id"] == "s1"
+    cache.update("s1", "u1", state={"location_preference": "jb"})
+    assert cache.get("s1", "u1")["context"] == [{"role": "user", "content": "hi"}]
+    clock.now = 61
+    assert cache.get("s1", "u1") is None
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 1 and stats["bytes"] == 0
+
+
+def test_disabled_session_cache_is_a_no_op():
+    cache = SessionCache(enabled=False)
+    cache.put("s1", "u1", {"state": {}})
+    cache.update("s1", "u1", state={})
+    assert cache.get("s1", "u1") is None
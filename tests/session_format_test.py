@@ -0,0 +1,94 @@
+from services.session_delta import apply_ops, diff_session
+from services.session_format import decode_row, decode_session, encode_session, is_compact
+
+
+class FakeCatalog:
+    def __init__(self, rows):
+        self.rows = rows
+        self.requests = []
+
+    def get_many(self, refs):
+        refs = list(refs)
+        self.requests.append(refs)
+        return {ref: dict(self.rows[ref]) for ref in refs if ref in self.rows}
+
+
+CATALOG_ROW = {"id": 7, "name": "Smile Dental", "address": "1 Jalan JB", "rating": 4.9, "reviews": 320, "country": "MY"}
+
+
+def test_compact_round_trip_windows_history_and_stores_clinics_by_ref():
+    clinic = {**CATALOG_ROW, "tags": ["Top Rated"], "distance": 1.2}
+    state = {"candidate_pool": [clinic, {"name": "No Id Clinic"}], "applied_filters": {"country": "MY"}}
+    history = [{"role": "user", "content": f"m{i}"} for i in range(30)]
+
+    stored_state, stored_context = encode_session(state, history, window=6, compression="none")
+    assert is_compact(stored_state)
+    assert stored_state["candidate_pool"][0] == {"$ref": "MY:7", "id": 7, "name": "Smile Dental", "address": "1 Jalan JB",
+                                                  "rating": 4.9, "reviews": 320, "tags": ["Top Rated"], "distance": 1.2}
+    assert stored_context == history[-6:]
+
+    decoded_state, decoded_history = decode_session(stored_state, stored_context, FakeCatalog({"MY:7": CATALOG_ROW}))
+    assert decoded_state == state
+    assert decoded_history == history[-6:]
+
+
+def test_compressed_blob_and_legacy_rows_decode():
+    state = {"booking_context": {"status": "complete"}}
+    stored_state, stored_context = encode_session(state, [{"role": "user", "content": "hi"}], compression="zlib")
+    assert stored_state["codec"] == "zlib" and stored_context == []
+    assert decode_session(stored_state, stored_context) == (state, [{"role": "user", "content": "hi"}])
+
+    legacy = {"session_id": "s1", "state": {"candidate_pool": [CATALOG_ROW]}, "context": None}
+    assert decode_row(legacy) is legacy
+
+
+def test_unknown_ref_keeps_a_stub_in_position():
+    stored_state, _ = encode_session({"candidate_pool": [{"id": 1, "country": "SG", "name": "Gone"}]}, [], compression="none")
+    decoded_state, _ = decode_session(stored_state, [], FakeCatalog({}))
+    assert decoded_state["candidate_pool"] == [{"id": 1, "country": "SG", "name": "Gone"}]
+
+
+def test_failed_catalog_fetch_keeps_the_stored_clinic():
+    from services.clinic_catalog import ClinicCatalog
+
+    class FailingSupabase:
+        def table(self, name):
+            raise RuntimeError("column sg_clinics.phone does not exist")
+
+    clinic = {**CATALOG_ROW, "tags": ["Top Rated"]}
+    stored_state, _ = encode_session({"candidate_pool": [clinic]}, [], compression="none")
+    decoded_state, _ = decode_session(stored_state, [], ClinicCatalog(FailingSupabase()))
+    assert decoded_state["candidate_pool"] == [clinic]
+
+
+def test_sliding_window_diffs_as_trim_and_append():
+    base = [{"role": "user", "content": str(i)} for i in range(6)]
+    new = base + [{"role": "assistant", "content": "6"}, {"role": "user", "content": "7"}]
+    base_cols = encode_session({}, base, window=6, compression="none")
+    new_cols = encode_session({}, new, window=6, compression="none")
+    ops = diff_session(*base_cols, *new_cols)
+    assert [op["op"] for op in ops] == ["remove", "remove", "add", "add"]
+    assert apply_ops(*base_cols, ops) == new_cols
+
+
+def test_catalog_projects_rows_from_select_star():
+    from services.clinic_catalog import ClinicCatalog
+
+    class Query:
+        def __init__(self, rows):
+            self.data, self.columns = rows, None
+
+        def select(self, columns):
+            self.columns = columns
+            return self
+
+        def in_(self, column, ids):
+            return self
+
+        def execute(self):
+            return self
+
+    query = Query([{"id": 7, "name": "Smile Dental", "embedding": [0.1] * 4, "sentiment_cost_value": 0.8}])
+    supabase = type("Supabase", (), {"table": lambda self, name: query})()
+    assert ClinicCatalog(supabase).get_many(["MY:7"]) == {"MY:7": {"id": 7, "name": "Smile Dental", "country": "MY"}}
+    assert query.columns == "*"
@@ -0,0 +1,84 @@
+import asyncio
+
+from services.session_cache import SessionCache
+from services.session_delta import apply_ops, diff_session
+from services.session_unit_of_work import SessionUnitOfWork
+
+
+class Msg:
+    def __init__(self, role, content):
+        self.role, self.content = role, content
+
+    def model_dump(self):
+        return {"role": self.role, "content": self.content}
+
+
+def test_stages_coalesce_into_one_write_and_update_cache():
+    writes = []
+    cache = SessionCache(enabled=True)
+    uow = SessionUnitOfWork("s1", "u1", lambda *args: writes.append(args), cache=cache)
+    history = [Msg("user", "book the 2nd one")]
+
+    uow.stage({"step": "resolved"}, history)
+    uow.stage({"step": "booking"}, history, assistant_reply="Confirm your details?")
+    assert cache.get("s1", "u1")["state"] == {"step": "booking"}
+    assert writes == []
+
+    asyncio.run(uow.commit())
+    asyncio.run(uow.commit())
+    assert writes == [("s1", "u1", {"step": "booking"}, [
+        {"role": "user", "content": "book the 2nd one"},
+        {"role": "assistant", "content": "Confirm your details?"},
+    ])]
+    assert not uow.dirty
+
+
+def test_commit_without_stage_is_a_noop():
+    writes = []
+    uow = SessionUnitOfWork("s1", "u1", lambda *args: writes.append(args))
+    asyncio.run(uow.commit())
+    assert writes == []
+
+
+def test_delta_mode_sends_only_changed_keys_and_new_turns():
+    deltas = []
+    loaded_state = {"applied_filters": {"country": "SG"}, "candidate_pool": [{"id": 1}], "stale": True}
+    loaded_history = [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}]
+    uow = SessionUnitOfWork("s1", "u1", writer=None, delta_writer=lambda *args: deltas.append(args),
+                            baseline=(loaded_state, loaded_history))
+
+    loaded_state["applied_filters"] = {"country": "MY"}  # handlers mutate the loaded state in place
+    del loaded_state["stale"]
+    history = [Msg(m["role"], m["content"]) for m in loaded_history] + [Msg("user", "in JB please")]
+    uow.stage(loaded_state, history, assistant_reply="Here are clinics in JB")
+    asyncio.run(uow.commit())
+
+    (_, _, ops, state, full_history), = deltas
+    assert ops == [
+        {"op": "replace", "path": "/state/applied_filters", "value": {"country": "MY"}},
+        {"op": "remove", "path": "/state/stale"},
+        {"op": "add", "path": "/context/-", "value": {"role": "user", "content": "in JB please"}},
+        {"op": "add", "path": "/context/-", "value": {"role": "assistant", "content": "Here are clinics in JB"}},
+    ]
+    base_state = {"applied_filters": {"country": "SG"}, "candidate_pool": [{"id": 1}], "stale": True}
+    assert apply_ops(base_state, loaded_history, ops) == (state, full_history)
+
+
+def test_diff_replaces_history_that_is_not_an_extension():
+    ops = diff_session({"a/b": 1}, [{"role": "user", "content": "old"}], {"a/b": 1}, [{"role": "user", "content": "new"}])
+    assert ops == [{"op": "replace", "path": "/context", "value": [{"role": "user", "content": "new"}]}]
+    assert diff_session({"k": 1}, [], {"k": 1}, []) == []
+    assert apply_ops({}, [], diff_session({}, [], {"a/b~": 2}, [])) == ({"a/b~": 2}, [])
+
+
+def test_discard_drops_the_staged_write_and_cached_state():
+    writes = []
+    cache = SessionCache(enabled=True)
+    cache.put("s1", "u1", {"session_id": "s1", "state": {"step": "start"}, "context": []})
+    uow = SessionUnitOfWork("s1", "u1", lambda *args: writes.append(args), cache=cache)
+
+    uow.stage({"step": "half-done"}, [Msg("user", "find a clinic")])
+    uow.discard()
+    asyncio.run(uow.commit())
+    assert writes == []
+    assert cache.get("s1", "u1") is None
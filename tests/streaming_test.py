@@ -0,0 +1,54 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from services.executor import run_blocking
+from services.streaming import TokenSink, generate_text, sse_event
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("no text parts")
+        return self._text
+
+
+class FakeModel:
+    def generate_content(self, prompt, stream=False):
+        if not stream:
+            return SimpleNamespace(text="Hello there")
+        return iter([FakeChunk("Hello"), FakeChunk(None), FakeChunk(" there")])
+
+
+def test_generate_text_without_sink_is_a_plain_call():
+    assert generate_text(FakeModel(), "prompt") == "Hello there"
+
+
+def test_tokens_emitted_from_pool_thread_reach_the_event_loop():
+    async def scenario():
+        sink = TokenSink()
+
+        async def produce():
+            try:
+                return await run_blocking(generate_text, FakeModel(), "prompt", sink)
+            finally:
+                sink.close()
+
+        task = asyncio.create_task(produce())
+        received = [text async for text in sink]
+        return await task, received, sink
+
+    full, received, sink = asyncio.run(scenario())
+    assert full == "Hello there"
+    assert received == ["Hello", " there"]
+    assert sink.started.is_set() and sink.tokens == 2
+
+
+def test_sse_event_format():
+    frame = sse_event("done", {"session_id": "abc"})
+    assert frame.startswith("event: done\ndata: ") and frame.endswith("\n\n")
+    assert json.loads(frame.split("data: ", 1)[1]) == {"session_id": "abc"}
@@ -0,0 +1,78 @@
+import pytest
+
+from flows import travel_flow
+from services import embedding_cache
+
+
+@pytest.fixture(autouse=True)
+def uncached_embeddings(monkeypatch):
+    monkeypatch.setattr(embedding_cache, "embedding_cache", embedding_cache.EmbeddingCache(path=None, enabled=False))
+
+
+class ExplodingClient:
+    def rpc(self, *args, **kwargs):
+        raise AssertionError("retrieval should not run")
+
+
+def test_is_travel_candidate_guard():
+    assert not travel_flow.is_travel_candidate("")
+    assert not travel_flow.is_travel_candidate("JB")
+    assert not travel_flow.is_travel_candidate("thanks")
+    assert travel_flow.is_travel_candidate("bus to jb")
+    assert travel_flow.is_travel_candidate("what should I bring along")
+
+
+def test_prefetched_empty_result_skips_retrieval(monkeypatch):
+    monkeypatch.setattr(travel_flow.genai, "embed_content", pytest.fail)
+    assert travel_flow.handle_travel_query("how do I get to the clinic", ExplodingClient(), matching_faqs=[]) is None
+
+
+def test_retrieval_never_raises(monkeypatch):
+    def boom(**kwargs):
+        raise RuntimeError("quota")
+
+    monkeypatch.setattr(travel_flow.genai, "embed_content", boom)
+    assert travel_flow.retrieve_travel_faqs("bus to jb", ExplodingClient()) is None
+    monkeypatch.setattr(travel_flow.genai, "embed_content", lambda **kwargs: {"embedding": [0.0]})
+    assert travel_flow.retrieve_travel_faqs("bus to jb", ExplodingClient()) is None
+
+
+def test_generation_failure_degrades_to_the_top_faq_answer(monkeypatch):
+    class StalledModel:
+        def generate_content(self, prompt, **kwargs):
+            raise TimeoutError("deadline")
+
+    monkeypatch.setattr(travel_flow, "generation_model", StalledModel())
+    faqs = [{"question": "How do I get to JB?", "answer": "Take bus 170 from Queen Street: https://example.com/170"}]
+    degraded_before = travel_flow.answer_tier_stats()["degraded"]["hits"]
+    result = travel_flow.handle_travel_query("how do I get to JB", ExplodingClient(), matching_faqs=faqs)
+    assert result["response"] == faqs[0]["answer"]
+    assert travel_flow.answer_tier_stats()["degraded"]["hits"] == degraded_before + 1
+    assert result["meta"]["travel"]["status"] == "degraded"
+    assert result["meta"]["travel"]["data"]["links"] == [{"url": "https://example.com/170"}]
+
+
+class RecordingModel:
+    def __init__(self, name):
+        self.name, self.calls = name, 0
+
+    def generate_content(self, prompt, **kwargs):
+        self.calls += 1
+        return type("R", (), {"text": f"{self.name} answer"})()
+
+
+@pytest.mark.parametrize("similarity, tier", [(0.95, "direct"), (0.8, "flash"), (0.6, "pro"), (None, "pro")])
+def test_answer_tier_by_top_similarity(monkeypatch, similarity, tier):
+    pro, flash = RecordingModel("pro"), RecordingModel("flash")
+    monkeypatch.setattr(travel_flow, "generation_model", pro)
+    monkeypatch.setattr(travel_flow, "fast_generation_model", flash)
+    before = travel_flow.answer_tier_stats()[tier]["hits"]
+    faqs = [{"question": "Bus to JB?", "answer": "Take CW1 from Kranji.", "similarity": similarity}]
+
+    result = travel_flow.handle_travel_query("which bus goes to jb", ExplodingClient(), matching_faqs=faqs)
+
+    expected = {"direct": "Take CW1 from Kranji.", "flash": "flash answer", "pro": "pro answer"}[tier]
+    assert result["response"] == expected
+    assert result["meta"]["travel"]["answer_tier"] == tier
+    assert (pro.calls, flash.calls) == {"direct": (0, 0), "flash": (0, 1), "pro": (1, 0)}[tier]
+    assert travel_flow.answer_tier_stats()[tier]["hits"] == before + 1